@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AccionesUsuarioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'acciones_usuario'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:41
+
+from django.db import migrations, models
+
+
+def eliminar_duplicados(apps, schema_editor):
+    """
+    Conserva la acción más reciente de cada (usuario, libro) y le pasa lo que solo tenían
+    las demás: favorito y pendiente si alguna los marcaba, y la calificación y la última
+    página más recientes que no estén vacías.
+    """
+    Acciones_usuario = apps.get_model('acciones_usuario', 'Acciones_usuario')
+    filas = (
+        Acciones_usuario.objects
+        .order_by('usuario_id', 'libro_id', '-updated_at', '-id')
+        .values_list(
+            'id', 'usuario_id', 'libro_id', 'es_favorito', 'pendiente_leer',
+            'calificacion', 'ultima_pagina_leida_id',
+        )
+        .iterator(chunk_size=5000)
+    )
+    conservadas = {}
+    fusionadas = {}
+    duplicadas = []
+    for accion_id, usuario_id, libro_id, favorito, pendiente, calificacion, pagina_id in filas:
+        clave = (usuario_id, libro_id)
+        if clave not in conservadas:
+            conservadas[clave] = [accion_id, favorito, pendiente, calificacion, pagina_id]
+            continue
+        duplicadas.append(accion_id)
+        actual = conservadas[clave]
+        fusion = [
+            actual[0],
+            actual[1] or favorito,
+            actual[2] or pendiente,
+            actual[3] or calificacion,
+            actual[4] or pagina_id,
+        ]
+        if fusion != actual:
+            conservadas[clave] = fusionadas[clave] = fusion
+
+    Acciones_usuario.objects.bulk_update(
+        [
+            Acciones_usuario(
+                id=accion_id, es_favorito=favorito, pendiente_leer=pendiente,
+                calificacion=calificacion, ultima_pagina_leida_id=pagina_id,
+            )
+            for accion_id, favorito, pendiente, calificacion, pagina_id in fusionadas.values()
+        ],
+        ['es_favorito', 'pendiente_leer', 'calificacion', 'ultima_pagina_leida_id'],
+        batch_size=500,
+    )
+    for inicio in range(0, len(duplicadas), 500):
+        Acciones_usuario.objects.filter(id__in=duplicadas[inicio:inicio + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acciones_usuario', '0002_alter_acciones_usuario_ultima_pagina_leida'),
+        ('libro', '0008_estadistica_libro'),
+        ('pagina', '0001_initial'),
+        ('usuario', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_duplicados, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='acciones_usuario',
+            index=models.Index(fields=['usuario', '-updated_at'], name='acciones_usuario_recientes_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='acciones_usuario',
+            constraint=models.UniqueConstraint(fields=('usuario', 'libro'), name='acciones_usuario_usuario_libro_uniq'),
+        ),
+    ]
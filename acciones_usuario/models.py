@@ -1,6 +1,15 @@
 from django.db import models
 from base.models import Base
 
+class AccionesQuerySet(models.QuerySet):
+   def de_libros_vigentes(self):
+      """
+      Sin las acciones sobre libros eliminados que aún no se han purgado. Hace join con
+      libro, así que solo se usa donde se llega a la acción sin pasar por su libro.
+      """
+      return self.filter(libro__eliminado_en__isnull=True)
+
+
 class Acciones_usuario(Base):
    usuario=models.ForeignKey("usuario.Usuario", on_delete=models.CASCADE)
    libro=models.ForeignKey("libro.Libro", on_delete=models.CASCADE)
@@ -8,6 +17,31 @@ class Acciones_usuario(Base):
    ultima_pagina_leida=models.ForeignKey("pagina.Pagina", on_delete=models.SET_NULL, null=True, blank=True, related_name='acciones_usuario')
    pendiente_leer=models.BooleanField(default=False)
    calificacion=models.IntegerField(default=0)
+
+   objects = AccionesQuerySet.as_manager()
+   todos = models.Manager()
+
+   class Meta:
+      constraints = [
+         models.UniqueConstraint(fields=['usuario', 'libro'], name='acciones_usuario_usuario_libro_uniq'),
+      ]
+      indexes = [
+         models.Index(fields=['usuario', '-updated_at'], name='acciones_usuario_recientes_idx'),
+      ]
+
+   @classmethod
+   def from_db(cls, db, field_names, values):
+      # Guarda los valores leídos para que las señales sepan qué cambió al guardar
+      instancia = super().from_db(db, field_names, values)
+      instancia._estado_original = instancia.estado_ranking()
+      return instancia
+
+   def estado_ranking(self):
+      return (
+         self.__dict__.get('es_favorito'),
+         self.__dict__.get('calificacion'),
+         self.__dict__.get('ultima_pagina_leida_id'),
+      )
    
 
 
@@ -0,0 +1,149 @@
+"""
+Buffer de escritura diferida para el progreso de lectura.
+
+Cada cambio de página solo guarda en memoria la última página por (usuario, libro);
+un hilo en segundo plano vuelca el buffer a la base de datos por lotes cada
+PROGRESO_INTERVALO_MS. Las lecturas del mismo usuario en este proceso llaman antes
+a asegurar_lectura(), que vuelca sus cambios pendientes para ver sus propias escrituras.
+Al terminar el proceso se vuelca lo que quede (atexit).
+"""
+import atexit
+import logging
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from pagina.models import Pagina
+from .upsert import upsert_acciones
+
+
+logger = logging.getLogger(__name__)
+
+
+def escribir_progreso(cambios):
+    """
+    Escribe un lote {(usuario_id, libro_id): pagina_id} con un upsert por cada bloque de filas.
+    Descarta las páginas que no pertenecen al libro indicado y los libros que el usuario ya
+    no puede ver (ocultos o eliminados desde que se registró). Devuelve el número de filas escritas.
+    """
+    if not cambios:
+        return 0
+    libro_de_pagina = {
+        pagina_id: (libro_id, dueno_id, es_publico)
+        for pagina_id, libro_id, dueno_id, es_publico in Pagina.objects.de_libros_vigentes().filter(
+            id__in={p for p in cambios.values()}
+        ).values_list("id", "libro_id", "libro__usuario_id", "libro__es_publico")
+    }
+
+    def valido(usuario_id, libro_id, pagina_id):
+        pagina_libro_id, dueno_id, es_publico = libro_de_pagina.get(pagina_id, (None, None, False))
+        return pagina_libro_id == libro_id and (es_publico or dueno_id == usuario_id)
+
+    cambios = {clave: pagina_id for clave, pagina_id in cambios.items() if valido(*clave, pagina_id)}
+    if not cambios:
+        return 0
+
+    upsert_acciones(
+        [
+            {"usuario_id": usuario_id, "libro_id": libro_id, "ultima_pagina_leida_id": pagina_id}
+            for (usuario_id, libro_id), pagina_id in cambios.items()
+        ],
+        campos=("ultima_pagina_leida_id",),
+    )
+    return len(cambios)
+
+
+class BufferProgreso:
+    def __init__(self, intervalo_ms, max_lote):
+        self.intervalo = intervalo_ms / 1000
+        self.max_lote = max_lote
+        self._pendientes = {}
+        self._usuarios = set()
+        self._lock = threading.Lock()
+        # Serializa las escrituras: quien lo obtiene sabe que no hay un lote a medio escribir
+        self._lock_escritura = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+
+    def registrar(self, usuario_id, libro_id, pagina_id):
+        with self._lock:
+            self._pendientes[(usuario_id, libro_id)] = pagina_id
+            self._usuarios.add(usuario_id)
+            lleno = len(self._pendientes) >= self.max_lote
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name="buffer-progreso", daemon=True)
+                self._hilo.start()
+        if lleno:
+            self._despertar.set()
+
+    def _extraer(self, usuario_id=None):
+        with self._lock:
+            if usuario_id is None:
+                lote, self._pendientes, self._usuarios = self._pendientes, {}, set()
+            else:
+                lote = {k: v for k, v in self._pendientes.items() if k[0] == usuario_id}
+                for clave in lote:
+                    del self._pendientes[clave]
+                self._usuarios.discard(usuario_id)
+            return lote
+
+    def _devolver(self, lote):
+        """Reencola un lote fallido sin pisar cambios más recientes"""
+        with self._lock:
+            for (usuario_id, libro_id), pagina_id in lote.items():
+                if (usuario_id, libro_id) not in self._pendientes:
+                    self._pendientes[(usuario_id, libro_id)] = pagina_id
+                    self._usuarios.add(usuario_id)
+
+    def vaciar(self, usuario_id=None):
+        with self._lock_escritura:
+            lote = self._extraer(usuario_id)
+            if not lote:
+                return 0
+            try:
+                return escribir_progreso(lote)
+            except Exception:
+                logger.exception("Error al volcar el buffer de progreso")
+                self._devolver(lote)
+                return 0
+
+    def asegurar_lectura(self, usuario_id):
+        """Vuelca los cambios pendientes del usuario antes de que lea su propio progreso"""
+        if usuario_id in self._usuarios:
+            self.vaciar(usuario_id)
+        elif self._lock_escritura.locked():
+            # Puede haber un lote con sus cambios escribiéndose ahora mismo
+            with self._lock_escritura:
+                pass
+
+    def _bucle(self):
+        while True:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            close_old_connections()
+            self.vaciar()
+            close_old_connections()
+
+
+buffer_progreso = BufferProgreso(settings.PROGRESO_INTERVALO_MS, settings.PROGRESO_MAX_LOTE)
+atexit.register(buffer_progreso.vaciar)
+
+
+def registrar_progreso(usuario_id, libro_id, pagina_id):
+    if settings.PROGRESO_BUFFER_ACTIVO:
+        buffer_progreso.registrar(usuario_id, libro_id, pagina_id)
+    else:
+        escribir_progreso({(usuario_id, libro_id): pagina_id})
+
+
+def progreso_al_dia(func):
+    """Decorador para vistas que leen el progreso del usuario autenticado"""
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        auth = getattr(request, 'auth', None)
+        if auth and auth.get('uid'):
+            buffer_progreso.asegurar_lectura(auth['uid'])
+        return func(request, *args, **kwargs)
+    return wrapper
@@ -1,13 +1,21 @@
 from typing import List, Optional
+from django.conf import settings
+from django.db.models import Count, Exists, Max, OuterRef, Q, Value
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse
+from django.db import IntegrityError, transaction
 from ninja import Router
 
 from .models import Acciones_usuario
 from libro.models import Libro
 from pagina.models import Pagina
 from usuario.auth import token_auth
-from .schemas import AccionUsuarioIn, AccionUsuarioUpdate, AccionUsuarioOut
+from .schemas import (
+    AccionUsuarioIn, AccionUsuarioUpdate, AccionUsuarioOut, AccionLoteIn, AccionLoteResultado,
+    ProgresoIn, ProgresoOut,
+)
+from .progreso import progreso_al_dia, registrar_progreso
+from .upsert import upsert_acciones
 
 
 router = Router(tags=["acciones_usuario"])
@@ -18,16 +26,37 @@ def obtener_numero_pagina(libro_id: int, pagina_id: int) -> Optional[int]:
     if not pagina_id:
         return None
     
-    paginas = list(Pagina.objects.filter(libro_id=libro_id).order_by('id').values_list('id', flat=True))
-    
-    try:
-        # El número de página es 1-indexed
-        return paginas.index(pagina_id) + 1
-    except ValueError:
-        return None
+    # El número de página (1-indexed) es cuántas páginas del libro tienen id <= pagina_id;
+    # se cuenta en la base de datos recorriendo solo ese tramo del índice, y la página es
+    # del libro si es la mayor de ese tramo
+    resultado = Pagina.objects.filter(libro_id=libro_id, id__lte=pagina_id).aggregate(
+        posicion=Count('id'), ultima=Max('id'),
+    )
+    return resultado['posicion'] if resultado['ultima'] == pagina_id else None
+
+
+def comprobar_libro(usuario_id: int, libro_id: int, pagina_id: Optional[int] = None):
+    """
+    Comprueba en una consulta que el libro es visible para el usuario y, si se indica,
+    que la página es suya. Devuelve (nombre del libro, None) o (None, respuesta de error).
+    """
+    libro = Libro.objects.filter(Q(es_publico=True) | Q(usuario_id=usuario_id), id=libro_id)
+    if pagina_id is not None:
+        libro = libro.annotate(pagina_valida=Exists(
+            Pagina.objects.filter(id=pagina_id, libro_id=OuterRef("id"))
+        ))
+    else:
+        libro = libro.annotate(pagina_valida=Value(True))
+    fila = libro.values_list("nombre", "pagina_valida").first()
+    if fila is None:
+        return None, HttpResponse("Libro no encontrado", status=404)
+    if not fila[1]:
+        return None, HttpResponse("La página no pertenece al libro", status=400)
+    return fila[0], None
 
 
 @router.get("/", response=List[AccionUsuarioOut], auth=token_auth)
+@progreso_al_dia
 def list_acciones_usuario(request):
     """Obtiene todas las acciones del usuario autenticado"""
     usuario_id = request.auth.get('uid')
@@ -35,7 +64,7 @@ def list_acciones_usuario(request):
         return HttpResponse("No autenticado", status=401)
     
     acciones = (
-        Acciones_usuario.objects
+        Acciones_usuario.objects.de_libros_vigentes()
         .select_related("libro")
         .filter(usuario_id=usuario_id)
         .order_by("-updated_at")
@@ -62,6 +91,7 @@ def list_acciones_usuario(request):
 
 
 @router.get("/libro/{libro_id}", response=AccionUsuarioOut, auth=token_auth)
+@progreso_al_dia
 def get_accion_by_libro(request, libro_id: int):
     """Obtiene la acción del usuario para un libro específico"""
     usuario_id = request.auth.get('uid')
@@ -72,7 +102,7 @@ def get_accion_by_libro(request, libro_id: int):
     get_object_or_404(Libro, id=libro_id)
     
     accion = get_object_or_404(
-        Acciones_usuario.objects.select_related("libro"),
+        Acciones_usuario.objects.de_libros_vigentes().select_related("libro"),
         usuario_id=usuario_id,
         libro_id=libro_id
     )
@@ -93,35 +123,39 @@ def get_accion_by_libro(request, libro_id: int):
 
 
 @router.post("/", response=AccionUsuarioOut, auth=token_auth)
+@progreso_al_dia
 def create_accion_usuario(request, payload: AccionUsuarioIn):
     """Crea una nueva acción de usuario para un libro"""
     usuario_id = request.auth.get('uid')
     if not usuario_id:
         return HttpResponse("No autenticado", status=401)
     
-    # Verificar que el libro existe
-    libro = get_object_or_404(Libro, id=payload.libro_id)
+    libro_nombre, error = comprobar_libro(usuario_id, payload.libro_id, payload.ultima_pagina_leida_id)
+    if error:
+        return error
     
-    # Verificar si ya existe una acción para este usuario y libro
-    if Acciones_usuario.objects.filter(usuario_id=usuario_id, libro_id=payload.libro_id).exists():
-        return HttpResponse("Ya existe una acción para este libro", status=400)
-    
-    accion = Acciones_usuario.objects.create(
-        usuario_id=usuario_id,
-        libro_id=payload.libro_id,
-        es_favorito=payload.es_favorito,
-        ultima_pagina_leida_id=payload.ultima_pagina_leida_id,
-        pendiente_leer=payload.pendiente_leer,
-        calificacion=payload.calificacion,
-    )
-    
-    accion.refresh_from_db()
+    # La restricción única (usuario, libro) detecta el duplicado sin una consulta previa;
+    # solo si falla se mira si fue por eso o porque el libro o la página desaparecieron
+    try:
+        with transaction.atomic():
+            accion = Acciones_usuario.objects.create(
+                usuario_id=usuario_id,
+                libro_id=payload.libro_id,
+                es_favorito=payload.es_favorito,
+                ultima_pagina_leida_id=payload.ultima_pagina_leida_id,
+                pendiente_leer=payload.pendiente_leer,
+                calificacion=payload.calificacion,
+            )
+    except IntegrityError:
+        if Acciones_usuario.todos.filter(usuario_id=usuario_id, libro_id=payload.libro_id).exists():
+            return HttpResponse("Ya existe una acción para este libro", status=400)
+        return HttpResponse("El libro o la página no existen", status=404)
     
     return AccionUsuarioOut(
         id=accion.id,
         usuario_id=accion.usuario_id,
         libro_id=accion.libro_id,
-        libro_nombre=libro.nombre,
+        libro_nombre=libro_nombre,
         es_favorito=accion.es_favorito,
         ultima_pagina_leida=obtener_numero_pagina(accion.libro_id, accion.ultima_pagina_leida_id) if accion.ultima_pagina_leida_id else None,
         ultima_pagina_leida_id=accion.ultima_pagina_leida_id,
@@ -132,32 +166,26 @@ def create_accion_usuario(request, payload: AccionUsuarioIn):
     )
 
 @router.put("/libro/{libro_id}", response=AccionUsuarioOut, auth=token_auth)
+@progreso_al_dia
 def update_accion_by_libro(request, libro_id: int, payload: AccionUsuarioUpdate):
     """Actualiza la acción del usuario para un libro específico"""
     usuario_id = request.auth.get('uid')
     if not usuario_id:
         return HttpResponse("No autenticado", status=401)
     
-    # Verificar que el libro existe
-    libro = get_object_or_404(Libro, id=libro_id)
-    
+    # La acción y su libro en una sola consulta (sin libro no puede existir la acción)
     accion = get_object_or_404(
-        Acciones_usuario,
+        Acciones_usuario.objects.de_libros_vigentes().select_related("libro"),
         usuario_id=usuario_id,
         libro_id=libro_id
     )
+    libro = accion.libro
     
-    # Actualizar solo los campos proporcionados
-    if payload.es_favorito is not None:
-        accion.es_favorito = payload.es_favorito
-    if payload.ultima_pagina_leida_id is not None:
-        accion.ultima_pagina_leida_id = payload.ultima_pagina_leida_id
-    if payload.pendiente_leer is not None:
-        accion.pendiente_leer = payload.pendiente_leer
-    if payload.calificacion is not None:
-        accion.calificacion = payload.calificacion
-    
-    accion.save()
+    # Actualizar solo los campos proporcionados, y escribir solo esas columnas
+    cambios = {campo: valor for campo, valor in payload.dict().items() if valor is not None}
+    for campo, valor in cambios.items():
+        setattr(accion, campo, valor)
+    accion.save(update_fields=[campo.removesuffix("_id") for campo in cambios] + ["updated_at"])
     
     return AccionUsuarioOut(
         id=accion.id,
@@ -174,17 +202,127 @@ def update_accion_by_libro(request, libro_id: int, payload: AccionUsuarioUpdate)
     )
 
 
+@router.patch("/libro/{libro_id}", response=AccionUsuarioOut, auth=token_auth)
+@progreso_al_dia
+def upsert_accion_by_libro(request, libro_id: int, payload: AccionUsuarioUpdate):
+    """Crea o actualiza la acción del usuario para un libro en una sola sentencia (INSERT ... ON CONFLICT)"""
+    usuario_id = request.auth.get('uid')
+    if not usuario_id:
+        return HttpResponse("No autenticado", status=401)
+    
+    campos = {campo: valor for campo, valor in payload.dict(exclude_unset=True).items() if valor is not None}
+    if not campos:
+        return HttpResponse("No hay campos para actualizar", status=400)
+    
+    _, error = comprobar_libro(usuario_id, libro_id, campos.get("ultima_pagina_leida_id"))
+    if error:
+        return error
+    
+    try:
+        filas = upsert_acciones(
+            [{"usuario_id": usuario_id, "libro_id": libro_id, **campos}],
+            campos,
+            con_detalle=True,
+        )
+    except IntegrityError:
+        return HttpResponse("El libro o la página no existen", status=404)
+    
+    return AccionUsuarioOut(**filas[(usuario_id, libro_id)])
+
+
+@router.post("/batch", response=List[AccionLoteResultado], auth=token_auth)
+@progreso_al_dia
+def batch_acciones_usuario(request, payload: List[AccionLoteIn]):
+    """
+    Aplica una lista de cambios por libro (favorito, pendiente, calificación, progreso)
+    en una transacción: visibilidad y páginas se validan con una consulta cada una
+    y los cambios se escriben con upserts agrupados. Devuelve un resultado por elemento.
+    """
+    usuario_id = request.auth.get('uid')
+    if not usuario_id:
+        return HttpResponse("No autenticado", status=401)
+    
+    if len(payload) > settings.ACCIONES_LOTE_MAX:
+        return HttpResponse(f"Máximo {settings.ACCIONES_LOTE_MAX} cambios por lote", status=400)
+    
+    libros_visibles = set(
+        Libro.objects.filter(id__in={op.libro_id for op in payload})
+        .filter(Q(es_publico=True) | Q(usuario_id=usuario_id))
+        .values_list("id", flat=True)
+    )
+    paginas_pedidas = {op.ultima_pagina_leida_id for op in payload if op.ultima_pagina_leida_id is not None}
+    libro_de_pagina = dict(
+        Pagina.objects.filter(id__in=paginas_pedidas).values_list("id", "libro_id")
+    ) if paginas_pedidas else {}
+    
+    errores = {}
+    cambios = {}
+    for indice, op in enumerate(payload):
+        campos = {campo: valor for campo, valor in op.dict(exclude={"libro_id"}).items() if valor is not None}
+        if op.libro_id not in libros_visibles:
+            errores[indice] = "libro_no_encontrado"
+        elif "ultima_pagina_leida_id" in campos and libro_de_pagina.get(campos["ultima_pagina_leida_id"]) != op.libro_id:
+            errores[indice] = "pagina_invalida"
+        elif not campos:
+            errores[indice] = "sin_cambios"
+        else:
+            # Los cambios sucesivos sobre el mismo libro se fusionan; gana el último
+            cambios.setdefault(op.libro_id, {}).update(campos)
+    
+    # Un upsert por cada combinación distinta de campos (normalmente muy pocas)
+    grupos = {}
+    for libro_id, campos in cambios.items():
+        grupos.setdefault(tuple(sorted(campos)), []).append(
+            {"usuario_id": usuario_id, "libro_id": libro_id, **campos}
+        )
+    filas = {}
+    with transaction.atomic():
+        for campos, grupo in grupos.items():
+            filas.update(upsert_acciones(grupo, campos, con_detalle=True))
+    
+    return [
+        AccionLoteResultado(
+            indice=indice,
+            libro_id=op.libro_id,
+            ok=indice not in errores,
+            error=errores.get(indice),
+            accion=(AccionUsuarioOut(**filas[(usuario_id, op.libro_id)]) if indice not in errores else None),
+        )
+        for indice, op in enumerate(payload)
+    ]
+
+
+@router.put("/libro/{libro_id}/progreso", response={202: ProgresoOut}, auth=token_auth)
+def update_progreso(request, libro_id: int, payload: ProgresoIn):
+    """
+    Registra la página actual del usuario en un libro sin escribir en la base de datos:
+    solo se comprueba con una consulta que el libro es visible y la página es suya, y
+    el cambio se vuelca por lotes en segundo plano (ver acciones_usuario/progreso.py)
+    """
+    usuario_id = request.auth.get('uid')
+    if not usuario_id:
+        return HttpResponse("No autenticado", status=401)
+    
+    _, error = comprobar_libro(usuario_id, libro_id, payload.pagina_id)
+    if error:
+        return error
+    
+    registrar_progreso(usuario_id, libro_id, payload.pagina_id)
+    return 202, ProgresoOut(libro_id=libro_id, ultima_pagina_leida_id=payload.pagina_id)
+
+
 @router.delete("/{accion_id}", auth=token_auth)
+@progreso_al_dia
 def delete_accion_usuario(request, accion_id: int):
     """Elimina una acción de usuario"""
     usuario_id = request.auth.get('uid')
     if not usuario_id:
         return HttpResponse("No autenticado", status=401)
     
-    accion = get_object_or_404(Acciones_usuario, id=accion_id)
-    
-    # Verificar que el usuario es propietario de la acción
-    if accion.usuario_id != usuario_id:
+    # La propiedad se comprueba en la misma consulta que carga la acción
+    accion = Acciones_usuario.objects.de_libros_vigentes().filter(id=accion_id, usuario_id=usuario_id).first()
+    if accion is None:
+        get_object_or_404(Acciones_usuario.objects.de_libros_vigentes().only("id"), id=accion_id)
         return HttpResponse("No tienes permisos para realizar esta acción", status=403)
     
     accion.delete()
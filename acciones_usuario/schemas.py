@@ -30,3 +30,28 @@ class AccionUsuarioOut(Schema):
     calificacion: int
     created_at: datetime
     updated_at: datetime
+
+
+class ProgresoIn(Schema):
+    pagina_id: int
+
+
+class ProgresoOut(Schema):
+    libro_id: int
+    ultima_pagina_leida_id: int
+
+
+class AccionLoteIn(Schema):
+    libro_id: int
+    es_favorito: Optional[bool] = None
+    ultima_pagina_leida_id: Optional[int] = None
+    pendiente_leer: Optional[bool] = None
+    calificacion: Optional[int] = None
+
+
+class AccionLoteResultado(Schema):
+    indice: int
+    libro_id: int
+    ok: bool
+    error: Optional[str] = None
+    accion: Optional[AccionUsuarioOut] = None
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from libro.rankings import eventos_por_cambio, registrar_eventos
+from .models import Acciones_usuario
+
+
+@receiver(post_save, sender=Acciones_usuario)
+def actualizar_rankings_al_guardar(sender, instance, created, **kwargs):
+    antes = None if created else getattr(instance, '_estado_original', None)
+    despues = instance.estado_ranking()
+    registrar_eventos([eventos_por_cambio(instance.libro_id, antes, despues)])
+    instance._estado_original = despues
+
+
+@receiver(post_delete, sender=Acciones_usuario)
+def actualizar_rankings_al_borrar(sender, instance, **kwargs):
+    antes = getattr(instance, '_estado_original', instance.estado_ranking())
+    registrar_eventos([eventos_por_cambio(instance.libro_id, antes, None)])
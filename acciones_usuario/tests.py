@@ -1,3 +1,74 @@
+from django.core import signing
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Acciones_usuario
+from genero_libro.models import Genero_libro
+from libro.models import Libro
+from pagina.models import Pagina
+from usuario.models import Usuario
+
+
+class AccionesUsuarioTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lector = Usuario.objects.create(nombre_completo="Lector", email="lector@example.com", contraseña="clave")
+        cls.autor = Usuario.objects.create(nombre_completo="Autor", email="autor@example.com", contraseña="clave")
+        genero = Genero_libro.objects.create(genero="Novela")
+        datos = {"version": 1, "genero": genero, "color_portada": "azul", "usuario": cls.autor}
+        cls.publico = Libro.objects.create(nombre="Público", es_publico=True, **datos)
+        cls.otro = Libro.objects.create(nombre="Otro", es_publico=True, **datos)
+        cls.privado = Libro.objects.create(nombre="Privado", es_publico=False, **datos)
+        cls.pagina = Pagina.objects.create(libro=cls.publico, tipo="texto", titulo="1", contenido="a")
+        cls.pagina_otro = Pagina.objects.create(libro=cls.otro, tipo="texto", titulo="1", contenido="b")
+
+    def peticion(self, metodo, ruta, datos):
+        token = signing.dumps({"uid": self.lector.id, "email": self.lector.email}, salt="usuario.auth")
+        return getattr(self.client, metodo)(
+            ruta, datos, content_type="application/json", HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+
+    def test_crear_duplicada_responde_400(self):
+        respuesta = self.peticion("post", "/acciones_usuario/", {"libro_id": self.publico.id, "es_favorito": True})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()["libro_nombre"], "Público")
+
+        respuesta = self.peticion("post", "/acciones_usuario/", {"libro_id": self.publico.id})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.content.decode(), "Ya existe una acción para este libro")
+        self.assertEqual(Acciones_usuario.objects.filter(usuario=self.lector).count(), 1)
+
+    def test_crear_con_pagina_de_otro_libro_responde_400(self):
+        respuesta = self.peticion("post", "/acciones_usuario/", {
+            "libro_id": self.publico.id, "ultima_pagina_leida_id": self.pagina_otro.id,
+        })
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(Acciones_usuario.objects.exists())
+
+    def test_crear_en_libro_privado_ajeno_responde_404(self):
+        respuesta = self.peticion("post", "/acciones_usuario/", {"libro_id": self.privado.id})
+        self.assertEqual(respuesta.status_code, 404)
+        self.assertFalse(Acciones_usuario.objects.exists())
+
+    def test_upsert_crea_y_luego_actualiza(self):
+        ruta = f"/acciones_usuario/libro/{self.publico.id}"
+        respuesta = self.peticion("patch", ruta, {"es_favorito": True})
+        self.assertEqual(respuesta.status_code, 200)
+        creada = respuesta.json()
+
+        respuesta = self.peticion("patch", ruta, {"ultima_pagina_leida_id": self.pagina.id, "calificacion": 4})
+        self.assertEqual(respuesta.status_code, 200)
+        actualizada = respuesta.json()
+        self.assertEqual(actualizada["id"], creada["id"])
+        self.assertTrue(actualizada["es_favorito"])
+        self.assertEqual(actualizada["ultima_pagina_leida"], 1)
+        self.assertEqual(actualizada["calificacion"], 4)
+        self.assertEqual(Acciones_usuario.objects.filter(usuario=self.lector).count(), 1)
+
+    def test_upsert_valida_libro_y_pagina(self):
+        respuesta = self.peticion("patch", f"/acciones_usuario/libro/{self.privado.id}", {"es_favorito": True})
+        self.assertEqual(respuesta.status_code, 404)
+        respuesta = self.peticion("patch", f"/acciones_usuario/libro/{self.publico.id}", {
+            "ultima_pagina_leida_id": self.pagina_otro.id,
+        })
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(Acciones_usuario.objects.exists())
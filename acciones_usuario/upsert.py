@@ -0,0 +1,160 @@
+"""
+Upsert de Acciones_usuario en una sola sentencia INSERT ... ON CONFLICT DO UPDATE ... RETURNING.
+
+La misma sintaxis funciona en PostgreSQL y en SQLite >= 3.35. Solo se sobrescriben
+los campos indicados; el resto conserva su valor (o el valor por defecto si la fila
+es nueva). Como la sentencia no dispara señales, aquí se registran también los
+eventos de ranking y se publican los cambios para /sync/eventos.
+"""
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from libro.models import Libro
+from libro.rankings import eventos_por_cambio, registrar_eventos
+from pagina.models import Pagina
+from sincronizacion.eventos import publicar_accion
+from .models import Acciones_usuario
+
+
+CAMPOS = ("es_favorito", "ultima_pagina_leida_id", "pendiente_leer", "calificacion")
+VALORES_POR_DEFECTO = {"es_favorito": False, "ultima_pagina_leida_id": None, "pendiente_leer": False, "calificacion": 0}
+COLUMNAS_RETORNO = ("id", "usuario_id", "libro_id") + CAMPOS + ("created_at", "updated_at")
+FILAS_POR_SENTENCIA = 100
+
+
+def _fecha(valor):
+    if isinstance(valor, str):
+        valor = parse_datetime(valor)
+    if settings.USE_TZ and valor is not None and timezone.is_naive(valor):
+        valor = valor.replace(tzinfo=dt_timezone.utc)
+    return valor
+
+
+def _sql_upsert(num_filas, campos, con_detalle):
+    q = connection.ops.quote_name
+    tabla = q(Acciones_usuario._meta.db_table)
+    columnas = ("usuario_id", "libro_id") + CAMPOS + ("created_at", "updated_at")
+    fila = "(" + ", ".join(["%s"] * len(columnas)) + ")"
+    asignaciones = ", ".join(f"{q(c)} = excluded.{q(c)}" for c in tuple(campos) + ("updated_at",))
+    retorno = [f"{tabla}.{q(c)}" for c in COLUMNAS_RETORNO]
+    if con_detalle:
+        libros = q(Libro._meta.db_table)
+        paginas = q(Pagina._meta.db_table)
+        # Nombre del libro y número (1-indexed) de la última página leída, calculados en la misma sentencia
+        retorno.append(f"(SELECT l.{q('nombre')} FROM {libros} l WHERE l.{q('id')} = {tabla}.{q('libro_id')})")
+        retorno.append(
+            f"(SELECT COUNT(*) FROM {paginas} p WHERE p.{q('libro_id')} = {tabla}.{q('libro_id')}"
+            f" AND p.{q('id')} <= {tabla}.{q('ultima_pagina_leida_id')}"
+            f" AND EXISTS (SELECT 1 FROM {paginas} u WHERE u.{q('id')} = {tabla}.{q('ultima_pagina_leida_id')}"
+            f" AND u.{q('libro_id')} = {tabla}.{q('libro_id')}))"
+        )
+    return (
+        f"INSERT INTO {tabla} ({', '.join(q(c) for c in columnas)}) VALUES {', '.join([fila] * num_filas)} "
+        f"ON CONFLICT ({q('usuario_id')}, {q('libro_id')}) DO UPDATE SET {asignaciones} "
+        f"RETURNING {', '.join(retorno)}"
+    )
+
+
+def _sql_reservar(num_filas):
+    """Crea con los valores por defecto las filas que falten, sin tocar las existentes"""
+    q = connection.ops.quote_name
+    tabla = q(Acciones_usuario._meta.db_table)
+    columnas = ("usuario_id", "libro_id") + CAMPOS + ("created_at", "updated_at")
+    fila = "(" + ", ".join(["%s"] * len(columnas)) + ")"
+    return (
+        f"INSERT INTO {tabla} ({', '.join(q(c) for c in columnas)}) VALUES {', '.join([fila] * num_filas)} "
+        f"ON CONFLICT ({q('usuario_id')}, {q('libro_id')}) DO NOTHING "
+        f"RETURNING {tabla}.{q('usuario_id')}, {tabla}.{q('libro_id')}"
+    )
+
+
+def _bloquear_anteriores(claves, fecha_db):
+    """
+    Estado anterior (es_favorito, calificacion, ultima_pagina_leida_id) de cada clave, con
+    sus filas bloqueadas hasta el final de la transacción; None para las que crea esta
+    escritura. Así dos escrituras simultáneas de la misma fila no cuentan dos veces el
+    mismo cambio en el ranking. Debe llamarse dentro de transaction.atomic().
+    """
+    def leer(claves):
+        return {
+            (u, l): (f, c, p)
+            for u, l, f, c, p in Acciones_usuario.todos.select_for_update().filter(
+                usuario_id__in={u for u, _ in claves}, libro_id__in={l for _, l in claves},
+            ).values_list("usuario_id", "libro_id", "es_favorito", "calificacion", "ultima_pagina_leida_id")
+            if (u, l) in claves
+        }
+
+    anteriores = leer(set(claves))
+    faltan = [clave for clave in claves if clave not in anteriores]
+    creadas = set()
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(faltan), FILAS_POR_SENTENCIA):
+            lote = faltan[inicio:inicio + FILAS_POR_SENTENCIA]
+            parametros = []
+            for usuario_id, libro_id in lote:
+                parametros += [usuario_id, libro_id, *(VALORES_POR_DEFECTO[c] for c in CAMPOS), fecha_db, fecha_db]
+            cursor.execute(_sql_reservar(len(lote)), parametros)
+            creadas.update(map(tuple, cursor.fetchall()))
+    # Las que otra transacción creó mientras tanto ya están confirmadas: se leen y bloquean
+    otras = set(faltan) - creadas
+    if otras:
+        anteriores.update(leer(otras))
+    return anteriores
+
+
+def upsert_acciones(filas, campos, con_detalle=False):
+    """
+    filas: lista de dicts con usuario_id, libro_id y los campos a escribir.
+    Devuelve un dict {(usuario_id, libro_id): fila} con los valores finales de cada fila.
+    Con con_detalle cada fila incluye también libro_nombre y ultima_pagina_leida (número).
+    """
+    campos = tuple(c for c in CAMPOS if c in campos)
+    if not filas or not campos:
+        return {}
+    # Una sentencia ON CONFLICT no puede tocar dos veces la misma fila: se fusionan por clave
+    unicas = {}
+    for fila in filas:
+        unicas.setdefault((fila["usuario_id"], fila["libro_id"]), {}).update(fila)
+    filas = list(unicas.values())
+
+    ahora = timezone.now()
+    fecha_db = connection.ops.adapt_datetimefield_value(ahora)
+
+    resultado = {}
+    with transaction.atomic():
+        # Valores anteriores para el ranking: solo cuenta lo que cambia (también la página leída,
+        # para que reenviar la misma página no infle la tendencia)
+        anteriores = _bloquear_anteriores(list(unicas), fecha_db)
+        with connection.cursor() as cursor:
+            for inicio in range(0, len(filas), FILAS_POR_SENTENCIA):
+                lote = filas[inicio:inicio + FILAS_POR_SENTENCIA]
+                parametros = []
+                for fila in lote:
+                    parametros += [fila["usuario_id"], fila["libro_id"]]
+                    parametros += [fila.get(c, VALORES_POR_DEFECTO[c]) if c in campos else VALORES_POR_DEFECTO[c] for c in CAMPOS]
+                    parametros += [fecha_db, fecha_db]
+                cursor.execute(_sql_upsert(len(lote), campos, con_detalle), parametros)
+                for valores in cursor.fetchall():
+                    datos = dict(zip(COLUMNAS_RETORNO, valores))
+                    datos["es_favorito"] = bool(datos["es_favorito"])
+                    datos["pendiente_leer"] = bool(datos["pendiente_leer"])
+                    datos["created_at"] = _fecha(datos["created_at"])
+                    datos["updated_at"] = _fecha(datos["updated_at"])
+                    if con_detalle:
+                        datos["libro_nombre"] = valores[len(COLUMNAS_RETORNO)]
+                        datos["ultima_pagina_leida"] = valores[len(COLUMNAS_RETORNO) + 1] or None
+                    resultado[(datos["usuario_id"], datos["libro_id"])] = datos
+
+        eventos = []
+        for clave, datos in resultado.items():
+            antes = anteriores.get(clave)
+            despues = (datos["es_favorito"], datos["calificacion"], datos["ultima_pagina_leida_id"])
+            eventos.append(eventos_por_cambio(clave[1], antes, despues))
+        registrar_eventos(eventos, momento=ahora)
+        for datos in resultado.values():
+            publicar_accion(datos)
+    return resultado
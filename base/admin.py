@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import TareaEliminacion
 
-# Register your models here.
+
+@admin.register(TareaEliminacion)
+class TareaEliminacionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'modelo', 'objeto_id', 'estado', 'paso', 'borradas', 'total', 'updated_at')
+    list_filter = ('estado', 'modelo')
+    ordering = ('-id',)
@@ -0,0 +1,156 @@
+"""Utilidades compartidas por los comandos de benchmark (bench_*)."""
+import json
+import math
+import statistics
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def base_datos_temporal():
+    """Crea bases de datos de prueba desechables para no tocar los datos reales"""
+    from django.test.utils import setup_databases, teardown_databases
+
+    antiguas = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(antiguas, verbosity=0)
+
+
+def poblar_datos(num_usuarios=20, num_libros=50, paginas_por_libro=200, acciones_por_libro=15):
+    """Inserta un conjunto sintético y determinista de usuarios, libros, páginas y acciones"""
+    from usuario.models import Usuario
+    from genero_libro.models import Genero_libro
+    from libro.models import Libro
+    from pagina.models import Pagina
+    from acciones_usuario.models import Acciones_usuario
+
+    usuarios = Usuario.objects.bulk_create([
+        Usuario(nombre_completo=f"Usuario {i}", email=f"usuario{i}@example.com", contraseña="clave")
+        for i in range(num_usuarios)
+    ])
+    generos = Genero_libro.objects.bulk_create([
+        Genero_libro(genero=f"Género {i}") for i in range(5)
+    ])
+    libros = Libro.objects.bulk_create([
+        Libro(
+            nombre=f"Libro {i}",
+            version=1,
+            genero=generos[i % len(generos)],
+            color_portada="azul",
+            usuario=usuarios[i % num_usuarios],
+            es_publico=i % 7 != 0,
+        )
+        for i in range(num_libros)
+    ])
+    Pagina.objects.bulk_create([
+        Pagina(
+            contenido=f"Contenido de la página {n} del libro {libro.id}\n" * 20,
+            tipo="texto",
+            titulo=f"Página {n}",
+            libro=libro,
+        )
+        for libro in libros
+        for n in range(paginas_por_libro)
+    ], batch_size=1000)
+    Acciones_usuario.objects.bulk_create([
+        Acciones_usuario(
+            usuario=usuarios[(i + j) % num_usuarios],
+            libro=libro,
+            es_favorito=(i + j) % 3 == 0,
+            pendiente_leer=(i + j) % 4 == 0,
+            calificacion=(i * 7 + j) % 6,
+        )
+        for i, libro in enumerate(libros)
+        for j in range(min(acciones_por_libro, num_usuarios))
+    ], batch_size=1000)
+    return usuarios, libros
+
+
+def medir(funcion, rondas=25, iteraciones=200, calentamiento=1):
+    """Devuelve el tiempo medio por llamada (en segundos) de cada ronda"""
+    for _ in range(calentamiento):
+        for _ in range(iteraciones):
+            funcion()
+    muestras = []
+    for _ in range(rondas):
+        inicio = time.perf_counter()
+        for _ in range(iteraciones):
+            funcion()
+        muestras.append((time.perf_counter() - inicio) / iteraciones)
+    return muestras
+
+
+def resumir(muestras):
+    return {
+        "media": statistics.fmean(muestras),
+        "mediana": statistics.median(muestras),
+        "desviacion": statistics.stdev(muestras) if len(muestras) > 1 else 0.0,
+        "minimo": min(muestras),
+        "muestras": muestras,
+    }
+
+
+def mann_whitney(a, b):
+    """Prueba U de Mann-Whitney (aproximación normal); devuelve el valor p de que b > a"""
+    combinadas = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    rangos = [0.0] * len(combinadas)
+    i = 0
+    while i < len(combinadas):
+        j = i
+        while j + 1 < len(combinadas) and combinadas[j + 1][0] == combinadas[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            rangos[k] = (i + j) / 2 + 1
+        i = j + 1
+    n1, n2 = len(a), len(b)
+    suma_b = sum(r for r, (_, grupo) in zip(rangos, combinadas) if grupo == 1)
+    u = suma_b - n2 * (n2 + 1) / 2
+    media = n1 * n2 / 2
+    desviacion = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12)
+    if desviacion == 0:
+        return 1.0
+    z = (u - media) / desviacion
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def comparar(baseline, actual, umbral=0.10, alfa=0.01):
+    """Compara dos resultados y devuelve las filas con el veredicto de cada benchmark"""
+    filas = []
+    for nombre, datos in actual.items():
+        base = baseline.get(nombre)
+        if base is None:
+            filas.append((nombre, None, datos["mediana"], None, None, "nuevo"))
+            continue
+        cambio = datos["mediana"] / base["mediana"] - 1
+        p = mann_whitney(base["muestras"], datos["muestras"])
+        if cambio > umbral and p < alfa:
+            veredicto = "REGRESIÓN"
+        elif cambio < -umbral and 1 - p < alfa:
+            veredicto = "mejora"
+        else:
+            veredicto = "sin cambios"
+        filas.append((nombre, base["mediana"], datos["mediana"], cambio, p, veredicto))
+    return filas
+
+
+def cargar_json(ruta):
+    return json.loads(Path(ruta).read_text(encoding="utf-8"))
+
+
+def guardar_json(ruta, datos):
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    ruta.write_text(json.dumps(datos, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+def formatear_tiempo(segundos):
+    if segundos is None:
+        return "-"
+    if segundos < 1e-3:
+        return f"{segundos * 1e6:.1f} µs"
+    if segundos < 1:
+        return f"{segundos * 1e3:.2f} ms"
+    return f"{segundos:.2f} s"
@@ -0,0 +1,121 @@
+"""
+Entrega de archivos generados (paquetes, EPUB, PDF) desde disco.
+
+servir_archivo responde con ETag y admite peticiones condicionales (If-None-Match)
+y de un solo rango (Range: bytes=inicio-fin, con If-Range), de modo que una descarga
+interrumpida se retoma donde se quedó en lugar de empezar de nuevo.
+"""
+import os
+import re
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+
+TAMANO_BLOQUE = 64 * 1024
+_RANGO = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _coincide_etag(cabecera, etag):
+    if not cabecera:
+        return False
+    if cabecera.strip() == "*":
+        return True
+    # Comparación débil: W/"x" y "x" se consideran iguales
+    return etag in (valor.strip().removeprefix("W/") for valor in cabecera.split(","))
+
+
+def _rango(cabecera, tamano):
+    """(inicio, fin) inclusivos de la cabecera Range, None si no aplica o "fuera" si no se puede servir"""
+    coincidencia = _RANGO.match(cabecera.strip()) if cabecera else None
+    if not coincidencia:
+        # Sin cabecera, con varios rangos o en otra unidad: se responde el archivo completo
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:
+        # bytes=-N: los últimos N bytes
+        sufijo = int(fin)
+        if sufijo == 0:
+            return "fuera"
+        return max(tamano - sufijo, 0), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        return "fuera"
+    return inicio, fin
+
+
+def _leer_tramo(archivo, inicio, longitud):
+    with archivo:
+        archivo.seek(inicio)
+        while longitud > 0:
+            bloque = archivo.read(min(TAMANO_BLOQUE, longitud))
+            if not bloque:
+                return
+            longitud -= len(bloque)
+            yield bloque
+
+
+def servir_archivo(request, ruta, content_type, nombre_descarga, etag, privado=False):
+    """
+    Respuesta para el archivo en ruta: 304 si el cliente ya lo tiene, 206 con el
+    tramo pedido, 416 si el rango no existe o 200 con el archivo completo.
+    etag es la huella del contenido (sin comillas).
+    """
+    etag = f'"{etag}"'
+    # Se abre una sola vez: si otro proceso reemplaza el archivo, esta respuesta sigue con el suyo
+    archivo = open(ruta, "rb")
+    tamano = os.fstat(archivo.fileno()).st_size
+
+    if _coincide_etag(request.headers.get("If-None-Match"), etag):
+        archivo.close()
+        respuesta = HttpResponse(status=304)
+    else:
+        rango = _rango(request.headers.get("Range"), tamano)
+        if_range = request.headers.get("If-Range")
+        if rango and if_range and if_range.strip() != etag:
+            # El archivo cambió desde la primera parte: se envía entero
+            rango = None
+
+        if rango == "fuera":
+            archivo.close()
+            respuesta = HttpResponse(status=416)
+            respuesta["Content-Range"] = f"bytes */{tamano}"
+        elif rango:
+            inicio, fin = rango
+            respuesta = StreamingHttpResponse(
+                _leer_tramo(archivo, inicio, fin - inicio + 1), status=206, content_type=content_type,
+            )
+            respuesta["Content-Range"] = f"bytes {inicio}-{fin}/{tamano}"
+            respuesta["Content-Length"] = str(fin - inicio + 1)
+            respuesta["Content-Disposition"] = content_disposition_header(True, nombre_descarga)
+        else:
+            respuesta = FileResponse(
+                archivo, content_type=content_type, as_attachment=True, filename=nombre_descarga,
+            )
+
+    respuesta["ETag"] = etag
+    respuesta["Accept-Ranges"] = "bytes"
+    # Siempre se revalida con el ETag; los libros privados no se guardan en cachés compartidas
+    respuesta["Cache-Control"] = "private, no-cache" if privado else "no-cache"
+    return respuesta
+
+
+def servir_generado(request, partes, content_type, nombre_descarga, etag, privado=False):
+    """
+    Como servir_archivo para un archivo que se genera mientras se envía: el tamaño aún
+    no se conoce, así que se responde entero (sin Range); las siguientes descargas ya
+    pueden servirse desde disco con servir_archivo.
+    """
+    etag = f'"{etag}"'
+    if _coincide_etag(request.headers.get("If-None-Match"), etag):
+        partes.close()
+        respuesta = HttpResponse(status=304)
+    else:
+        respuesta = StreamingHttpResponse(partes, content_type=content_type)
+        respuesta["Content-Disposition"] = content_disposition_header(True, nombre_descarga)
+    respuesta["ETag"] = etag
+    respuesta["Cache-Control"] = "private, no-cache" if privado else "no-cache"
+    return respuesta
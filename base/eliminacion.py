@@ -0,0 +1,235 @@
+"""
+Borrado de libros y usuarios en dos fases.
+
+marcar_libro / marcar_usuario ponen eliminado_en (los managers por defecto dejan de
+devolverlos; sus páginas y acciones se filtran con de_libros_vigentes() donde se llega
+a ellas sin pasar por el libro), quitan al instante sus filas de rankings y
+similares, dejan la lápida para /sync y crean una TareaEliminacion.
+
+La tarea purga después los dependientes con DELETE ... WHERE id IN (SELECT ... LIMIT n)
+por lotes, sin cargar nada en memoria ni disparar señales. Cada lote va en su propia
+transacción junto con el avance de la tarea, y todos los pasos se pueden repetir sin
+efecto, así que una tarea interrumpida se retoma con procesar_eliminaciones.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from acciones_usuario.models import Acciones_usuario
+from biblioteca_original.vuelo_unico import invalidar
+from libro.autocompletado import indice
+from libro.models import EstadisticaLibro, Libro, LibroSimilar
+from libro.paquete import borrar_paquetes
+from libro.rankings import compactar
+from pagina.lectura import invalidar_libro
+from pagina.models import Pagina
+from sincronizacion.eventos import publicar_libros_eliminados
+from sincronizacion.models import Eliminacion
+from usuario.models import Usuario
+from .models import TareaEliminacion
+
+
+logger = logging.getLogger(__name__)
+
+# Una tarea en curso que no avanza en este tiempo se da por abandonada y se puede retomar
+TAREA_ABANDONADA = timedelta(minutes=5)
+
+
+def _quitar_de_rankings(libro_ids):
+    # Sin dependientes ni señales: Django los borra con un único DELETE
+    EstadisticaLibro.objects.filter(libro_id__in=libro_ids).delete()
+    LibroSimilar.objects.filter(Q(libro_id__in=libro_ids) | Q(similar_id__in=libro_ids)).delete()
+
+
+def marcar_libro(libro, solicitada_por=None):
+    """Oculta el libro al instante y encola la purga de sus páginas y acciones"""
+    ahora = timezone.now()
+    with transaction.atomic():
+        Libro.todos.filter(id=libro.id).update(eliminado_en=ahora, updated_at=ahora)
+        _quitar_de_rankings([libro.id])
+        Eliminacion.objects.create(
+            modelo=Eliminacion.LIBRO, objeto_id=libro.id,
+            usuario_id=libro.usuario_id, es_publico=libro.es_publico,
+        )
+        tarea = TareaEliminacion.objects.create(
+            modelo=TareaEliminacion.LIBRO,
+            objeto_id=libro.id,
+            solicitada_por=solicitada_por,
+            total=(
+                Pagina.todos.filter(libro_id=libro.id).count()
+                + Acciones_usuario.todos.filter(libro_id=libro.id).count()
+            ),
+        )
+        lanzar(tarea)
+        invalidar_libro(libro.id)
+        invalidar("libros", f"libro:{libro.id}", estricto=True)
+        publicar_libros_eliminados(libro.id)
+    indice.quitar_libros([libro.id])
+    return tarea
+
+
+def marcar_usuario(usuario_id, solicitada_por=None):
+    """Oculta al usuario y todos sus libros al instante y encola la purga"""
+    ahora = timezone.now()
+    with transaction.atomic():
+        Usuario.todos.filter(id=usuario_id).update(eliminado_en=ahora, updated_at=ahora)
+        libros = list(Libro.objects.filter(usuario_id=usuario_id).values_list("id", "es_publico"))
+        libro_ids = [libro_id for libro_id, _ in libros]
+        Libro.todos.filter(id__in=libro_ids).update(eliminado_en=ahora, updated_at=ahora)
+        _quitar_de_rankings(libro_ids)
+        Eliminacion.objects.bulk_create([
+            Eliminacion(modelo=Eliminacion.LIBRO, objeto_id=libro_id, usuario_id=usuario_id, es_publico=es_publico)
+            for libro_id, es_publico in libros
+        ])
+        tarea = TareaEliminacion.objects.create(
+            modelo=TareaEliminacion.USUARIO,
+            objeto_id=usuario_id,
+            solicitada_por=solicitada_por,
+            total=(
+                Pagina.todos.filter(libro_id__in=libro_ids).count()
+                + Acciones_usuario.todos.filter(Q(libro_id__in=libro_ids) | Q(usuario_id=usuario_id)).count()
+            ),
+        )
+        lanzar(tarea)
+        invalidar_libro(*libro_ids)
+        invalidar("libros", "autores", *(f"libro:{libro_id}" for libro_id in libro_ids), estricto=True)
+        publicar_libros_eliminados(*libro_ids)
+    indice.quitar_libros(libro_ids)
+    indice.quitar_autor(usuario_id)
+    return tarea
+
+
+def lanzar(tarea):
+    """Ejecuta la tarea cuando la transacción que la creó se confirma, en un hilo o en línea"""
+    if settings.ELIMINACION_EN_SEGUNDO_PLANO:
+        transaction.on_commit(lambda: threading.Thread(
+            target=_ejecutar_en_hilo, args=(tarea.id,), name=f"eliminacion-{tarea.id}", daemon=True,
+        ).start())
+    else:
+        transaction.on_commit(lambda: ejecutar_tarea(tarea.id))
+
+
+def _ejecutar_en_hilo(tarea_id):
+    close_old_connections()
+    try:
+        ejecutar_tarea(tarea_id)
+    finally:
+        connection.close()
+
+
+def reclamar(tarea_id):
+    """Pasa la tarea a en curso si nadie más la está procesando; devuelve la tarea o None"""
+    disponibles = Q(estado__in=[TareaEliminacion.PENDIENTE, TareaEliminacion.ERROR]) | Q(
+        estado=TareaEliminacion.EN_CURSO, updated_at__lt=timezone.now() - TAREA_ABANDONADA,
+    )
+    reclamada = TareaEliminacion.objects.filter(disponibles, id=tarea_id).update(
+        estado=TareaEliminacion.EN_CURSO, error='', updated_at=timezone.now(),
+    )
+    return TareaEliminacion.objects.get(id=tarea_id) if reclamada else None
+
+
+def ejecutar_tarea(tarea_id):
+    tarea = reclamar(tarea_id)
+    if tarea is None:
+        return None
+    try:
+        if tarea.modelo == TareaEliminacion.LIBRO:
+            _purgar_libro(tarea, tarea.objeto_id)
+        else:
+            _purgar_usuario(tarea, tarea.objeto_id)
+    except Exception as error:
+        logger.exception("Error en la tarea de eliminación %s", tarea.id)
+        TareaEliminacion.objects.filter(id=tarea.id).update(
+            estado=TareaEliminacion.ERROR, error=str(error), updated_at=timezone.now(),
+        )
+    else:
+        TareaEliminacion.objects.filter(id=tarea.id).update(
+            estado=TareaEliminacion.COMPLETADA, paso='', updated_at=timezone.now(),
+        )
+    tarea.refresh_from_db()
+    return tarea
+
+
+def _avanzar(tarea, paso, borradas=0):
+    TareaEliminacion.objects.filter(id=tarea.id).update(
+        paso=paso, borradas=F("borradas") + borradas, updated_at=timezone.now(),
+    )
+
+
+def _ejecutar(sql, parametros):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.rowcount
+
+
+def _borrar_por_lotes(tarea, paso, modelo, columna, valor):
+    """Borra las filas de modelo con columna = valor en bloques de ELIMINACION_LOTE"""
+    q = connection.ops.quote_name
+    tabla = q(modelo._meta.db_table)
+    sql = (
+        f"DELETE FROM {tabla} WHERE {q('id')} IN "
+        f"(SELECT {q('id')} FROM {tabla} WHERE {q(columna)} = %s LIMIT %s)"
+    )
+    _avanzar(tarea, paso)
+    while True:
+        with transaction.atomic():
+            borradas = _ejecutar(sql, [valor, settings.ELIMINACION_LOTE])
+            if borradas:
+                _avanzar(tarea, paso, borradas)
+        if borradas < settings.ELIMINACION_LOTE:
+            return
+
+
+def _purgar_libro(tarea, libro_id):
+    q = connection.ops.quote_name
+    acciones = q(Acciones_usuario._meta.db_table)
+    paginas = q(Pagina._meta.db_table)
+
+    _borrar_por_lotes(tarea, f"libro {libro_id}: acciones", Acciones_usuario, "libro_id", libro_id)
+
+    # Acciones de otros libros que apunten a estas páginas (el SET_NULL del ORM no aplica al DELETE directo)
+    _avanzar(tarea, f"libro {libro_id}: referencias")
+    _ejecutar(
+        f"UPDATE {acciones} SET {q('ultima_pagina_leida_id')} = NULL WHERE {q('ultima_pagina_leida_id')} IN "
+        f"(SELECT {q('id')} FROM {paginas} WHERE {q('libro_id')} = %s)",
+        [libro_id],
+    )
+
+    _borrar_por_lotes(tarea, f"libro {libro_id}: páginas", Pagina, "libro_id", libro_id)
+
+    _avanzar(tarea, f"libro {libro_id}: libro")
+    with transaction.atomic():
+        _quitar_de_rankings([libro_id])
+        _ejecutar(f"DELETE FROM {q(Libro._meta.db_table)} WHERE {q('id')} = %s", [libro_id])
+    borrar_paquetes(libro_id)
+
+
+def _purgar_usuario(tarea, usuario_id):
+    for libro_id in Libro.todos.filter(usuario_id=usuario_id).values_list("id", flat=True):
+        _purgar_libro(tarea, libro_id)
+
+    # Las calificaciones y favoritos del usuario dejan de contar en los rankings de esos libros
+    libro_ids = set(Acciones_usuario.todos.filter(usuario_id=usuario_id).values_list("libro_id", flat=True))
+    _borrar_por_lotes(tarea, f"usuario {usuario_id}: acciones", Acciones_usuario, "usuario_id", usuario_id)
+    if libro_ids:
+        _avanzar(tarea, f"usuario {usuario_id}: rankings")
+        compactar(libro_ids=libro_ids)
+
+    _avanzar(tarea, f"usuario {usuario_id}: usuario")
+    _ejecutar(
+        f"DELETE FROM {connection.ops.quote_name(Usuario._meta.db_table)} WHERE {connection.ops.quote_name('id')} = %s",
+        [usuario_id],
+    )
+
+
+def tareas_pendientes():
+    """Tareas que hay que (re)ejecutar: pendientes, con error o abandonadas en curso"""
+    return TareaEliminacion.objects.filter(
+        Q(estado__in=[TareaEliminacion.PENDIENTE, TareaEliminacion.ERROR])
+        | Q(estado=TareaEliminacion.EN_CURSO, updated_at__lt=timezone.now() - TAREA_ABANDONADA)
+    ).order_by("id")
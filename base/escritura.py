@@ -0,0 +1,61 @@
+"""
+Escrituras en un solo viaje a la base de datos.
+
+actualizar_devolviendo hace UPDATE ... RETURNING para que la respuesta se construya
+con la fila ya actualizada sin volver a leerla. Funciona en PostgreSQL y en
+SQLite >= 3.35. No dispara señales: usarlo solo en modelos que no dependen de ellas.
+"""
+from django.db import connection
+from django.db.models.expressions import Col
+from django.utils import timezone
+
+
+def _convertir(modelo, nombres, valores):
+    """Aplica los mismos conversores que usa el ORM al leer (fechas, booleanos...)"""
+    fila = {}
+    for nombre, valor in zip(nombres, valores):
+        columna = Col(modelo._meta.db_table, modelo._meta.get_field(nombre))
+        for conversor in connection.ops.get_db_converters(columna) + columna.get_db_converters(connection):
+            valor = conversor(valor, columna, connection)
+        fila[nombre] = valor
+    return fila
+
+
+def actualizar_devolviendo(modelo, pk, valores, devolver, **filtros):
+    """
+    Actualiza solo los campos de valores (más los auto_now) en la fila pk y devuelve
+    un dict con los campos de devolver tal como quedaron, o None si no hay fila.
+    filtros son igualdades adicionales en el WHERE (por ejemplo usuario_id); None se
+    compara con IS NULL.
+    """
+    q = connection.ops.quote_name
+    meta = modelo._meta
+    valores = dict(valores)
+    for campo in meta.concrete_fields:
+        if getattr(campo, 'auto_now', False):
+            valores[campo.name] = timezone.now()
+
+    asignaciones, parametros = [], []
+    for nombre, valor in valores.items():
+        campo = meta.get_field(nombre)
+        asignaciones.append(f"{q(campo.column)} = %s")
+        parametros.append(campo.get_db_prep_save(valor, connection))
+    condiciones = [f"{q(meta.pk.column)} = %s"]
+    parametros.append(pk)
+    for nombre, valor in filtros.items():
+        campo = meta.get_field(nombre)
+        if valor is None:
+            condiciones.append(f"{q(campo.column)} IS NULL")
+            continue
+        condiciones.append(f"{q(campo.column)} = %s")
+        parametros.append(campo.get_db_prep_value(valor, connection))
+
+    sql = (
+        f"UPDATE {q(meta.db_table)} SET {', '.join(asignaciones)} "
+        f"WHERE {' AND '.join(condiciones)} "
+        f"RETURNING {', '.join(q(meta.get_field(n).column) for n in devolver)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        fila = cursor.fetchone()
+    return _convertir(modelo, devolver, fila) if fila else None
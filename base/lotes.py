@@ -0,0 +1,31 @@
+"""
+Endpoints de lectura por lotes (/libro/batch, /pagina/batch).
+
+Reciben ?ids=3,1,2 y devuelven un resultado por id en el orden pedido, con ok=false y
+error="no_encontrado" para los que no existen o el usuario no puede ver: no se
+distingue entre ambos casos para no revelar qué ids privados existen.
+"""
+from django.conf import settings
+from django.http import HttpResponse
+
+
+def ids_pedidos(ids: str):
+    """Lista de ids de ?ids= en su orden (con repetidos), o (None, respuesta 400)"""
+    try:
+        lista = [int(parte) for parte in ids.split(",") if parte.strip()]
+    except ValueError:
+        return None, HttpResponse("ids debe ser una lista de números separados por comas", status=400)
+    if not lista:
+        return None, HttpResponse("Falta al menos un id", status=400)
+    if len(lista) > settings.LECTURA_LOTE_MAX:
+        return None, HttpResponse(f"Máximo {settings.LECTURA_LOTE_MAX} ids por lote", status=400)
+    return lista, None
+
+
+def resultados_en_orden(ids, encontrados, nombre):
+    """Un dict {id, ok, error, <nombre>} por id pedido; encontrados es {id: datos}"""
+    return [
+        {"id": id_, "ok": True, "error": None, nombre: encontrados[id_]} if id_ in encontrados
+        else {"id": id_, "ok": False, "error": "no_encontrado", nombre: None}
+        for id_ in ids
+    ]
@@ -0,0 +1,132 @@
+import itertools
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from base.bench import (
+    base_datos_temporal, cargar_json, comparar, formatear_tiempo, guardar_json,
+    medir, poblar_datos, resumir,
+)
+
+
+BASELINE_POR_DEFECTO = Path(settings.BASE_DIR) / "base" / "bench_baselines" / "escrituras.json"
+
+
+class Command(BaseCommand):
+    help = "Consultas y latencia de cada endpoint de escritura (a través del cliente de pruebas)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rondas", type=int, default=15)
+        parser.add_argument("--iteraciones", type=int, default=20)
+        parser.add_argument("--baseline", default=str(BASELINE_POR_DEFECTO))
+        parser.add_argument("--guardar", action="store_true", help="Guarda los resultados como nuevo baseline")
+        parser.add_argument("--comparar", action="store_true", help="Compara contra el baseline guardado")
+        parser.add_argument("--umbral", type=float, default=0.20, help="Cambio relativo mínimo para considerar regresión")
+        parser.add_argument("--alfa", type=float, default=0.01, help="Nivel de significancia de la prueba")
+        parser.add_argument("--solo", nargs="*", help="Ejecuta solo los benchmarks indicados")
+
+    def handle(self, *args, **options):
+        resultados = {}
+        with base_datos_temporal():
+            poblar_datos(num_usuarios=5, num_libros=10, paginas_por_libro=200, acciones_por_libro=5)
+            casos = self.casos()
+            if options["solo"]:
+                casos = {nombre: f for nombre, f in casos.items() if nombre in options["solo"]}
+
+            self.stdout.write(f"{'endpoint':<24} {'consultas':>9} {'mediana':>12}")
+            for nombre, funcion in casos.items():
+                # Cada petición vacía el registro de consultas al empezar: se parte de cero
+                reset_queries()
+                with CaptureQueriesContext(connection) as consultas:
+                    respuesta = funcion()
+                if respuesta.status_code >= 400:
+                    raise CommandError(f"{nombre} respondió {respuesta.status_code}: {respuesta.content[:200]!r}")
+                muestras = medir(funcion, rondas=options["rondas"], iteraciones=options["iteraciones"])
+                resultados[nombre] = {**resumir(muestras), "consultas": len(consultas)}
+                self.stdout.write(
+                    f"{nombre:<24} {len(consultas):>9} {formatear_tiempo(resultados[nombre]['mediana']):>12}"
+                )
+
+        if options["comparar"]:
+            self.comparar(cargar_json(options["baseline"]), resultados, options["umbral"], options["alfa"])
+        if options["guardar"]:
+            guardar_json(options["baseline"], resultados)
+            self.stdout.write(self.style.SUCCESS(f"Baseline guardado en {options['baseline']}"))
+
+    def casos(self):
+        from acciones_usuario.models import Acciones_usuario
+        from libro.models import Libro
+        from pagina.models import Pagina
+
+        cliente = Client()
+        libro = Libro.objects.order_by("id").first()
+        usuario_id = libro.usuario_id
+        token = signing.dumps({"uid": usuario_id, "email": "usuario0@example.com"}, salt="usuario.auth")
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+        pagina = Pagina.objects.filter(libro_id=libro.id).order_by("id").last()
+        Acciones_usuario.objects.update_or_create(
+            usuario_id=usuario_id, libro_id=libro.id, defaults={"ultima_pagina_leida_id": pagina.id},
+        )
+        # create_accion necesita un libro distinto en cada llamada: se crean de antemano
+        libros_sin_accion = iter(Libro.objects.bulk_create([
+            Libro(nombre=f"Bench {i}", version=1, color_portada="rojo", usuario_id=usuario_id)
+            for i in range(5000)
+        ]))
+        contador = itertools.count()
+
+        return {
+            "create_usuario": lambda: cliente.post(
+                "/usuario/", {"nombre_completo": "Bench", "email": f"bench{next(contador)}@example.com",
+                              "contraseña": "clave"}, content_type="application/json",
+            ),
+            "update_usuario": lambda: cliente.put(
+                f"/usuario/{usuario_id}", {"nombre_completo": "Usuario 0"}, content_type="application/json", **auth,
+            ),
+            "create_libro": lambda: cliente.post(
+                "/libro/", {"nombre": "Nuevo", "version": 1, "color_portada": "azul",
+                            "genero_id": libro.genero_id}, **auth,
+            ),
+            "update_libro": lambda: cliente.put(
+                f"/libro/{libro.id}", "nombre=Libro+0", content_type="application/x-www-form-urlencoded", **auth,
+            ),
+            "create_pagina": lambda: cliente.post(
+                "/pagina/", {"contenido": "texto", "tipo": "texto", "titulo": "Nueva", "libro_id": libro.id},
+                content_type="application/json", **auth,
+            ),
+            "update_pagina": lambda: cliente.put(
+                f"/pagina/{pagina.id}", {"contenido": "texto", "tipo": "texto", "titulo": "Última", "libro_id": libro.id},
+                content_type="application/json", **auth,
+            ),
+            "create_accion_usuario": lambda: cliente.post(
+                "/acciones_usuario/", {"libro_id": next(libros_sin_accion).id, "es_favorito": True},
+                content_type="application/json", **auth,
+            ),
+            "update_accion_usuario": lambda: cliente.put(
+                f"/acciones_usuario/libro/{libro.id}", {"calificacion": 4}, content_type="application/json", **auth,
+            ),
+        }
+
+    def comparar(self, baseline, resultados, umbral, alfa):
+        filas = comparar(baseline, resultados, umbral=umbral, alfa=alfa)
+        self.stdout.write("")
+        self.stdout.write(f"{'endpoint':<24} {'consultas':>11} {'baseline':>12} {'actual':>12} {'cambio':>9}  veredicto")
+        regresiones = []
+        for nombre, base, actual, cambio, p, veredicto in filas:
+            consultas_base = baseline.get(nombre, {}).get("consultas")
+            consultas = resultados[nombre]["consultas"]
+            if consultas_base is not None and consultas > consultas_base:
+                veredicto = "REGRESIÓN"
+            cambio_txt = f"{cambio:+.1%}" if cambio is not None else "-"
+            self.stdout.write(
+                f"{nombre:<24} {consultas_base if consultas_base is not None else '-':>5} → {consultas:<3} "
+                f"{formatear_tiempo(base):>12} {formatear_tiempo(actual):>12} {cambio_txt:>9}  {veredicto}"
+            )
+            if veredicto == "REGRESIÓN":
+                regresiones.append(nombre)
+        if regresiones:
+            raise CommandError(f"Regresiones significativas: {', '.join(regresiones)}")
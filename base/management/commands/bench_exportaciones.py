@@ -0,0 +1,108 @@
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from base.bench import base_datos_temporal, formatear_tiempo, poblar_datos, resumir
+
+
+def formatear_bytes(n):
+    for unidad in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unidad}" if unidad == "B" else f"{n:.1f} {unidad}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+class Command(BaseCommand):
+    help = "Tiempo, tamaño y memoria de las exportaciones PDF y EPUB de un libro grande y escalado del PDF por procesos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--paginas", type=int, default=2000)
+        parser.add_argument("--rondas", type=int, default=5)
+        parser.add_argument(
+            "--procesos", type=int, nargs="*", default=[1, 2, 4],
+            help="Tamaños del pool para medir el PDF por tramos (1 = un solo proceso)",
+        )
+
+    def handle(self, *args, **options):
+        with base_datos_temporal(), tempfile.TemporaryDirectory() as directorio, override_settings(PAQUETES_DIR=directorio):
+            from libro.models import Libro
+
+            _, libros = poblar_datos(num_usuarios=1, num_libros=1, paginas_por_libro=options["paginas"], acciones_por_libro=0)
+            libro_id = libros[0].id
+            Libro.objects.filter(id=libro_id).update(es_publico=True)
+            cliente = Client()
+
+            def descargar(formato):
+                respuesta = cliente.get(f"/libro/{libro_id}/download_{formato}")
+                if respuesta.status_code != 200:
+                    raise CommandError(f"{formato} respondió {respuesta.status_code}")
+                if respuesta.streaming:
+                    return sum(len(parte) for parte in respuesta.streaming_content)
+                return len(respuesta.content)
+
+            def epub_sin_cache():
+                for ruta in Path(directorio).glob("*.epub"):
+                    ruta.unlink()
+                return descargar("epub")
+
+            casos = {
+                "pdf": lambda: descargar("pdf"),
+                "epub (generado)": epub_sin_cache,
+                "epub (en caché)": lambda: descargar("epub"),
+            }
+            self.stdout.write(f"{options['paginas']} páginas")
+            self.stdout.write(f"{'exportación':<18} {'mediana':>12} {'tamaño':>10} {'memoria pico':>13}")
+            for nombre, funcion in casos.items():
+                tracemalloc.start()
+                tamano = funcion()
+                _, pico = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                muestras = []
+                for _ in range(options["rondas"]):
+                    inicio = time.perf_counter()
+                    funcion()
+                    muestras.append(time.perf_counter() - inicio)
+                mediana = resumir(muestras)["mediana"]
+                self.stdout.write(
+                    f"{nombre:<18} {formatear_tiempo(mediana):>12} {formatear_bytes(tamano):>10} {formatear_bytes(pico):>13}"
+                )
+
+            if options["procesos"]:
+                self.escalado(Libro.objects.select_related("usuario").get(id=libro_id), options)
+
+    def escalado(self, libro, options):
+        from libro.pdf import crear_pool, procesos_pdf
+
+        self.stdout.write("")
+        self.stdout.write(f"PDF por tramos ({procesos_pdf()} núcleos disponibles)")
+        self.stdout.write(f"{'procesos':>8} {'mediana':>12} {'aceleración':>12}")
+        base = None
+        with override_settings(PDF_PARALELO_MIN_PAGINAS=0):
+            for procesos in options["procesos"]:
+                if procesos < 2:
+                    with override_settings(PDF_PROCESOS=1):
+                        mediana = self.medir_pdf(libro, options, None)
+                else:
+                    # Un pool propio por tamaño, que se cierra al acabar de medirlo
+                    with crear_pool(procesos) as pool:
+                        mediana = self.medir_pdf(libro, options, pool)
+                base = base or mediana
+                self.stdout.write(f"{procesos:>8} {formatear_tiempo(mediana):>12} {base / mediana:>11.2f}x")
+
+    def medir_pdf(self, libro, options, pool):
+        from libro.pdf import generar_pdf
+
+        # El primer uso del pool arranca sus procesos: no se cuenta
+        generar_pdf(libro, options["paginas"], pool=pool)
+        muestras = []
+        for _ in range(options["rondas"]):
+            inicio = time.perf_counter()
+            generar_pdf(libro, options["paginas"], pool=pool)
+            muestras.append(time.perf_counter() - inicio)
+        return resumir(muestras)["mediana"]
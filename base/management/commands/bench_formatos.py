@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base.bench import formatear_tiempo, medir, resumir
+
+
+class Command(BaseCommand):
+    help = "Tamaño y tiempo de codificación/decodificación de las respuestas en JSON, MessagePack y CBOR"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--libros", type=int, default=1000)
+        parser.add_argument("--paginas", type=int, default=200)
+        parser.add_argument("--rondas", type=int, default=10)
+        parser.add_argument("--iteraciones", type=int, default=20)
+
+    def handle(self, *args, **options):
+        import orjson
+        from biblioteca_original.renderizado import (
+            CBOR, JSON, MSGPACK, RENDERIZADORES, formatos_disponibles,
+        )
+
+        decodificadores = {JSON: orjson.loads}
+        if MSGPACK in formatos_disponibles():
+            import msgpack
+            decodificadores[MSGPACK] = lambda datos: msgpack.unpackb(datos, timestamp=3)
+        if CBOR in formatos_disponibles():
+            import cbor2
+            decodificadores[CBOR] = cbor2.loads
+
+        ahora = timezone.now()
+        cargas = {
+            "libros": [
+                dict(
+                    id=i, nombre=f"Libro de prueba {i}", version=1, genero_id=1, genero="Novela",
+                    color_portada="azul", imagen_portada=f"/media/libros/portadas/portada{i}.jpg",
+                    es_publico=True, usuario_id=i % 50, autor="Autora de prueba",
+                    created_at=ahora, updated_at=ahora, ultima_pagina_leida=250,
+                    ultima_pagina_leida_id=1250, esta_terminado=False, total_paginas=500,
+                    es_favorito=i % 3 == 0, pendiente_leer=False, calificacion_promedio=4.25,
+                )
+                for i in range(options["libros"])
+            ],
+            "paginas": [
+                dict(
+                    id=i, contenido="Lorem ipsum dolor sit amet\n" * 40, tipo="texto", titulo=f"Capítulo {i}",
+                    libro_id=1, libro_nombre="Libro de prueba", created_at=ahora, updated_at=ahora,
+                )
+                for i in range(options["paginas"])
+            ],
+        }
+
+        self.stdout.write(f"{'carga':<10} {'formato':<20} {'tamaño':>10} {'vs JSON':>8} {'codificar':>12} {'decodificar':>12}")
+        for nombre, datos in cargas.items():
+            tamano_json = None
+            for formato, decodificar in decodificadores.items():
+                codificar = RENDERIZADORES[formato]
+                contenido = codificar(datos)
+                tamano_json = tamano_json or len(contenido)
+                tiempo_codificar = resumir(medir(
+                    lambda: codificar(datos), rondas=options["rondas"], iteraciones=options["iteraciones"],
+                ))["mediana"]
+                tiempo_decodificar = resumir(medir(
+                    lambda: decodificar(contenido), rondas=options["rondas"], iteraciones=options["iteraciones"],
+                ))["mediana"]
+                self.stdout.write(
+                    f"{nombre:<10} {formato:<20} {len(contenido):>10} {len(contenido) / tamano_json:>7.0%} "
+                    f"{formatear_tiempo(tiempo_codificar):>12} {formatear_tiempo(tiempo_decodificar):>12}"
+                )
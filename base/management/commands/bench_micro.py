@@ -0,0 +1,128 @@
+import json
+from pathlib import Path
+from typing import List
+
+from django.conf import settings
+from django.core import signing
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.utils import timezone
+from ninja.responses import NinjaJSONEncoder
+from pydantic import TypeAdapter
+
+from base.bench import (
+    base_datos_temporal, cargar_json, comparar, formatear_tiempo, guardar_json,
+    medir, poblar_datos, resumir,
+)
+
+
+BASELINE_POR_DEFECTO = Path(settings.BASE_DIR) / "base" / "bench_baselines" / "micro.json"
+
+
+class Command(BaseCommand):
+    help = "Microbenchmarks de las funciones calientes con entradas sintéticas fijas"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rondas", type=int, default=25)
+        parser.add_argument("--iteraciones", type=int, default=200)
+        parser.add_argument("--baseline", default=str(BASELINE_POR_DEFECTO))
+        parser.add_argument("--guardar", action="store_true", help="Guarda los resultados como nuevo baseline")
+        parser.add_argument("--comparar", action="store_true", help="Compara contra el baseline guardado")
+        parser.add_argument("--umbral", type=float, default=0.20, help="Cambio relativo mínimo para considerar regresión")
+        parser.add_argument("--alfa", type=float, default=0.01, help="Nivel de significancia de la prueba")
+        parser.add_argument("--solo", nargs="*", help="Ejecuta solo los benchmarks indicados")
+
+    def handle(self, *args, **options):
+        with base_datos_temporal():
+            poblar_datos(num_usuarios=20, num_libros=10, paginas_por_libro=500, acciones_por_libro=20)
+            casos = self.casos()
+            if options["solo"]:
+                casos = {nombre: f for nombre, f in casos.items() if nombre in options["solo"]}
+
+            resultados = {}
+            for nombre, funcion in casos.items():
+                muestras = medir(funcion, rondas=options["rondas"], iteraciones=options["iteraciones"])
+                resultados[nombre] = resumir(muestras)
+                self.stdout.write(f"{nombre:<40} {formatear_tiempo(resultados[nombre]['mediana']):>12}")
+
+        if options["comparar"]:
+            self.comparar(cargar_json(options["baseline"]), resultados, options["umbral"], options["alfa"])
+        if options["guardar"]:
+            guardar_json(options["baseline"], resultados)
+            self.stdout.write(self.style.SUCCESS(f"Baseline guardado en {options['baseline']}"))
+
+    def casos(self):
+        from libro.models import Libro
+        from pagina.models import Pagina
+        from libro.routes import calcular_calificacion_promedio, obtener_numero_pagina_por_id
+        from libro.schemas import LibroOut
+        from pagina.schemas import PaginaOut
+        from acciones_usuario.schemas import AccionUsuarioOut
+        from usuario.auth import TokenAuth
+        from biblioteca_original.renderizado import renderizar_json
+
+        libro = Libro.objects.order_by("id").first()
+        paginas = list(Pagina.objects.filter(libro_id=libro.id).order_by("id").values_list("id", flat=True))
+        pagina_media = paginas[len(paginas) // 2]
+        ahora = timezone.now()
+
+        datos_libro = dict(
+            id=1, nombre="Libro de prueba", version=1, genero_id=1, genero="Novela",
+            color_portada="azul", imagen_portada="/media/libros/portadas/portada.jpg",
+            es_publico=True, usuario_id=1, autor="Autora de prueba",
+            created_at=ahora, updated_at=ahora, ultima_pagina_leida=250,
+            ultima_pagina_leida_id=1250, esta_terminado=False, total_paginas=500,
+            es_favorito=True, pendiente_leer=False, calificacion_promedio=4.25,
+        )
+        datos_pagina = dict(
+            id=1, contenido="Lorem ipsum dolor sit amet\n" * 40, tipo="texto", titulo="Capítulo 1",
+            libro_id=1, libro_nombre="Libro de prueba", created_at=ahora, updated_at=ahora,
+        )
+        datos_accion = dict(
+            id=1, usuario_id=1, libro_id=1, libro_nombre="Libro de prueba", es_favorito=True,
+            ultima_pagina_leida=250, ultima_pagina_leida_id=1250, pendiente_leer=False,
+            calificacion=4, created_at=ahora, updated_at=ahora,
+        )
+
+        # Respuesta de 1000 libros: camino de ninja (validar los LibroOut y json de la
+        # biblioteca estándar), el mismo con orjson y el de @salida_confiable (dicts y orjson)
+        libros_dict = [dict(datos_libro, id=i) for i in range(1000)]
+        libros_out = [LibroOut(**datos) for datos in libros_dict]
+        lista_libros = TypeAdapter(List[LibroOut])
+
+        auth = TokenAuth()
+        token = signing.dumps({"uid": 1, "email": "usuario0@example.com"}, salt="usuario.auth")
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        return {
+            "obtener_numero_pagina_por_id": lambda: obtener_numero_pagina_por_id(libro.id, pagina_media),
+            "calcular_calificacion_promedio": lambda: calcular_calificacion_promedio(libro.id),
+            "LibroOut": lambda: LibroOut(**datos_libro),
+            "PaginaOut": lambda: PaginaOut(**datos_pagina),
+            "AccionUsuarioOut": lambda: AccionUsuarioOut(**datos_accion),
+            "TokenAuth.authenticate": lambda: auth.authenticate(request, token),
+            "1000 libros: validados + json": lambda: json.dumps(
+                lista_libros.dump_python(lista_libros.validate_python(libros_out)), cls=NinjaJSONEncoder,
+            ),
+            "1000 libros: validados + orjson": lambda: renderizar_json(
+                lista_libros.dump_python(lista_libros.validate_python(libros_out)),
+            ),
+            "1000 libros: confiables + orjson": lambda: renderizar_json(libros_dict),
+        }
+
+    def comparar(self, baseline, resultados, umbral, alfa):
+        filas = comparar(baseline, resultados, umbral=umbral, alfa=alfa)
+        self.stdout.write("")
+        self.stdout.write(f"{'benchmark':<40} {'baseline':>12} {'actual':>12} {'cambio':>9} {'p':>8}  veredicto")
+        regresiones = []
+        for nombre, base, actual, cambio, p, veredicto in filas:
+            cambio_txt = f"{cambio:+.1%}" if cambio is not None else "-"
+            p_txt = f"{p:.4f}" if p is not None else "-"
+            self.stdout.write(
+                f"{nombre:<40} {formatear_tiempo(base):>12} {formatear_tiempo(actual):>12} "
+                f"{cambio_txt:>9} {p_txt:>8}  {veredicto}"
+            )
+            if veredicto == "REGRESIÓN":
+                regresiones.append(nombre)
+        if regresiones:
+            raise CommandError(f"Regresiones significativas: {', '.join(regresiones)}")
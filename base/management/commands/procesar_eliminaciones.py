@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from base.eliminacion import ejecutar_tarea, tareas_pendientes
+from base.models import TareaEliminacion
+
+
+class Command(BaseCommand):
+    help = "Ejecuta (o retoma) las purgas de libros y usuarios eliminados que no terminaron"
+
+    def handle(self, *args, **options):
+        tareas = list(tareas_pendientes().values_list("id", flat=True))
+        if not tareas:
+            self.stdout.write("No hay eliminaciones pendientes")
+            return
+        for tarea_id in tareas:
+            tarea = ejecutar_tarea(tarea_id)
+            if tarea is None:
+                self.stdout.write(f"Tarea {tarea_id}: la está procesando otro proceso")
+            elif tarea.estado == TareaEliminacion.COMPLETADA:
+                self.stdout.write(self.style.SUCCESS(
+                    f"✅ Tarea {tarea_id} ({tarea.modelo} {tarea.objeto_id}): {tarea.borradas} filas borradas"
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f"❌ Tarea {tarea_id}: {tarea.error}"))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaEliminacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('modelo', models.CharField(choices=[('libro', 'Libro'), ('usuario', 'Usuario')], max_length=10)),
+                ('objeto_id', models.BigIntegerField()),
+                ('solicitada_por', models.BigIntegerField(null=True)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completada', 'Completada'), ('error', 'Error')], default='pendiente', max_length=10)),
+                ('paso', models.CharField(blank=True, default='', max_length=50)),
+                ('borradas', models.BigIntegerField(default=0)),
+                ('total', models.BigIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'id'], name='tarea_eliminacion_estado_idx')],
+            },
+        ),
+    ]
@@ -6,4 +6,31 @@ class Base(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+class TareaEliminacion(Base):
+    """
+    Purga en segundo plano de un libro o usuario ya marcado como eliminado (ver base/eliminacion.py).
+    paso y borradas permiten retomar la tarea donde se quedó si el proceso se interrumpe.
+    """
+    LIBRO = 'libro'
+    USUARIO = 'usuario'
+    MODELOS = [(LIBRO, 'Libro'), (USUARIO, 'Usuario')]
+
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    COMPLETADA = 'completada'
+    ERROR = 'error'
+    ESTADOS = [(PENDIENTE, 'Pendiente'), (EN_CURSO, 'En curso'), (COMPLETADA, 'Completada'), (ERROR, 'Error')]
+
+    modelo=models.CharField(max_length=10, choices=MODELOS)
+    objeto_id=models.BigIntegerField()
+    solicitada_por=models.BigIntegerField(null=True)
+    estado=models.CharField(max_length=10, choices=ESTADOS, default=PENDIENTE)
+    paso=models.CharField(max_length=50, blank=True, default='')
+    borradas=models.BigIntegerField(default=0)
+    total=models.BigIntegerField(default=0)
+    error=models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [models.Index(fields=['estado', 'id'], name='tarea_eliminacion_estado_idx')]
@@ -0,0 +1,31 @@
+from django.shortcuts import get_object_or_404
+from ninja import Router
+
+from usuario.auth import token_auth
+from .models import TareaEliminacion
+from .schemas import TareaEliminacionOut
+
+
+router = Router(tags=["tareas"])
+
+
+@router.get("/eliminacion/{tarea_id}", response=TareaEliminacionOut, auth=token_auth)
+def get_tarea_eliminacion(request, tarea_id: int):
+    """Progreso de la purga en segundo plano de un libro o usuario eliminado"""
+    tarea = get_object_or_404(TareaEliminacion, id=tarea_id, solicitada_por=request.auth.get('uid'))
+    return TareaEliminacionOut(
+        id=tarea.id,
+        modelo=tarea.modelo,
+        objeto_id=tarea.objeto_id,
+        estado=tarea.estado,
+        paso=tarea.paso,
+        borradas=tarea.borradas,
+        total=tarea.total,
+        progreso=(
+            1.0 if tarea.estado == TareaEliminacion.COMPLETADA
+            else min(tarea.borradas / tarea.total, 1.0) if tarea.total else 0.0
+        ),
+        error=tarea.error or None,
+        created_at=tarea.created_at,
+        updated_at=tarea.updated_at,
+    )
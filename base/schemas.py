@@ -0,0 +1,17 @@
+from datetime import datetime
+from typing import Optional
+from ninja import Schema
+
+
+class TareaEliminacionOut(Schema):
+    id: int
+    modelo: str
+    objeto_id: int
+    estado: str
+    paso: str
+    borradas: int
+    total: int
+    progreso: float
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
@@ -1,3 +1,67 @@
-from django.test import TestCase
+import os
+import tempfile
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase
+
+from .descargas import servir_archivo
+
+
+class ServirArchivoTests(SimpleTestCase):
+    CONTENIDO = bytes(range(256)) * 4  # 1024 bytes
+
+    def setUp(self):
+        descriptor, self.ruta = tempfile.mkstemp()
+        with os.fdopen(descriptor, "wb") as archivo:
+            archivo.write(self.CONTENIDO)
+        self.addCleanup(os.remove, self.ruta)
+
+    def servir(self, **cabeceras):
+        request = RequestFactory().get("/descarga", headers=cabeceras)
+        respuesta = servir_archivo(request, self.ruta, "application/zip", "libro.zip", "v1")
+        self.addCleanup(respuesta.close)
+        return respuesta
+
+    def test_completo_sin_rango(self):
+        respuesta = self.servir()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(b"".join(respuesta.streaming_content), self.CONTENIDO)
+        self.assertEqual(respuesta["ETag"], '"v1"')
+        self.assertEqual(respuesta["Accept-Ranges"], "bytes")
+
+    def test_304_si_ya_lo_tiene(self):
+        self.assertEqual(self.servir(If_None_Match='W/"v1"').status_code, 304)
+
+    def test_rangos(self):
+        casos = {
+            "bytes=0-9": (0, 9),
+            "bytes=1000-": (1000, 1023),
+            "bytes=-24": (1000, 1023),
+            "bytes=1000-5000": (1000, 1023),
+        }
+        for cabecera, (inicio, fin) in casos.items():
+            with self.subTest(cabecera):
+                respuesta = self.servir(Range=cabecera)
+                self.assertEqual(respuesta.status_code, 206)
+                self.assertEqual(respuesta["Content-Range"], f"bytes {inicio}-{fin}/1024")
+                self.assertEqual(respuesta["Content-Length"], str(fin - inicio + 1))
+                self.assertEqual(b"".join(respuesta.streaming_content), self.CONTENIDO[inicio:fin + 1])
+
+    def test_416_si_el_rango_no_existe(self):
+        for cabecera in ("bytes=1024-", "bytes=10-5", "bytes=-0"):
+            with self.subTest(cabecera):
+                respuesta = self.servir(Range=cabecera)
+                self.assertEqual(respuesta.status_code, 416)
+                self.assertEqual(respuesta["Content-Range"], "bytes */1024")
+
+    def test_rango_no_soportado_devuelve_el_archivo_completo(self):
+        for cabecera in ("bytes=0-1,5-6", "items=0-1", "bytes=-"):
+            with self.subTest(cabecera):
+                self.assertEqual(self.servir(Range=cabecera).status_code, 200)
+
+    def test_if_range(self):
+        respuesta = self.servir(Range="bytes=0-9", If_Range='"v1"')
+        self.assertEqual(respuesta.status_code, 206)
+        # El archivo cambió desde la primera parte: se envía entero
+        respuesta = self.servir(Range="bytes=0-9", If_Range='"v0"')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(b"".join(respuesta.streaming_content), self.CONTENIDO)
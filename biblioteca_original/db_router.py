@@ -0,0 +1,63 @@
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from usuario.auth import token_auth
+
+
+REPLICA = 'replica'
+PRIMARIA = 'default'
+
+_leer_de_replica = ContextVar('leer_de_replica', default=False)
+
+
+def clave_fijado(usuario_id):
+    return f"replica:fijado:{usuario_id}"
+
+
+def fijar_primaria(usuario_id):
+    """Tras una escritura, el usuario lee de la primaria mientras la réplica se pone al día"""
+    if usuario_id and settings.DATABASE_REPLICA_RETRASO > 0:
+        cache.set(clave_fijado(usuario_id), True, settings.DATABASE_REPLICA_RETRASO)
+
+
+class ReplicaRouter:
+    """Envía a la réplica solo las lecturas de las vistas marcadas con @lectura_en_replica"""
+
+    def db_for_read(self, model, **hints):
+        return REPLICA if _leer_de_replica.get() else PRIMARIA
+
+    def db_for_write(self, model, **hints):
+        return PRIMARIA
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARIA
+
+
+def lectura_en_replica(func):
+    """Decorador para endpoints de solo lectura que pueden leerse desde la réplica"""
+    if REPLICA not in settings.DATABASES:
+        return func
+
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        auth = getattr(request, 'auth', None)
+        if auth is None:
+            # Rutas sin auth= (get_libro, get_pagina, descargas...): el autor que acaba de
+            # escribir también debe leer de la primaria, así que se mira su token igualmente
+            auth = token_auth(request)
+        usuario_id = auth.get('uid') if auth else None
+        if usuario_id and cache.get(clave_fijado(usuario_id)):
+            return func(request, *args, **kwargs)
+
+        token = _leer_de_replica.set(True)
+        try:
+            return func(request, *args, **kwargs)
+        finally:
+            _leer_de_replica.reset(token)
+    return wrapper
@@ -0,0 +1,106 @@
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+
+from base.bench import base_datos_temporal, poblar_datos
+
+
+class Command(BaseCommand):
+    help = "Mide el throughput de lectura en SQLite mientras se escriben actualizaciones de progreso"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--segundos", type=float, default=5)
+        parser.add_argument("--lectores", type=int, default=4)
+        parser.add_argument("--escritores", type=int, default=2)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Este benchmark solo aplica a SQLite")
+
+        perfiles = {"basico": {}, "concurrente": settings.SQLITE_OPCIONES_CONCURRENTE}
+        config = connections["default"].settings_dict
+        opciones_originales = config.get("OPTIONS", {})
+        test_original = dict(config.get("TEST", {}))
+
+        self.stdout.write(f"{'perfil':<12} {'lecturas/s':>12} {'escrituras/s':>13} {'bloqueos':>9}")
+        try:
+            for nombre, opciones in perfiles.items():
+                with tempfile.TemporaryDirectory() as directorio:
+                    connections.close_all()
+                    config["OPTIONS"] = dict(opciones)
+                    config["TEST"] = {**test_original, "NAME": str(Path(directorio) / "bench.sqlite3")}
+                    with base_datos_temporal():
+                        resultado = self.ejecutar(options["segundos"], options["lectores"], options["escritores"])
+                self.stdout.write(
+                    f"{nombre:<12} {resultado['lecturas'] / options['segundos']:>12.0f} "
+                    f"{resultado['escrituras'] / options['segundos']:>13.0f} {resultado['bloqueos']:>9}"
+                )
+        finally:
+            connections.close_all()
+            config["OPTIONS"] = opciones_originales
+            config["TEST"] = test_original
+
+    def ejecutar(self, segundos, lectores, escritores):
+        from acciones_usuario.models import Acciones_usuario
+        from libro.models import Libro
+        from pagina.models import Pagina
+
+        poblar_datos(num_usuarios=20, num_libros=20, paginas_por_libro=100, acciones_por_libro=20)
+        acciones = list(Acciones_usuario.objects.values_list("id", "libro_id"))
+        paginas_por_libro = {}
+        for pagina_id, libro_id in Pagina.objects.values_list("id", "libro_id"):
+            paginas_por_libro.setdefault(libro_id, []).append(pagina_id)
+        libros = list(Libro.objects.values_list("id", flat=True))
+        connections.close_all()
+
+        contadores = {"lecturas": 0, "escrituras": 0, "bloqueos": 0}
+        lock = threading.Lock()
+        fin = time.perf_counter() + segundos
+
+        def sumar(clave):
+            with lock:
+                contadores[clave] += 1
+
+        def lector(semilla):
+            azar = random.Random(semilla)
+            try:
+                while time.perf_counter() < fin:
+                    libro_id = azar.choice(libros)
+                    try:
+                        list(Acciones_usuario.objects.filter(libro_id=libro_id).values("id", "calificacion"))
+                        Pagina.objects.filter(libro_id=libro_id).count()
+                        sumar("lecturas")
+                    except OperationalError:
+                        sumar("bloqueos")
+            finally:
+                connection.close()
+
+        def escritor(semilla):
+            azar = random.Random(semilla)
+            try:
+                while time.perf_counter() < fin:
+                    accion_id, libro_id = azar.choice(acciones)
+                    try:
+                        with transaction.atomic():
+                            Acciones_usuario.objects.filter(id=accion_id).update(
+                                ultima_pagina_leida_id=azar.choice(paginas_por_libro[libro_id])
+                            )
+                        sumar("escrituras")
+                    except OperationalError:
+                        sumar("bloqueos")
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=lector, args=(i,)) for i in range(lectores)]
+        hilos += [threading.Thread(target=escritor, args=(100 + i,)) for i in range(escritores)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return contadores
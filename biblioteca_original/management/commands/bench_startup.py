@@ -0,0 +1,59 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Se ejecuta en un proceso nuevo: carga Django y las rutas como lo haría un worker WSGI
+SCRIPT_ARRANQUE = """
+import os, sys, time
+inicio = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "biblioteca_original.settings")
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+setup = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+fin = time.perf_counter()
+modulos_pesados = sorted(m for m in ("reportlab", "PIL") if m in sys.modules)
+print(f"{(setup - inicio) * 1000:.3f} {(fin - inicio) * 1000:.3f} {','.join(modulos_pesados) or '-'}")
+"""
+
+
+class Command(BaseCommand):
+    help = "Mide el arranque en frío de un worker (django.setup + carga de rutas) en procesos nuevos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeticiones", type=int, default=10)
+
+    def handle(self, *args, **options):
+        setups, totales, procesos = [], [], []
+        modulos = set()
+        for _ in range(options["repeticiones"]):
+            inicio = time.perf_counter()
+            salida = subprocess.run(
+                [sys.executable, "-c", SCRIPT_ARRANQUE],
+                cwd=settings.BASE_DIR,
+                env={**os.environ, "DJANGO_SETTINGS_MODULE": "biblioteca_original.settings"},
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            procesos.append((time.perf_counter() - inicio) * 1000)
+            setup, total, pesados = salida.stdout.strip().splitlines()[-1].split()
+            setups.append(float(setup))
+            totales.append(float(total))
+            if pesados != "-":
+                modulos.update(pesados.split(","))
+
+        self.stdout.write(f"django.setup():            mediana {statistics.median(setups):8.1f} ms")
+        self.stdout.write(f"setup + carga de rutas:    mediana {statistics.median(totales):8.1f} ms")
+        self.stdout.write(f"proceso completo:          mediana {statistics.median(procesos):8.1f} ms")
+        if modulos:
+            self.stdout.write(self.style.WARNING(f"Módulos pesados cargados al arrancar: {', '.join(sorted(modulos))}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Ningún módulo pesado cargado al arrancar"))
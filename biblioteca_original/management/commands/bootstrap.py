@@ -0,0 +1,35 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Prepara la base de datos una vez por despliegue: migraciones y superusuario inicial"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sin-superusuario", action="store_true", help="No crea el superusuario inicial")
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔄 Paso 1: Ejecutando migraciones...")
+        call_command("migrate", verbosity=options["verbosity"], interactive=False)
+        self.stdout.write(self.style.SUCCESS("✅ Paso 1 completado: Migraciones ejecutadas"))
+
+        if options["sin_superusuario"]:
+            return
+
+        self.stdout.write("👤 Paso 2: Verificando superusuario...")
+        username = os.getenv("BOOTSTRAP_SUPERUSUARIO", "laika")
+        if User.objects.filter(username=username).exists():
+            self.stdout.write(self.style.SUCCESS(f"✅ Paso 2 completado: Superusuario '{username}' ya existe"))
+            return
+
+        User.objects.create_superuser(
+            username=username,
+            email=os.getenv("BOOTSTRAP_SUPERUSUARIO_EMAIL", "laika@example.com"),
+            password=os.getenv("BOOTSTRAP_SUPERUSUARIO_PASSWORD", "11"),
+            first_name="Laika",
+            last_name="Admin",
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ Paso 2 completado: Superusuario '{username}' creado"))
@@ -0,0 +1,163 @@
+import cProfile
+import hmac
+import pstats
+import random
+import re
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .db_router import fijar_primaria
+
+
+class PerfiladoMiddleware:
+    """
+    Perfila la vista con cProfile cuando la petición trae la cabecera X-Perfilar
+    con el token configurado o cuando el muestreo la selecciona.
+    Si PERFILADO_ACTIVO es falso el middleware se descarta al arrancar y no cuesta nada.
+    """
+
+    CABECERA = "HTTP_X_PERFILAR"
+
+    def __init__(self, get_response):
+        if not settings.PERFILADO_ACTIVO:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.directorio = Path(settings.PERFILADO_DIR)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.token = settings.PERFILADO_TOKEN
+        self.muestreo = settings.PERFILADO_MUESTREO
+        self.max_por_minuto = settings.PERFILADO_MAX_POR_MINUTO
+        self.max_bytes = settings.PERFILADO_MAX_MB * 1024 * 1024
+        self.recientes = deque()
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if iscoroutinefunction(view_func) or not self.seleccionar(request):
+            return None
+        if not self.reservar_cupo():
+            return None
+
+        perfil = cProfile.Profile()
+        response = perfil.runcall(view_func, request, *view_args, **view_kwargs)
+        response["X-Perfil"] = self.guardar(request, perfil)
+        return response
+
+    def seleccionar(self, request):
+        cabecera = request.META.get(self.CABECERA)
+        if cabecera is not None:
+            return bool(self.token) and hmac.compare_digest(cabecera, self.token)
+        return self.muestreo > 0 and random.random() < self.muestreo
+
+    def reservar_cupo(self):
+        """Limita cuántos perfiles se generan por minuto en este proceso"""
+        ahora = time.monotonic()
+        with self.lock:
+            while self.recientes and ahora - self.recientes[0] > 60:
+                self.recientes.popleft()
+            if len(self.recientes) >= self.max_por_minuto:
+                return False
+            self.recientes.append(ahora)
+            return True
+
+    def guardar(self, request, perfil):
+        ruta_limpia = re.sub(r"[^A-Za-z0-9]+", "_", request.path).strip("_") or "raiz"
+        nombre = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}_{request.method}_{ruta_limpia}"
+        stats = pstats.Stats(perfil)
+        stats.dump_stats(self.directorio / f"{nombre}.prof")
+        (self.directorio / f"{nombre}.txt").write_text(
+            "\n".join(pilas_colapsadas(stats)) + "\n", encoding="utf-8"
+        )
+        self.liberar_espacio()
+        return nombre
+
+    def liberar_espacio(self):
+        """Borra los perfiles más antiguos si el directorio supera el límite de disco"""
+        archivos = sorted(
+            (p for p in self.directorio.iterdir() if p.suffix in (".prof", ".txt")),
+            key=lambda p: p.stat().st_mtime,
+        )
+        total = sum(p.stat().st_size for p in archivos)
+        for archivo in archivos:
+            if total <= self.max_bytes:
+                break
+            total -= archivo.stat().st_size
+            archivo.unlink(missing_ok=True)
+
+
+def pilas_colapsadas(stats, profundidad_maxima=64):
+    """
+    Convierte el grafo llamador/llamado de pstats en pilas colapsadas
+    ("a;b;c microsegundos"), el formato que consume flamegraph.pl / speedscope.
+    cProfile no guarda pilas completas, así que el tiempo se reparte
+    proporcionalmente al tiempo acumulado de cada arista.
+    """
+    llamados = {}
+    for funcion, (_, _, _, _, llamadores) in stats.stats.items():
+        for llamador, (_, _, _, acumulado) in llamadores.items():
+            llamados.setdefault(llamador, []).append((funcion, acumulado))
+
+    def etiqueta(funcion):
+        archivo, linea, nombre = funcion
+        if archivo == "~":
+            return nombre
+        return f"{Path(archivo).name}:{linea}:{nombre}"
+
+    pilas = {}
+
+    def recorrer(funcion, camino, fraccion):
+        _, _, propio, acumulado, _ = stats.stats[funcion]
+        camino = camino + (etiqueta(funcion),)
+        valor = propio * fraccion
+        if valor > 0:
+            pilas[camino] = pilas.get(camino, 0) + valor
+        if len(camino) >= profundidad_maxima or acumulado <= 0:
+            return
+        for hijo, acumulado_arista in llamados.get(funcion, ()):
+            # Se descartan ciclos y ramas de menos de un microsegundo
+            if etiqueta(hijo) in camino or acumulado_arista * fraccion < 1e-6:
+                continue
+            hijo_acumulado = stats.stats[hijo][3]
+            if hijo_acumulado > 0:
+                recorrer(hijo, camino, fraccion * acumulado_arista / hijo_acumulado)
+
+    raices = [f for f, datos in stats.stats.items() if not datos[4]]
+    for raiz in raices:
+        recorrer(raiz, (), 1.0)
+
+    return [
+        f"{';'.join(camino)} {round(valor * 1e6)}"
+        for camino, valor in sorted(pilas.items())
+        if round(valor * 1e6) > 0
+    ]
+
+
+class FijarPrimariaMiddleware:
+    """
+    Después de una escritura autenticada con éxito, fija las lecturas del usuario
+    a la base primaria durante DATABASE_REPLICA_RETRASO segundos (read-your-writes).
+    Solo se activa cuando hay una réplica configurada.
+    """
+
+    METODOS_SEGUROS = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, get_response):
+        if "replica" not in settings.DATABASES:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in self.METODOS_SEGUROS and response.status_code < 400:
+            auth = getattr(request, "auth", None)
+            if isinstance(auth, dict):
+                fijar_primaria(auth.get("uid"))
+        return response
@@ -11,33 +11,17 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import importlib.util
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+from dotenv import load_dotenv
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-# Cargar variables de entorno desde .env si existe
-env_file = BASE_DIR / '.env'
-print(f"🔍 Buscando archivo de configuración: {env_file}")
-if env_file.exists():
-    print("✅ Archivo .env encontrado, cargando variables de entorno...")
-    with open(env_file) as f:
-        for line in f:
-            if line.strip() and not line.startswith('#'):
-                key, value = line.strip().split('=', 1)
-                os.environ.setdefault(key, value)
-                print(f"   📋 {key}=[CONFIGURADO]")
-    print(f"✅ Variables de entorno cargadas desde {env_file}")
-else:
-    print("⚠️ Archivo .env no encontrado, usando configuración por defecto")
-
-# Verificar configuración de base de datos
-database_url = os.getenv('DATABASE_URL')
-if database_url:
-    print(f"🗄️ Base de datos: PostgreSQL configurada")
-    print(f"   📋 DATABASE_URL={database_url[:50]}...")
-else:
-    print("🗄️ Base de datos: SQLite (por defecto)")
+# Cargar variables de entorno desde .env si existe (sin sobrescribir las del entorno)
+load_dotenv(BASE_DIR / '.env', override=False)
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-hv6qzft(ynu5te3iztmrw-fncg+su%o9ps-b0#j-0c^h0%)9y1'
@@ -62,6 +46,7 @@ CSRF_TRUSTED_ORIGINS = [
 # Application definition
 
 INSTALLED_APPS = [
+    'biblioteca_original',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -75,6 +60,7 @@ INSTALLED_APPS = [
     'genero_libro',
     'usuario',
     'acciones_usuario',
+    'sincronizacion',
 ]
 
 MIDDLEWARE = [
@@ -87,6 +73,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'ninja.compatibility.files.fix_request_files_middleware',
+    'biblioteca_original.middleware.PerfiladoMiddleware',
+    'biblioteca_original.middleware.FijarPrimariaMiddleware',
 ]
 
 ROOT_URLCONF = 'biblioteca_original.urls'
@@ -114,18 +102,98 @@ import dj_database_url
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Perfil de SQLite para concurrencia: WAL (lectores no bloquean al escritor),
+# synchronous=NORMAL, mmap, caché de páginas más grande y busy_timeout en cada
+# conexión nueva. Las transacciones empiezan con BEGIN IMMEDIATE para tomar el
+# bloqueo de escritura al inicio y evitar "database is locked" al promocionar.
+# SQLITE_PERFIL=basico deja SQLite con la configuración por defecto.
+SQLITE_PERFIL = os.getenv('SQLITE_PERFIL', 'concurrente')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_MMAP_MB = int(os.getenv('SQLITE_MMAP_MB', '256'))
+SQLITE_CACHE_MB = int(os.getenv('SQLITE_CACHE_MB', '64'))
+SQLITE_OPCIONES_CONCURRENTE = {
+    'init_command': ';'.join([
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}',
+        f'PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}',
+        f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}',
+        'PRAGMA temp_store=MEMORY',
+    ]),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+}
+
 # Configuración por defecto (SQLite)
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': dict(SQLITE_OPCIONES_CONCURRENTE) if SQLITE_PERFIL == 'concurrente' else {},
     }
 }
 
+# Conexiones persistentes y pool de conexiones
+# DB_POOL=true usa el pool nativo de Django 5.1+ (requiere psycopg 3: `pip install "psycopg[binary,pool]"`);
+# DB_PGBOUNCER=true se usa cuando las conexiones pasan por PgBouncer en modo transacción
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+DB_POOL = os.getenv('DB_POOL', 'False').lower() == 'true'
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '2'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'False').lower() == 'true'
+
+
+def configurar_postgres(url):
+    config = dj_database_url.parse(url, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=True)
+    if not config['ENGINE'].endswith('postgresql'):
+        return config
+    if DB_POOL:
+        if not (importlib.util.find_spec('psycopg') and importlib.util.find_spec('psycopg_pool')):
+            # Con psycopg2 Django no tiene pool y fallaría al conectar con un error poco claro
+            raise ImproperlyConfigured('DB_POOL=true requiere psycopg 3 con pool: pip install "psycopg[binary,pool]"')
+        # El pool de Django no admite conexiones persistentes
+        config['CONN_MAX_AGE'] = 0
+        config.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN,
+            'max_size': DB_POOL_MAX,
+            'timeout': DB_POOL_TIMEOUT,
+        }
+    if DB_PGBOUNCER:
+        config['DISABLE_SERVER_SIDE_CURSORS'] = True
+    return config
+
+
 # Configurar base de datos PostgreSQL si está disponible la DATABASE_URL
 database_url = os.getenv('DATABASE_URL')
 if database_url:
-    DATABASES['default'] = dj_database_url.config(default=database_url, conn_max_age=600)
+    DATABASES['default'] = configurar_postgres(database_url)
+
+# Réplica de solo lectura opcional. Para probar en local basta con apuntarla
+# a la misma base: DATABASE_REPLICA_URL=sqlite:///db.sqlite3
+# DATABASE_REPLICA_RETRASO: segundos que un usuario lee de la primaria tras escribir
+database_replica_url = os.getenv('DATABASE_REPLICA_URL')
+DATABASE_REPLICA_RETRASO = int(os.getenv('DATABASE_REPLICA_RETRASO', '5'))
+if database_replica_url:
+    DATABASES['replica'] = configurar_postgres(database_replica_url)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['biblioteca_original.db_router.ReplicaRouter']
+
+# Caché compartida entre workers si hay Redis; si no, caché en memoria del proceso
+redis_url = os.getenv('REDIS_URL')
+if redis_url:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': redis_url,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 
 # Password validation
@@ -194,4 +262,72 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-perfilar',
 ]
+
+# Perfilado bajo demanda (cProfile) de vistas lentas
+PERFILADO_ACTIVO = os.getenv('PERFILADO_ACTIVO', 'False').lower() == 'true'
+PERFILADO_DIR = os.getenv('PERFILADO_DIR', str(BASE_DIR / 'perfiles'))
+PERFILADO_TOKEN = os.getenv('PERFILADO_TOKEN', '')
+PERFILADO_MUESTREO = float(os.getenv('PERFILADO_MUESTREO', '0'))
+PERFILADO_MAX_POR_MINUTO = int(os.getenv('PERFILADO_MAX_POR_MINUTO', '6'))
+PERFILADO_MAX_MB = int(os.getenv('PERFILADO_MAX_MB', '200'))
+
+# Rankings de libros (tendencias con decaimiento exponencial y promedio bayesiano)
+RANKING_VIDA_MEDIA_HORAS = float(os.getenv('RANKING_VIDA_MEDIA_HORAS', '72'))
+RANKING_PESO_FAVORITO = float(os.getenv('RANKING_PESO_FAVORITO', '1'))
+RANKING_PESO_PROGRESO = float(os.getenv('RANKING_PESO_PROGRESO', '0.25'))
+RANKING_MEDIA_PREVIA = float(os.getenv('RANKING_MEDIA_PREVIA', '3'))
+RANKING_PESO_PREVIO = float(os.getenv('RANKING_PESO_PREVIO', '5'))
+
+# Buffer de escritura diferida del progreso de lectura
+PROGRESO_BUFFER_ACTIVO = os.getenv('PROGRESO_BUFFER_ACTIVO', 'True').lower() == 'true'
+PROGRESO_INTERVALO_MS = int(os.getenv('PROGRESO_INTERVALO_MS', '250'))
+PROGRESO_MAX_LOTE = int(os.getenv('PROGRESO_MAX_LOTE', '1000'))
+
+# Tamaño máximo de los endpoints por lotes
+ACCIONES_LOTE_MAX = int(os.getenv('ACCIONES_LOTE_MAX', '500'))
+LECTURA_LOTE_MAX = int(os.getenv('LECTURA_LOTE_MAX', '300'))
+
+# Sincronización incremental (/sync)
+SYNC_LIMITE = int(os.getenv('SYNC_LIMITE', '500'))
+SYNC_LIMITE_MAX = int(os.getenv('SYNC_LIMITE_MAX', '1000'))
+# Margen para no adelantar el cursor a filas de transacciones que aún no han confirmado
+SYNC_MARGEN_SEGUNDOS = float(os.getenv('SYNC_MARGEN_SEGUNDOS', '2'))
+# Días que se conservan las lápidas; cursores más antiguos deben sincronizar desde cero
+SYNC_RETENCION_DIAS = int(os.getenv('SYNC_RETENCION_DIAS', '30'))
+
+# Borrado de libros y usuarios: se marcan al instante y sus dependientes se purgan por lotes
+ELIMINACION_LOTE = int(os.getenv('ELIMINACION_LOTE', '1000'))
+ELIMINACION_EN_SEGUNDO_PLANO = os.getenv('ELIMINACION_EN_SEGUNDO_PLANO', 'True').lower() == 'true'
+
+# Autocompletado: cada cuántos segundos se releen cambios de otros procesos y tendencias
+AUTOCOMPLETADO_REFRESCO_S = float(os.getenv('AUTOCOMPLETADO_REFRESCO_S', '60'))
+
+# Paquetes de lectura sin conexión (/libro/{id}/bundle), guardados por huella de contenido
+PAQUETES_DIR = os.getenv('PAQUETES_DIR', str(BASE_DIR / 'cache' / 'paquetes'))
+
+# PDF: desde cuántas páginas se dibuja por tramos en un pool de procesos (0 = núcleos disponibles)
+PDF_PARALELO_MIN_PAGINAS = int(os.getenv('PDF_PARALELO_MIN_PAGINAS', '1000'))
+PDF_PAGINAS_POR_TRAMO = int(os.getenv('PDF_PAGINAS_POR_TRAMO', '250'))
+PDF_PROCESOS = int(os.getenv('PDF_PROCESOS', '0'))
+
+# Caché de lectura de GET /pagina/{id}: segundos que se conserva cada página
+PAGINA_CACHE_S = int(os.getenv('PAGINA_CACHE_S', '3600'))
+
+# Vuelo único (listado y detalle de libros): segundos que una entrada es fresca, durante
+# cuántos más se sirve obsoleta mientras se recalcula y cuánto se espera a otro proceso
+VUELO_FRESCO_S = int(os.getenv('VUELO_FRESCO_S', '30'))
+VUELO_OBSOLETO_S = int(os.getenv('VUELO_OBSOLETO_S', '60'))
+VUELO_ESPERA_S = int(os.getenv('VUELO_ESPERA_S', '60'))
+
+# Notificaciones en tiempo real (GET /sync/eventos, Server-Sent Events). "memoria" solo llega a las
+# conexiones del mismo proceso; con varios workers, "redis" o la ruta de una clase como Central
+EVENTOS_BACKEND = os.getenv('EVENTOS_BACKEND', 'redis' if redis_url else 'memoria')
+EVENTOS_REDIS_URL = os.getenv('EVENTOS_REDIS_URL', redis_url or '')
+# Segundos entre comentarios de latido para que proxies y clientes no cierren la conexión
+EVENTOS_LATIDO_S = float(os.getenv('EVENTOS_LATIDO_S', '25'))
+# Eventos pendientes por conexión; si se llena se avisa con "desbordado" para que use /sync
+EVENTOS_COLA_MAX = int(os.getenv('EVENTOS_COLA_MAX', '100'))
+# Libros a los que se suscribe una conexión como máximo
+EVENTOS_MAX_LIBROS = int(os.getenv('EVENTOS_MAX_LIBROS', '500'))
@@ -0,0 +1,191 @@
+"""
+Cálculos caros en vuelo único, con caché y stale-while-revalidate.
+
+Cuando se invalida algo muy pedido (el listado de libros, un libro popular, su PDF)
+todas las peticiones que llegan a la vez lo recalcularían. unico() hace que lo calcule
+una sola: los hilos del proceso esperan en un cerrojo local y los otros procesos en
+un cerrojo de la caché (cache.add, que caduca a los VUELO_ESPERA_S por si quien lo
+tiene muere), y todos reciben el resultado de la primera.
+
+obtener() además guarda el resultado en la caché. Cada entrada recuerda la versión
+de sus dependencias, nombres que invalidar() cambia cuando cambian los datos. Si una
+dependencia cambió o pasaron VUELO_FRESCO_S, durante VUELO_OBSOLETO_S se sigue
+sirviendo la entrada anterior mientras un solo hilo la recalcula en segundo plano.
+Los cambios que no se pueden mostrar tarde (un libro que se oculta o se borra) se
+invalidan con estricto=True: las entradas leídas antes ya no se sirven obsoletas.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+_locales = {}
+_lock_locales = threading.Lock()
+
+
+def _clave_cerrojo(clave):
+    return f"vuelo:cerrojo:{clave}"
+
+
+def _clave_valor(clave):
+    return f"vuelo:valor:{clave}"
+
+
+def _clave_version(dependencia):
+    return f"vuelo:version:{dependencia}"
+
+
+def _clave_estricto(dependencia):
+    return f"vuelo:estricto:{dependencia}"
+
+
+def _cerrojo_local(clave):
+    """Cerrojo del proceso para clave, con un contador de usos para poder soltarlo"""
+    with _lock_locales:
+        cerrojo, usos = _locales.get(clave, (None, 0))
+        cerrojo = cerrojo or threading.Lock()
+        _locales[clave] = (cerrojo, usos + 1)
+    return cerrojo
+
+
+def _soltar_local(clave):
+    with _lock_locales:
+        cerrojo, usos = _locales[clave]
+        if usos == 1:
+            del _locales[clave]
+        else:
+            _locales[clave] = (cerrojo, usos - 1)
+
+
+def _calcular_con_cerrojo(clave, calcular, token):
+    try:
+        return calcular()
+    finally:
+        if cache.get(_clave_cerrojo(clave)) == token:
+            cache.delete(_clave_cerrojo(clave))
+
+
+def unico(clave, calcular, listo, mientras=None):
+    """
+    Resultado de calcular(), calculado una sola vez entre todas las peticiones
+    simultáneas de clave. listo() devuelve el resultado si ya lo dejó otra petición,
+    o None. Si se pasa mientras (por ejemplo, la versión anterior), se devuelve en
+    lugar de esperar a que termine quien lo está calculando.
+    """
+    cerrojo = _cerrojo_local(clave)
+    try:
+        if not cerrojo.acquire(blocking=mientras is None):
+            return mientras
+        try:
+            resultado = listo()
+            if resultado is not None:
+                return resultado
+            token = uuid.uuid4().hex
+            if cache.add(_clave_cerrojo(clave), token, settings.VUELO_ESPERA_S):
+                return _calcular_con_cerrojo(clave, calcular, token)
+            if mientras is not None:
+                return mientras
+
+            # Lo calcula otro proceso: esperar su resultado
+            limite = time.monotonic() + settings.VUELO_ESPERA_S
+            pausa = 0.01
+            while time.monotonic() < limite:
+                time.sleep(pausa)
+                pausa = min(pausa * 2, 0.2)
+                resultado = listo()
+                if resultado is not None:
+                    return resultado
+                if cache.get(_clave_cerrojo(clave)) is None:
+                    # Terminó sin dejar resultado (error): se calcula aquí
+                    break
+            return calcular()
+        finally:
+            cerrojo.release()
+    finally:
+        _soltar_local(clave)
+
+
+def _guardar(clave, valor, versiones, leido):
+    cache.set(
+        _clave_valor(clave),
+        {"valor": valor, "versiones": versiones, "leido": leido, "calculado": time.time()},
+        settings.VUELO_FRESCO_S + settings.VUELO_OBSOLETO_S,
+    )
+    return valor
+
+
+def _refrescar(clave, calcular, versiones, leido):
+    """Recalcula en un hilo si nadie lo está haciendo ya"""
+    token = uuid.uuid4().hex
+    if not cache.add(_clave_cerrojo(clave), token, settings.VUELO_ESPERA_S):
+        return
+
+    def refrescar():
+        close_old_connections()
+        try:
+            _calcular_con_cerrojo(clave, lambda: _guardar(clave, calcular(), versiones, leido), token)
+        except Exception:
+            logger.exception("Error al refrescar %s", clave)
+        finally:
+            connection.close()
+
+    threading.Thread(target=refrescar, name=f"vuelo-{clave}", daemon=True).start()
+
+
+def obtener(clave, calcular, dependencias=(), obsoleto=True):
+    """
+    Valor de clave desde la caché, o calculado en vuelo único y guardado. calcular no
+    debe devolver None. Con obsoleto=False nunca se sirve una entrada obsoleta (por
+    ejemplo, para quien acaba de escribir y debe ver su cambio).
+    """
+    claves_version = [_clave_version(dependencia) for dependencia in dependencias]
+    claves_estricto = [_clave_estricto(dependencia) for dependencia in dependencias]
+    valores = cache.get_many([_clave_valor(clave), *claves_version, *claves_estricto])
+    entrada = valores.get(_clave_valor(clave))
+    # Las versiones se leen antes de calcular: un cambio durante el cálculo deja la entrada obsoleta
+    versiones = tuple(valores.get(c) for c in claves_version)
+    inicio = time.time()
+
+    if entrada:
+        if entrada["versiones"] == versiones and inicio < entrada["calculado"] + settings.VUELO_FRESCO_S:
+            return entrada["valor"]
+        # Desde cuándo es obsoleta: su caducidad o el último cambio de sus dependencias
+        cambios = [v for v, anterior in zip(versiones, entrada["versiones"]) if v != anterior]
+        if not cambios:
+            desde = entrada["calculado"] + settings.VUELO_FRESCO_S
+        else:
+            desde = 0 if None in cambios else max(cambios)
+        # Un cambio estricto posterior a su lectura: la entrada puede mostrar lo que ya no se debe
+        estricta = any(
+            valores.get(c) is not None and valores[c] >= entrada.get("leido", 0) for c in claves_estricto
+        )
+        if obsoleto and not estricta and inicio - desde < settings.VUELO_OBSOLETO_S:
+            _refrescar(clave, calcular, versiones, inicio)
+            return entrada["valor"]
+
+    def listo():
+        entrada = cache.get(_clave_valor(clave))
+        return entrada["valor"] if entrada and entrada["calculado"] >= inicio else None
+
+    return unico(clave, lambda: _guardar(clave, calcular(), versiones, inicio), listo)
+
+
+def invalidar(*dependencias, estricto=False):
+    """
+    Marca como obsoletas las entradas que dependen de estos nombres, al confirmarse la
+    transacción. Con estricto las entradas anteriores ya no se sirven mientras se recalculan.
+    """
+    def cambiar():
+        ahora = time.time()
+        valores = {_clave_version(dependencia): ahora for dependencia in dependencias}
+        if estricto:
+            valores.update({_clave_estricto(dependencia): ahora for dependencia in dependencias})
+        cache.set_many(valores, None)
+    transaction.on_commit(cambiar)
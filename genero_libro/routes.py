@@ -2,6 +2,8 @@ from typing import List
 from django.shortcuts import get_object_or_404
 from ninja import Router
 
+from biblioteca_original.db_router import lectura_en_replica
+
 from .models import Genero_libro
 from .schemas import GeneroLibroIn, GeneroLibroOut
 
@@ -10,6 +12,7 @@ router = Router(tags=["generos"])
 
 
 @router.get("/", response=List[GeneroLibroOut])
+@lectura_en_replica
 def list_generos(request):
     generos = Genero_libro.objects.all().order_by("id")
     return [
@@ -24,6 +27,7 @@ def list_generos(request):
 
 
 @router.get("/{genero_id}", response=GeneroLibroOut)
+@lectura_en_replica
 def get_genero(request, genero_id: int):
     g = get_object_or_404(Genero_libro, id=genero_id)
     return GeneroLibroOut(
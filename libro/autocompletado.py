@@ -0,0 +1,233 @@
+"""
+Índice en memoria para autocompletar títulos y autores.
+
+Cada título y cada nombre de autor se normaliza (sin acentos ni mayúsculas) y se
+guarda una entrada por cada palabra en la que empieza un sufijo: "El señor de los
+anillos" genera "el senor de los anillos", "senor de los anillos", ... "anillos".
+Las entradas forman una lista ordenada, así que los candidatos de un prefijo son un
+rango contiguo que se encuentra con bisect. Los candidatos se ordenan por la
+tendencia de EstadisticaLibro.
+
+El índice se construye en la primera búsqueda, las señales de Libro y Usuario lo
+mantienen al día en este proceso y cada AUTOCOMPLETADO_REFRESCO_S se releen los
+libros y usuarios con updated_at posterior (cambios hechos en otros procesos) y las
+tendencias. La relectura se hace en un hilo: mientras tanto se sigue sirviendo el
+índice que había, como las entradas obsoletas de vuelo_unico.
+"""
+import heapq
+import logging
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from usuario.models import Usuario
+from .models import EstadisticaLibro, Libro
+
+
+TITULO = "t"
+AUTOR = "a"
+# Límite de entradas que se recorren para prefijos muy cortos ("a", "e"...)
+MAX_CANDIDATOS = 20000
+# Resultados recientes; los prefijos cortos, los más caros, son también los más repetidos
+TAMANO_CACHE = 1024
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin acentos y con los espacios colapsados"""
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_acentos.casefold().split())
+
+
+def claves(texto: str):
+    palabras = normalizar(texto).split(" ")
+    return {" ".join(palabras[i:]) for i in range(len(palabras)) if palabras[i]}
+
+
+class IndicePrefijos:
+    def __init__(self):
+        self._entradas = []  # (clave, tipo, id) ordenadas
+        self._libros = {}  # libro_id -> [nombre, usuario_id, es_publico]
+        self._autores = {}  # usuario_id -> nombre_completo
+        self._libros_por_autor = {}  # usuario_id -> set(libro_id)
+        self._popularidad = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._construido = False
+        self._marca = None
+        self._ultimo_refresco = 0.0
+        self._refrescando = threading.Lock()
+
+    def _quitar_claves(self, texto, tipo, objeto_id):
+        for clave in claves(texto):
+            i = bisect_left(self._entradas, (clave, tipo, objeto_id))
+            if i < len(self._entradas) and self._entradas[i] == (clave, tipo, objeto_id):
+                del self._entradas[i]
+
+    def _poner_claves(self, texto, tipo, objeto_id):
+        for clave in claves(texto):
+            insort(self._entradas, (clave, tipo, objeto_id))
+
+    def _poner_libro(self, libro_id, nombre, usuario_id, es_publico, eliminado=False):
+        self._cache.clear()
+        anterior = self._libros.pop(libro_id, None)
+        if anterior:
+            self._quitar_claves(anterior[0], TITULO, libro_id)
+            self._libros_por_autor.get(anterior[1], set()).discard(libro_id)
+        if eliminado:
+            return
+        self._libros[libro_id] = [nombre, usuario_id, es_publico]
+        self._libros_por_autor.setdefault(usuario_id, set()).add(libro_id)
+        self._poner_claves(nombre, TITULO, libro_id)
+
+    def _poner_autor(self, usuario_id, nombre_completo, eliminado=False):
+        self._cache.clear()
+        anterior = self._autores.pop(usuario_id, None)
+        if anterior is not None:
+            self._quitar_claves(anterior, AUTOR, usuario_id)
+        if not eliminado:
+            self._autores[usuario_id] = nombre_completo
+            self._poner_claves(nombre_completo, AUTOR, usuario_id)
+
+    def construir(self):
+        libros = list(Libro.objects.values_list("id", "nombre", "usuario_id", "es_publico", "updated_at"))
+        autores = list(Usuario.objects.values_list("id", "nombre_completo", "updated_at"))
+        entradas = []
+        for libro_id, nombre, _, _, _ in libros:
+            entradas += [(clave, TITULO, libro_id) for clave in claves(nombre)]
+        for usuario_id, nombre_completo, _ in autores:
+            entradas += [(clave, AUTOR, usuario_id) for clave in claves(nombre_completo)]
+        entradas.sort()
+
+        libros_por_autor = {}
+        for libro_id, _, usuario_id, _, _ in libros:
+            libros_por_autor.setdefault(usuario_id, set()).add(libro_id)
+        marcas = [fila[-1] for fila in libros] + [fila[-1] for fila in autores]
+        popularidad = dict(EstadisticaLibro.objects.values_list("libro_id", "tendencia"))
+
+        with self._lock:
+            self._entradas = entradas
+            self._libros = {libro_id: [nombre, usuario_id, es_publico] for libro_id, nombre, usuario_id, es_publico, _ in libros}
+            self._autores = {usuario_id: nombre_completo for usuario_id, nombre_completo, _ in autores}
+            self._libros_por_autor = libros_por_autor
+            self._cache.clear()
+            self._marca = max(marcas) if marcas else None
+            self._popularidad = popularidad
+            self._ultimo_refresco = time.monotonic()
+            self._construido = True
+
+    def refrescar(self):
+        """Aplica los cambios hechos desde la última lectura (también los de otros procesos)"""
+        filtro = {"updated_at__gte": self._marca} if self._marca else {}
+        libros = list(Libro.todos.filter(**filtro).values_list(
+            "id", "nombre", "usuario_id", "es_publico", "eliminado_en", "updated_at",
+        ))
+        autores = list(Usuario.todos.filter(**filtro).values_list("id", "nombre_completo", "eliminado_en", "updated_at"))
+        marcas = [fila[-1] for fila in libros] + [fila[-1] for fila in autores]
+        popularidad = dict(EstadisticaLibro.objects.values_list("libro_id", "tendencia"))
+        with self._lock:
+            for libro_id, nombre, usuario_id, es_publico, eliminado_en, _ in libros:
+                self._poner_libro(libro_id, nombre, usuario_id, es_publico, eliminado=eliminado_en is not None)
+            for usuario_id, nombre_completo, eliminado_en, _ in autores:
+                self._poner_autor(usuario_id, nombre_completo, eliminado=eliminado_en is not None)
+            if marcas:
+                self._marca = max(marcas + ([self._marca] if self._marca else []))
+            self._popularidad = popularidad
+            self._cache.clear()
+            self._ultimo_refresco = time.monotonic()
+
+    def actualizar_libro(self, libro):
+        if self._construido:
+            with self._lock:
+                self._poner_libro(libro.id, libro.nombre, libro.usuario_id, libro.es_publico)
+
+    def actualizar_autor(self, usuario):
+        if self._construido:
+            with self._lock:
+                self._poner_autor(usuario.id, usuario.nombre_completo)
+
+    def quitar_libros(self, libro_ids):
+        if self._construido:
+            with self._lock:
+                for libro_id in libro_ids:
+                    self._poner_libro(libro_id, None, None, False, eliminado=True)
+
+    def quitar_autor(self, usuario_id):
+        if self._construido:
+            with self._lock:
+                self._poner_autor(usuario_id, None, eliminado=True)
+
+    def _preparar(self):
+        if not self._construido:
+            with _lock_construccion:
+                if not self._construido:
+                    self.construir()
+        elif (
+            time.monotonic() - self._ultimo_refresco > settings.AUTOCOMPLETADO_REFRESCO_S
+            and self._refrescando.acquire(blocking=False)
+        ):
+            threading.Thread(target=self._refrescar_en_hilo, name="autocompletado", daemon=True).start()
+
+    def _refrescar_en_hilo(self):
+        close_old_connections()
+        try:
+            self.refrescar()
+        except Exception:
+            # Se reintenta en la siguiente búsqueda pasado el intervalo
+            logger.exception("Error al refrescar el índice de autocompletado")
+            self._ultimo_refresco = time.monotonic()
+        finally:
+            self._refrescando.release()
+            connection.close()
+
+    def buscar(self, texto: str, limit: int = 10):
+        """Devuelve hasta limit tuplas (libro_id, nombre, usuario_id, coincide) de libros públicos"""
+        prefijo = normalizar(texto)
+        if not prefijo:
+            return []
+        self._preparar()
+
+        with self._lock:
+            clave_cache = (prefijo, limit)
+            if clave_cache in self._cache:
+                self._cache.move_to_end(clave_cache)
+                return self._cache[clave_cache]
+
+            coincidencias = {}
+            i = bisect_left(self._entradas, (prefijo,))
+            fin = min(len(self._entradas), i + MAX_CANDIDATOS)
+            while i < fin and self._entradas[i][0].startswith(prefijo):
+                _, tipo, objeto_id = self._entradas[i]
+                if tipo == TITULO:
+                    coincidencias[objeto_id] = "titulo"
+                else:
+                    for libro_id in self._libros_por_autor.get(objeto_id, ()):
+                        coincidencias.setdefault(libro_id, "autor")
+                i += 1
+            candidatos = [
+                (self._popularidad.get(libro_id, 0.0), -libro_id, libro_id, coincide)
+                for libro_id, coincide in coincidencias.items()
+                if libro_id in self._libros and self._libros[libro_id][2]
+            ]
+            resultado = [
+                (libro_id, self._libros[libro_id][0], self._libros[libro_id][1], coincide)
+                for _, _, libro_id, coincide in heapq.nlargest(limit, candidatos)
+            ]
+            self._cache[clave_cache] = resultado
+            if len(self._cache) > TAMANO_CACHE:
+                self._cache.popitem(last=False)
+        return resultado
+
+    def nombre_autor(self, usuario_id):
+        return self._autores.get(usuario_id)
+
+
+_lock_construccion = threading.Lock()
+indice = IndicePrefijos()
@@ -0,0 +1,173 @@
+"""
+Exportación EPUB 3 en streaming.
+
+El contenedor zip se escribe sobre un destino sin posicionamiento (_Tubo), así que
+zipfile usa descriptores de datos y no necesita volver atrás: cada página se lee por
+bloques, se convierte en su propio XHTML, se comprime y se entrega en cuanto hay
+BYTES_POR_ENVIO acumulados. En memoria solo queda la lista de páginas (nombre de
+archivo y título) para escribir al final content.opf y nav.xhtml, que pueden ir
+en cualquier posición del zip; mimetype sí debe ir primero y sin comprimir.
+"""
+import io
+import re
+import zipfile
+from datetime import timezone
+from xml.sax.saxutils import escape, quoteattr
+
+from pagina.models import Pagina
+from .paquete import PAGINAS_POR_LECTURA, huella, miniatura
+
+
+# Cambiarlo invalida los EPUB ya guardados en caché
+FORMATO = 1
+BYTES_POR_ENVIO = 256 * 1024
+LADO_PORTADA = 1600
+_NO_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+CONTENEDOR = """<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+ESTILO = """body { font-family: serif; line-height: 1.5; margin: 0 5%; }
+h1, h2 { text-align: center; }
+p { margin: 0 0 0.6em; text-indent: 1.2em; }
+.autor { text-align: center; font-style: italic; text-indent: 0; }
+.portada { text-align: center; }
+.portada img { max-width: 100%; max-height: 100%; }
+"""
+
+
+def huella_epub(libro):
+    return huella(libro, formato=("epub", FORMATO))
+
+
+def _texto(valor):
+    return escape(_NO_XML.sub("", valor or ""))
+
+
+def _xhtml(titulo, cuerpo, raiz=""):
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        "<!DOCTYPE html>\n"
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="es" xml:lang="es">\n'
+        f'<head><meta charset="utf-8"/><title>{_texto(titulo)}</title>'
+        f'<link rel="stylesheet" type="text/css" href="{raiz}estilo.css"/></head>\n'
+        f"<body>\n{cuerpo}\n</body>\n</html>\n"
+    )
+
+
+def _pagina_xhtml(titulo, contenido):
+    parrafos = "\n".join(f"<p>{_texto(linea)}</p>" for linea in contenido.split("\n") if linea.strip())
+    return _xhtml(titulo, f'<section epub:type="chapter">\n<h2>{_texto(titulo)}</h2>\n{parrafos}\n</section>', "../")
+
+
+class _Tubo(io.RawIOBase):
+    """Destino del zip que no admite seek: acumula lo escrito hasta que el generador lo entrega"""
+
+    def __init__(self):
+        self._partes = []
+        self.pendiente = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self.pendiente += len(datos)
+        return len(datos)
+
+    def vaciar(self):
+        datos = b"".join(self._partes)
+        self._partes = []
+        self.pendiente = 0
+        return datos
+
+
+def generar_epub(libro, huella_libro):
+    """
+    Genera el EPUB del libro como una secuencia de bloques de bytes.
+    libro debe venir con select_related("genero", "usuario").
+    """
+    tubo = _Tubo()
+    zf = zipfile.ZipFile(tubo, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6)
+
+    # mimetype: primera entrada, sin comprimir y sin campo extra (lo exige OCF)
+    zf.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+    zf.writestr("META-INF/container.xml", CONTENEDOR)
+    zf.writestr("OEBPS/estilo.css", ESTILO)
+
+    autor = libro.usuario.nombre_completo
+    spine = []
+    portada = miniatura(libro, lado=LADO_PORTADA)
+    if portada:
+        zf.writestr("OEBPS/portada.jpg", portada, compress_type=zipfile.ZIP_STORED)
+        zf.writestr("OEBPS/portada.xhtml", _xhtml(
+            libro.nombre, f'<div class="portada"><img src="portada.jpg" alt={quoteattr(_NO_XML.sub("", libro.nombre))}/></div>',
+        ))
+        spine.append("portada")
+    zf.writestr("OEBPS/titulo.xhtml", _xhtml(
+        libro.nombre, f'<h1>{_texto(libro.nombre)}</h1>\n<p class="autor">{_texto(autor)}</p>',
+    ))
+    spine.append("titulo")
+    yield tubo.vaciar()
+
+    indice = []
+    modificado = libro.updated_at
+    paginas = (
+        Pagina.objects.filter(libro_id=libro.id)
+        .order_by("id")
+        .values_list("titulo", "contenido", "updated_at")
+        .iterator(chunk_size=PAGINAS_POR_LECTURA)
+    )
+    for numero, (titulo, contenido, updated_at) in enumerate(paginas, start=1):
+        titulo = titulo or f"Página {numero}"
+        archivo = f"paginas/p{numero:05d}.xhtml"
+        zf.writestr(f"OEBPS/{archivo}", _pagina_xhtml(titulo, contenido))
+        indice.append((f"p{numero:05d}", archivo, titulo))
+        modificado = max(modificado, updated_at)
+        if tubo.pendiente >= BYTES_POR_ENVIO:
+            yield tubo.vaciar()
+
+    enlaces = "\n".join(f'<li><a href="{archivo}">{_texto(titulo)}</a></li>' for _, archivo, titulo in indice)
+    zf.writestr("OEBPS/nav.xhtml", _xhtml(
+        libro.nombre,
+        f'<nav epub:type="toc" id="toc"><h1>Índice</h1>\n<ol>\n<li><a href="titulo.xhtml">{_texto(libro.nombre)}</a></li>\n'
+        f"{enlaces}\n</ol></nav>",
+    ))
+
+    manifiesto = [
+        '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>',
+        '<item id="estilo" href="estilo.css" media-type="text/css"/>',
+        '<item id="titulo" href="titulo.xhtml" media-type="application/xhtml+xml"/>',
+    ]
+    if portada:
+        manifiesto += [
+            '<item id="portada-img" href="portada.jpg" media-type="image/jpeg" properties="cover-image"/>',
+            '<item id="portada" href="portada.xhtml" media-type="application/xhtml+xml"/>',
+        ]
+    manifiesto += [f'<item id="{id_}" href="{archivo}" media-type="application/xhtml+xml"/>' for id_, archivo, _ in indice]
+    spine += [id_ for id_, _, _ in indice]
+    genero = f"\n    <dc:subject>{_texto(libro.genero.genero)}</dc:subject>" if libro.genero_id else ""
+    modificado = modificado.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    zf.writestr("OEBPS/content.opf", (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid" xml:lang="es">\n'
+        '  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+        f'    <dc:identifier id="uid">urn:biblioteca:libro:{libro.id}:{huella_libro}</dc:identifier>\n'
+        f"    <dc:title>{_texto(libro.nombre)}</dc:title>\n"
+        f"    <dc:creator>{_texto(autor)}</dc:creator>\n"
+        f"    <dc:language>es</dc:language>{genero}\n"
+        f'    <meta property="dcterms:modified">{modificado}</meta>\n'
+        + ('    <meta name="cover" content="portada-img"/>\n' if portada else "")
+        + "  </metadata>\n"
+        "  <manifest>\n    " + "\n    ".join(manifiesto) + "\n  </manifest>\n"
+        '  <spine>\n    ' + "\n    ".join(f'<itemref idref="{id_}"/>' for id_ in spine) + "\n  </spine>\n"
+        "</package>\n"
+    ))
+    zf.close()
+    yield tubo.vaciar()
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from libro.rankings import compactar
+
+
+class Command(BaseCommand):
+    help = "Recalcula las estadísticas de ranking desde cero y descarta eventos ya decaídos"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--horizonte", type=int, default=10,
+            help="Vidas medias hacia atrás que se tienen en cuenta para la tendencia",
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        total = compactar(horizonte_vidas_medias=options["horizonte"])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total} libros compactados en {time.perf_counter() - inicio:.2f} s"
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from libro.recomendaciones import recalcular_similares
+
+
+class Command(BaseCommand):
+    help = "Recalcula la tabla de libros similares a partir de favoritos y calificaciones"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=20, help="Vecinos guardados por libro")
+        parser.add_argument("--min-comun", type=int, default=1, help="Lectores en común mínimos por par")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        total = recalcular_similares(top_k=options["top_k"], min_comun=options["min_comun"])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total} vecinos guardados en {time.perf_counter() - inicio:.2f} s"
+        ))
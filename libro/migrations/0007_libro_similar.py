@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libro', '0006_libro_es_publico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibroSimilar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('puntuacion', models.FloatField()),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similares', to='libro.libro')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='libro.libro')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['libro', '-puntuacion'], name='libro_similar_libro_punt_idx')],
+            },
+        ),
+    ]
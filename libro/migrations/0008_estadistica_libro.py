@@ -0,0 +1,64 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+# Promedio bayesiano con los valores por defecto de RANKING_MEDIA_PREVIA y RANKING_PESO_PREVIO
+# de esta versión, copiados aquí para que la migración no dependa del código actual;
+# compactar_rankings lo recalcula con la configuración vigente
+MEDIA_PREVIA = 3.0
+PESO_PREVIO = 5.0
+
+
+def crear_estadisticas(apps, schema_editor):
+    Libro = apps.get_model('libro', 'Libro')
+    EstadisticaLibro = apps.get_model('libro', 'EstadisticaLibro')
+    Acciones_usuario = apps.get_model('acciones_usuario', 'Acciones_usuario')
+    # Las calificaciones ya existentes, para que los mejor valorados no empiecen vacíos
+    calificaciones = {
+        fila['libro_id']: (fila['suma'], fila['num'])
+        for fila in Acciones_usuario.objects.filter(calificacion__gt=0)
+        .values('libro_id')
+        .annotate(suma=Sum('calificacion'), num=Count('id'))
+    }
+    filas = []
+    for libro_id, genero_id, es_publico in Libro.objects.values_list('id', 'genero_id', 'es_publico'):
+        suma, num = calificaciones.get(libro_id, (0, 0))
+        filas.append(EstadisticaLibro(
+            libro_id=libro_id, genero_id=genero_id, es_publico=es_publico,
+            suma_calificaciones=suma, num_calificaciones=num,
+            bayesiana=(PESO_PREVIO * MEDIA_PREVIA + suma) / (PESO_PREVIO + num) if num else 0.0,
+        ))
+    EstadisticaLibro.objects.bulk_create(filas, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acciones_usuario', '0002_alter_acciones_usuario_ultima_pagina_leida'),
+        ('genero_libro', '0001_initial'),
+        ('libro', '0007_libro_similar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaLibro',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('libro', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estadistica', serialize=False, to='libro.libro')),
+                ('es_publico', models.BooleanField(default=True)),
+                ('tendencia', models.FloatField(default=0)),
+                ('suma_calificaciones', models.IntegerField(default=0)),
+                ('num_calificaciones', models.IntegerField(default=0)),
+                ('bayesiana', models.FloatField(default=0)),
+                ('genero', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='genero_libro.genero_libro')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['es_publico', '-tendencia'], name='estadistica_tendencia_idx'), models.Index(fields=['es_publico', 'genero', '-tendencia'], name='estadistica_gen_tend_idx'), models.Index(fields=['es_publico', '-bayesiana'], name='estadistica_bayesiana_idx'), models.Index(fields=['es_publico', 'genero', '-bayesiana'], name='estadistica_gen_bayes_idx')],
+            },
+        ),
+        migrations.RunPython(crear_estadisticas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('genero_libro', '0001_initial'),
+        ('libro', '0008_estadistica_libro'),
+        ('usuario', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['updated_at', 'id'], name='libro_sync_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+# Solo PostgreSQL: índices trigram para el icontains de respaldo del autocompletado.
+# Django compila icontains como UPPER(columna::text) LIKE UPPER(...), así que se indexa esa expresión.
+INDICES = [
+    ('libro_nombre_trgm_idx', 'libro_libro', 'nombre'),
+    ('usuario_nombre_completo_trgm_idx', 'usuario_usuario', 'nombre_completo'),
+]
+
+
+def crear_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for nombre, tabla, columna in INDICES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} USING gin ((UPPER({columna}::text)) gin_trgm_ops)'
+        )
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre, _, _ in INDICES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libro', '0010_libro_eliminado_en'),
+        ('usuario', '0002_usuario_eliminado_en'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
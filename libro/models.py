@@ -3,6 +3,12 @@ from base.models import Base
 from genero_libro.models import Genero_libro
 from usuario.models import Usuario
 
+class LibroManager(models.Manager):
+    """Oculta los libros marcados como eliminados mientras se purgan en segundo plano"""
+    def get_queryset(self):
+        return super().get_queryset().filter(eliminado_en__isnull=True)
+
+
 # Create your models here.
 class Libro(Base):
     nombre=models.CharField(max_length=100)
@@ -11,4 +17,49 @@ class Libro(Base):
     color_portada=models.CharField(max_length=20,default="sin color")
     imagen_portada=models.ImageField(upload_to='libros/portadas', null=True, blank=True)
     usuario=models.ForeignKey(Usuario, on_delete=models.PROTECT)
-    es_publico=models.BooleanField(default=True)
\ No newline at end of file
+    es_publico=models.BooleanField(default=True)
+    eliminado_en=models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = LibroManager()
+    todos = models.Manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at', 'id'], name='libro_sync_idx')]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Guarda la visibilidad leída para saber al guardar si cambió, sin volver a consultarla
+        instancia = super().from_db(db, field_names, values)
+        instancia._es_publico_original = instancia.__dict__.get('es_publico')
+        return instancia
+
+class LibroSimilar(Base):
+    """Vecinos precalculados por recalcular_similares ("quienes leyeron esto también leyeron")"""
+    libro=models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='similares')
+    similar=models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='+')
+    puntuacion=models.FloatField()
+
+    class Meta:
+        indexes = [models.Index(fields=['libro', '-puntuacion'], name='libro_similar_libro_punt_idx')]
+
+
+class EstadisticaLibro(Base):
+    """
+    Contadores de ranking mantenidos de forma incremental (ver libro/rankings.py).
+    genero y es_publico se copian del libro para que cada ranking sea una lectura por índice.
+    """
+    libro=models.OneToOneField(Libro, on_delete=models.CASCADE, primary_key=True, related_name='estadistica')
+    genero=models.ForeignKey(Genero_libro, on_delete=models.SET_NULL, null=True, related_name='+')
+    es_publico=models.BooleanField(default=True)
+    tendencia=models.FloatField(default=0)
+    suma_calificaciones=models.IntegerField(default=0)
+    num_calificaciones=models.IntegerField(default=0)
+    bayesiana=models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['es_publico', '-tendencia'], name='estadistica_tendencia_idx'),
+            models.Index(fields=['es_publico', 'genero', '-tendencia'], name='estadistica_gen_tend_idx'),
+            models.Index(fields=['es_publico', '-bayesiana'], name='estadistica_bayesiana_idx'),
+            models.Index(fields=['es_publico', 'genero', '-bayesiana'], name='estadistica_gen_bayes_idx'),
+        ]
@@ -0,0 +1,181 @@
+"""
+Paquete de lectura sin conexión: un zip con los datos del libro (libro.json), todas
+sus páginas en orden (paginas.jsonl, una por línea) y la miniatura de la portada.
+
+Se genera leyendo las páginas por bloques y se guarda en PAQUETES_DIR con la huella
+del contenido en el nombre. Mientras el libro no cambie, las descargas siguientes
+sirven ese mismo archivo y la huella hace de ETag. La exportación EPUB (epub.py)
+usa la misma huella y el mismo directorio.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+
+from pagina.models import Pagina
+
+
+# Cambiarlo invalida los paquetes ya generados (por ejemplo, si cambia su estructura)
+FORMATO = 1
+PAGINAS_POR_LECTURA = 500
+LADO_MINIATURA = 600
+
+
+def huella(libro, formato=("zip", FORMATO)):
+    """
+    Huella de un archivo exportado del libro: cambia con el formato, el libro, su autor,
+    su género o cualquiera de sus páginas. Devuelve (huella, total_paginas).
+    """
+    paginas = Pagina.objects.filter(libro_id=libro.id).aggregate(total=Count("id"), ultima=Max("updated_at"))
+    partes = [
+        *formato, libro.id, libro.updated_at, libro.nombre, libro.usuario.nombre_completo,
+        libro.genero.genero if libro.genero_id else None, libro.imagen_portada.name or None,
+        paginas["total"], paginas["ultima"],
+    ]
+    return hashlib.sha256(json.dumps(partes, cls=DjangoJSONEncoder).encode()).hexdigest()[:32], paginas["total"]
+
+
+def ruta_en_cache(libro_id, huella_libro, extension):
+    directorio = Path(settings.PAQUETES_DIR)
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio / f"{libro_id}-{huella_libro}.{extension}"
+
+
+def temporal_en_cache(ruta):
+    """Archivo temporal junto a ruta (descriptor, nombre) para escribirlo y renombrarlo al terminar"""
+    return tempfile.mkstemp(prefix=f".{ruta.stem}-", suffix=ruta.suffix, dir=ruta.parent)
+
+
+def copiar_a_cache(partes, ruta):
+    """
+    Entrega las partes tal cual y a la vez las guarda en ruta. Si la generación no
+    llega al final (error o cliente desconectado) no queda nada en la caché.
+    """
+    descriptor, temporal = temporal_en_cache(ruta)
+    completo = False
+    try:
+        with os.fdopen(descriptor, "wb") as copia:
+            for parte in partes:
+                copia.write(parte)
+                yield parte
+        os.replace(temporal, ruta)
+        completo = True
+    finally:
+        if not completo:
+            Path(temporal).unlink(missing_ok=True)
+    limpiar_anteriores(ruta)
+
+
+def limpiar_anteriores(ruta):
+    """Borra las versiones anteriores del mismo libro y formato: ya no se volverán a servir"""
+    libro_id = ruta.name.split("-", 1)[0]
+    for anterior in ruta.parent.glob(f"{libro_id}-*{ruta.suffix}"):
+        if anterior != ruta:
+            anterior.unlink(missing_ok=True)
+
+
+def ultimo_en_cache(libro_id, extension):
+    """Archivo más reciente del libro en ese formato, cualquiera que sea su huella, o None"""
+    directorio = Path(settings.PAQUETES_DIR)
+    if not directorio.is_dir():
+        return None
+    recientes = []
+    for ruta in directorio.glob(f"{libro_id}-*.{extension}"):
+        try:
+            recientes.append((ruta.stat().st_mtime, ruta))
+        except FileNotFoundError:
+            continue
+    return max(recientes)[1] if recientes else None
+
+
+def miniatura(libro, lado=LADO_MINIATURA):
+    """JPEG reducido de la portada, o None si el libro no tiene o no se puede leer"""
+    if not libro.imagen_portada:
+        return None
+    # Pillow se importa aquí para no cargarlo en el arranque de cada worker
+    from PIL import Image
+
+    try:
+        with libro.imagen_portada.open("rb") as archivo, Image.open(archivo) as imagen:
+            imagen = imagen.convert("RGB")
+            imagen.thumbnail((lado, lado))
+            salida = io.BytesIO()
+            imagen.save(salida, format="JPEG", quality=80, optimize=True)
+            return salida.getvalue()
+    except (OSError, ValueError):
+        return None
+
+
+def _escribir(destino, libro, huella_libro, total_paginas):
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        metadatos = {
+            "formato": FORMATO,
+            "huella": huella_libro,
+            "id": libro.id,
+            "nombre": libro.nombre,
+            "version": libro.version,
+            "genero_id": libro.genero_id,
+            "genero": libro.genero.genero if libro.genero_id else None,
+            "color_portada": libro.color_portada,
+            "es_publico": libro.es_publico,
+            "usuario_id": libro.usuario_id,
+            "autor": libro.usuario.nombre_completo,
+            "total_paginas": total_paginas,
+            "created_at": libro.created_at,
+            "updated_at": libro.updated_at,
+        }
+        portada = miniatura(libro)
+        if portada:
+            metadatos["portada"] = "portada.jpg"
+            # Un JPEG ya va comprimido
+            zf.writestr("portada.jpg", portada, compress_type=zipfile.ZIP_STORED)
+        zf.writestr("libro.json", json.dumps(metadatos, cls=DjangoJSONEncoder, ensure_ascii=False, indent=2))
+
+        paginas = (
+            Pagina.objects.filter(libro_id=libro.id)
+            .order_by("id")
+            .values("id", "titulo", "tipo", "contenido", "updated_at")
+            .iterator(chunk_size=PAGINAS_POR_LECTURA)
+        )
+        with zf.open("paginas.jsonl", "w", force_zip64=True) as salida:
+            for numero, pagina in enumerate(paginas, start=1):
+                pagina["numero"] = numero
+                salida.write(json.dumps(pagina, cls=DjangoJSONEncoder, ensure_ascii=False).encode())
+                salida.write(b"\n")
+
+
+def obtener_paquete(libro):
+    """
+    Devuelve (ruta, huella) del paquete del libro, generándolo si no existe ya uno con
+    la misma huella. libro debe venir con select_related("genero", "usuario").
+    """
+    huella_libro, total_paginas = huella(libro)
+    ruta = ruta_en_cache(libro.id, huella_libro, "zip")
+    if ruta.exists():
+        return ruta, huella_libro
+
+    # Se escribe en un temporal del mismo directorio y se renombra: nadie ve un zip a medias
+    descriptor, temporal = temporal_en_cache(ruta)
+    try:
+        with os.fdopen(descriptor, "wb") as destino:
+            _escribir(destino, libro, huella_libro, total_paginas)
+        os.replace(temporal, ruta)
+    except BaseException:
+        Path(temporal).unlink(missing_ok=True)
+        raise
+    limpiar_anteriores(ruta)
+    return ruta, huella_libro
+
+
+def borrar_paquetes(libro_id):
+    directorio = Path(settings.PAQUETES_DIR)
+    if directorio.is_dir():
+        for ruta in directorio.glob(f"{libro_id}-*.*"):
+            ruta.unlink(missing_ok=True)
@@ -0,0 +1,186 @@
+"""
+Exportación PDF del libro.
+
+Los libros pequeños se dibujan en un único canvas de ReportLab. A partir de
+PDF_PARALELO_MIN_PAGINAS las páginas se leen por tramos de PDF_PAGINAS_POR_TRAMO,
+cada tramo se dibuja en un proceso del pool y los PDF parciales se unen en orden
+con pypdf, añadiendo el índice (marcadores) con la posición de cada página.
+
+renderizar_tramo no usa Django (los modelos se importan dentro de las funciones
+que leen), así que los procesos del pool no necesitan configurar el proyecto ni
+abrir conexiones a la base de datos.
+"""
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+
+# Cambiarlo invalida los PDF ya guardados en caché
+FORMATO = 1
+ALTO_INICIAL = 750
+PAGINAS_POR_LECTURA = 500
+
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def renderizar_tramo(paginas, cabecera=None, primera=1):
+    """
+    Dibuja las páginas [(titulo, contenido), ...] en un PDF y devuelve (bytes, marcas),
+    donde marcas es [(titulo, indice_de_pagina_pdf)] de cada página del libro.
+    cabecera, si se indica, es (nombre, autor) para la primera página; primera es el
+    número en el libro de la primera página del tramo.
+    """
+    # ReportLab se importa aquí para no cargarlo en el arranque de cada worker
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    y = ALTO_INICIAL
+    pagina_pdf = 0
+    marcas = []
+
+    if cabecera:
+        nombre, autor = cabecera
+        p.drawString(100, y, f"Libro: {nombre}")
+        y -= 30
+        p.drawString(100, y, f"Autor: {autor}")
+        y -= 30
+
+    for numero, (titulo, contenido) in enumerate(paginas, start=primera):
+        # Si queda poco espacio, pasar a nueva página del PDF
+        if y < 100:
+            p.showPage()
+            pagina_pdf += 1
+            y = ALTO_INICIAL
+        marca = titulo or f"Página {numero}"
+        marcas.append((marca, pagina_pdf))
+        p.bookmarkPage(f"p{numero}")
+        p.addOutlineEntry(marca, f"p{numero}", level=0)
+
+        if titulo:
+            p.drawString(100, y, f"Página: {titulo}")
+            y -= 20
+
+        for line in contenido.split('\n'):
+            if y < 50:
+                p.showPage()
+                pagina_pdf += 1
+                y = ALTO_INICIAL
+            p.drawString(100, y, line)
+            y -= 15
+
+        # Cada página del libro termina su página del PDF
+        p.showPage()
+        pagina_pdf += 1
+        y = ALTO_INICIAL
+
+    p.save()
+    return buffer.getvalue(), marcas
+
+
+def crear_pool(procesos):
+    # spawn: los procesos no heredan hilos ni conexiones del proceso web
+    return ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _obtener_pool():
+    """Pool compartido por todo el proceso, de procesos_pdf() procesos"""
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            _pool = crear_pool(procesos_pdf())
+        return _pool
+
+
+def _descartar_pool(pool):
+    """Quita un pool roto (murió un proceso, p. ej. por falta de memoria) para crear otro"""
+    global _pool
+    with _lock_pool:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def procesos_pdf():
+    """PDF_PROCESOS, o los núcleos disponibles para este proceso si es 0"""
+    if settings.PDF_PROCESOS:
+        return settings.PDF_PROCESOS
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _unir(partes):
+    """Une los PDF parciales en orden y crea un marcador por cada página del libro"""
+    # pypdf solo hace falta para los libros grandes
+    from pypdf import PdfReader, PdfWriter
+
+    escritor = PdfWriter()
+    desplazamiento = 0
+    marcas = []
+    for contenido, marcas_tramo in partes:
+        lector = PdfReader(io.BytesIO(contenido))
+        escritor.append(lector, import_outline=False)
+        marcas += [(titulo, desplazamiento + indice) for titulo, indice in marcas_tramo]
+        desplazamiento += len(lector.pages)
+    for titulo, indice in marcas:
+        escritor.add_outline_item(titulo, indice)
+    salida = io.BytesIO()
+    escritor.write(salida)
+    return salida.getvalue()
+
+
+def _tramos(libro_id, tamano):
+    from pagina.models import Pagina
+
+    tramo = []
+    paginas = (
+        Pagina.objects.filter(libro_id=libro_id)
+        .order_by("id")
+        .values_list("titulo", "contenido")
+        .iterator(chunk_size=tamano)
+    )
+    for pagina in paginas:
+        tramo.append(pagina)
+        if len(tramo) == tamano:
+            yield tramo
+            tramo = []
+    if tramo:
+        yield tramo
+
+
+def generar_pdf(libro, total_paginas, pool=None):
+    """
+    PDF completo del libro; libro debe venir con select_related("usuario").
+    pool es un pool propio del llamador (de crear_pool), que lo cierra él; por defecto
+    se usa el compartido.
+    """
+    cabecera = (libro.nombre, libro.usuario.nombre_completo)
+    if total_paginas < settings.PDF_PARALELO_MIN_PAGINAS or (pool is None and procesos_pdf() < 2):
+        paginas = [pagina for tramo in _tramos(libro.id, PAGINAS_POR_LECTURA) for pagina in tramo]
+        return renderizar_tramo(paginas, cabecera)[0]
+
+    tamano = settings.PDF_PAGINAS_POR_TRAMO
+    for intento in range(2):
+        actual = pool or _obtener_pool()
+        try:
+            # Los tramos se encargan según se leen; el orden lo dan los futuros, no su finalización
+            futuros = [
+                actual.submit(renderizar_tramo, tramo, cabecera if i == 0 else None, i * tamano + 1)
+                for i, tramo in enumerate(_tramos(libro.id, tamano))
+            ]
+            return _unir(futuro.result() for futuro in futuros)
+        except BrokenProcessPool:
+            if pool is not None:
+                raise
+            # Un pool roto no vuelve a funcionar: se sustituye y se reintenta una vez
+            _descartar_pool(actual)
+            if intento:
+                raise
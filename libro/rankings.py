@@ -0,0 +1,215 @@
+"""
+Rankings de libros mantenidos de forma incremental.
+
+La tendencia es una suma de eventos con decaimiento exponencial. Para no tener
+que decaer todas las filas con el paso del tiempo se guarda en escala logarítmica
+respecto a una época fija: log(Σ peso·e^((t - época)/τ)). Cada evento nuevo se
+suma con logaddexp en un UPDATE atómico y el orden entre libros es el mismo que
+el de la puntuación decaída a cualquier instante.
+
+El mejor valorado usa el promedio bayesiano (C·m + Σ calificaciones) / (C + n)
+con la media previa m y el peso C configurados en settings.
+"""
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Sum, Value, When
+from django.db.models.functions import Abs, Cast, Exp, Greatest, Ln
+from django.utils import timezone
+
+from acciones_usuario.models import Acciones_usuario
+from biblioteca_original.vuelo_unico import invalidar
+from .models import EstadisticaLibro, Libro
+
+
+EPOCA = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+LIBROS_POR_UPDATE = 100
+
+
+@dataclass
+class EventoRanking:
+    libro_id: int
+    peso_tendencia: float = 0.0
+    delta_suma: int = 0
+    delta_num: int = 0
+
+
+def tau() -> float:
+    return settings.RANKING_VIDA_MEDIA_HORAS * 3600 / math.log(2)
+
+
+def log_peso(peso: float, momento: datetime) -> float:
+    return math.log(peso) + (momento - EPOCA).total_seconds() / tau()
+
+
+def tendencia_actual(valor_log: float, momento: datetime = None) -> float:
+    """Convierte la puntuación logarítmica en el peso decaído a día de hoy"""
+    momento = momento or timezone.now()
+    return math.exp(valor_log - (momento - EPOCA).total_seconds() / tau())
+
+
+def bayesiana(suma: int, num: int) -> float:
+    peso = settings.RANKING_PESO_PREVIO
+    return (peso * settings.RANKING_MEDIA_PREVIA + suma) / (peso + num)
+
+
+def eventos_por_cambio(libro_id, antes, despues):
+    """
+    Traduce el cambio de una acción de usuario en un evento de ranking.
+    antes y despues son tuplas (es_favorito, calificacion, ultima_pagina_leida_id);
+    antes es None para acciones nuevas y despues es None para acciones borradas.
+    """
+    fav_antes, cal_antes, pag_antes = antes or (False, 0, None)
+    fav_despues, cal_despues, pag_despues = despues or (False, 0, None)
+
+    evento = EventoRanking(libro_id)
+    if fav_despues and not fav_antes:
+        evento.peso_tendencia += settings.RANKING_PESO_FAVORITO
+    if pag_despues and pag_despues != pag_antes:
+        evento.peso_tendencia += settings.RANKING_PESO_PROGRESO
+    if cal_antes != cal_despues:
+        if cal_antes and cal_antes > 0:
+            evento.delta_suma -= cal_antes
+            evento.delta_num -= 1
+        if cal_despues and cal_despues > 0:
+            evento.delta_suma += cal_despues
+            evento.delta_num += 1
+    if evento.peso_tendencia or evento.delta_num or evento.delta_suma:
+        return evento
+    return None
+
+
+def registrar_eventos(eventos, momento: datetime = None):
+    """Aplica los eventos agrupados por libro, con un UPDATE atómico por cada bloque de libros"""
+    momento = momento or timezone.now()
+    agrupados = defaultdict(lambda: EventoRanking(0))
+    for evento in eventos:
+        if evento is None:
+            continue
+        acumulado = agrupados[evento.libro_id]
+        acumulado.libro_id = evento.libro_id
+        acumulado.peso_tendencia += evento.peso_tendencia
+        acumulado.delta_suma += evento.delta_suma
+        acumulado.delta_num += evento.delta_num
+
+    pendientes = list(agrupados.values())
+    for inicio in range(0, len(pendientes), LIBROS_POR_UPDATE):
+        _aplicar_lote(pendientes[inicio:inicio + LIBROS_POR_UPDATE], momento)
+
+    # Las calificaciones cambian la calificación promedio de los libros servidos por vuelo_unico
+    calificados = [f"libro:{evento.libro_id}" for evento in pendientes if evento.delta_num or evento.delta_suma]
+    if calificados:
+        invalidar("libros", *calificados)
+
+
+def _aplicar_lote(eventos, momento):
+    """Un único UPDATE ... CASE libro_id WHEN ... para todo el lote de libros"""
+    tendencias, sumas, nums = [], [], []
+    for evento in eventos:
+        if evento.peso_tendencia > 0:
+            x = Value(log_peso(evento.peso_tendencia, momento))
+            # logaddexp(a, x) = max(a, x) + ln(1 + e^-|a - x|), estable numéricamente
+            tendencias.append(When(libro_id=evento.libro_id, then=Greatest(F("tendencia"), x) + Ln(
+                Value(1.0) + Exp(-Abs(F("tendencia") - x))
+            )))
+        if evento.delta_num or evento.delta_suma:
+            sumas.append(When(libro_id=evento.libro_id, then=F("suma_calificaciones") + evento.delta_suma))
+            nums.append(When(libro_id=evento.libro_id, then=F("num_calificaciones") + evento.delta_num))
+
+    cambios = {}
+    if tendencias:
+        cambios["tendencia"] = Case(*tendencias, default=F("tendencia"), output_field=FloatField())
+    if sumas:
+        suma = Case(*sumas, default=F("suma_calificaciones"), output_field=IntegerField())
+        num = Case(*nums, default=F("num_calificaciones"), output_field=IntegerField())
+        peso_previo = settings.RANKING_PESO_PREVIO
+        cambios["suma_calificaciones"] = suma
+        cambios["num_calificaciones"] = num
+        cambios["bayesiana"] = (
+            Value(peso_previo * settings.RANKING_MEDIA_PREVIA) + Cast(suma, FloatField())
+        ) / (Value(peso_previo) + Cast(num, FloatField()))
+    if cambios:
+        EstadisticaLibro.objects.filter(libro_id__in=[e.libro_id for e in eventos]).update(**cambios)
+
+
+def sincronizar_libro(libro):
+    """Crea o actualiza (un solo upsert) la fila de estadísticas con los datos copiados del libro"""
+    EstadisticaLibro.objects.bulk_create(
+        [EstadisticaLibro(libro_id=libro.id, genero_id=libro.genero_id, es_publico=libro.es_publico)],
+        update_conflicts=True,
+        unique_fields=["libro"],
+        update_fields=["genero", "es_publico", "updated_at"],
+    )
+
+
+def compactar(horizonte_vidas_medias: int = 10, libro_ids=None) -> int:
+    """
+    Recalcula todas las estadísticas desde Acciones_usuario: corrige cualquier deriva
+    de los contadores incrementales y descarta eventos más antiguos que el horizonte.
+    Con libro_ids solo se recalculan esos libros. Devuelve el número de libros procesados.
+    """
+    acciones = Acciones_usuario.objects.all()
+    libros = Libro.objects.all()
+    if libro_ids is not None:
+        acciones = acciones.filter(libro_id__in=libro_ids)
+        libros = libros.filter(id__in=libro_ids)
+
+    ahora = timezone.now()
+    desde = ahora - timedelta(seconds=horizonte_vidas_medias * settings.RANKING_VIDA_MEDIA_HORAS * 3600)
+
+    tendencias = defaultdict(list)
+    eventos = (
+        acciones
+        .filter(updated_at__gte=desde)
+        .values_list("libro_id", "es_favorito", "ultima_pagina_leida_id", "updated_at")
+        .iterator(chunk_size=5000)
+    )
+    for libro_id, es_favorito, pagina_id, updated_at in eventos:
+        peso = (settings.RANKING_PESO_FAVORITO if es_favorito else 0) + (
+            settings.RANKING_PESO_PROGRESO if pagina_id else 0
+        )
+        if peso:
+            tendencias[libro_id].append(log_peso(peso, updated_at))
+
+    calificaciones = {
+        fila["libro_id"]: (fila["suma"], fila["num"])
+        for fila in acciones.filter(calificacion__gt=0)
+        .values("libro_id")
+        .annotate(suma=Sum("calificacion"), num=Count("id"))
+    }
+
+    filas = []
+    for libro_id, genero_id, es_publico in libros.values_list("id", "genero_id", "es_publico").iterator():
+        logs = tendencias.get(libro_id)
+        if logs:
+            maximo = max(logs)
+            tendencia = maximo + math.log(sum(math.exp(v - maximo) for v in logs))
+        else:
+            tendencia = 0.0
+        suma, num = calificaciones.get(libro_id, (0, 0))
+        filas.append(EstadisticaLibro(
+            libro_id=libro_id,
+            genero_id=genero_id,
+            es_publico=es_publico,
+            tendencia=tendencia,
+            suma_calificaciones=suma,
+            num_calificaciones=num,
+            bayesiana=bayesiana(suma, num) if num else 0.0,
+        ))
+
+    with transaction.atomic():
+        EstadisticaLibro.objects.bulk_create(
+            filas,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["libro"],
+            update_fields=[
+                "genero", "es_publico", "tendencia", "suma_calificaciones",
+                "num_calificaciones", "bayesiana", "updated_at",
+            ],
+        )
+    return len(filas)
@@ -0,0 +1,89 @@
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+
+from acciones_usuario.models import Acciones_usuario
+from .models import Libro, LibroSimilar
+
+
+def peso_interaccion(es_favorito: bool, calificacion: int) -> float:
+    """Peso de la interacción usuario-libro: favorito cuenta 1 y las calificaciones de 3 a 5 suman de 1/3 a 1"""
+    peso = 1.0 if es_favorito else 0.0
+    if calificacion and calificacion > 2:
+        peso += (calificacion - 2) / 3
+    return peso
+
+
+def construir_matriz(max_libros_por_usuario: int = 500):
+    """
+    Construye la matriz dispersa usuario×libro como diccionarios
+    {usuario_id: {libro_id: peso}} leyendo las acciones por bloques.
+    Solo se consideran libros públicos.
+    """
+    publicos = set(Libro.objects.filter(es_publico=True).values_list("id", flat=True))
+    filas = (
+        Acciones_usuario.objects
+        .filter(Q(es_favorito=True) | Q(calificacion__gt=2))
+        .values_list("usuario_id", "libro_id", "es_favorito", "calificacion")
+        .iterator(chunk_size=5000)
+    )
+    matriz = defaultdict(dict)
+    for usuario_id, libro_id, es_favorito, calificacion in filas:
+        if libro_id in publicos:
+            matriz[usuario_id][libro_id] = peso_interaccion(es_favorito, calificacion)
+
+    # Los usuarios con miles de interacciones generan pares cuadráticos y aportan poca señal
+    for usuario_id, libros in matriz.items():
+        if len(libros) > max_libros_por_usuario:
+            matriz[usuario_id] = dict(heapq.nlargest(max_libros_por_usuario, libros.items(), key=lambda x: x[1]))
+    return matriz
+
+
+def calcular_similares(matriz, top_k: int = 20, min_comun: int = 1):
+    """
+    Similitud coseno ítem-ítem con poda top-K.
+    Recorre cada fila de usuario una sola vez acumulando productos punto por pares
+    de libros, así que el coste depende de las interacciones y no de libros².
+    """
+    normas = defaultdict(float)
+    for libros in matriz.values():
+        for libro_id, peso in libros.items():
+            normas[libro_id] += peso * peso
+    normas = {libro_id: math.sqrt(total) for libro_id, total in normas.items()}
+
+    productos = defaultdict(lambda: defaultdict(float))
+    comunes = defaultdict(lambda: defaultdict(int))
+    for libros in matriz.values():
+        items = sorted(libros.items())
+        for i, (libro_a, peso_a) in enumerate(items):
+            for libro_b, peso_b in items[i + 1:]:
+                productos[libro_a][libro_b] += peso_a * peso_b
+                comunes[libro_a][libro_b] += 1
+
+    vecinos = defaultdict(list)
+    for libro_a, fila in productos.items():
+        for libro_b, producto in fila.items():
+            if comunes[libro_a][libro_b] < min_comun:
+                continue
+            similitud = producto / (normas[libro_a] * normas[libro_b])
+            vecinos[libro_a].append((similitud, libro_b))
+            vecinos[libro_b].append((similitud, libro_a))
+
+    return {libro_id: heapq.nlargest(top_k, candidatos) for libro_id, candidatos in vecinos.items()}
+
+
+def recalcular_similares(top_k: int = 20, min_comun: int = 1) -> int:
+    """Recalcula y reemplaza la tabla LibroSimilar; devuelve el número de filas guardadas"""
+    similares = calcular_similares(construir_matriz(), top_k=top_k, min_comun=min_comun)
+    filas = [
+        LibroSimilar(libro_id=libro_id, similar_id=similar_id, puntuacion=round(similitud, 6))
+        for libro_id, candidatos in similares.items()
+        for similitud, similar_id in candidatos
+    ]
+    with transaction.atomic():
+        LibroSimilar.objects.all().delete()
+        LibroSimilar.objects.bulk_create(filas, batch_size=1000)
+    return len(filas)
@@ -1,20 +1,35 @@
+import hashlib
 from typing import List, Optional
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse, FileResponse
-from django.db.models import Avg, Q
+from django.http import Http404, HttpResponse, FileResponse
+from django.db import connection
+from django.db.models import Avg, Count, Exists, F, Max, OuterRef, Q, Subquery
 from ninja import Router, File, Form
 from ninja.files import UploadedFile
 from functools import wraps
-import io
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 
-from .models import Libro
+from .models import EstadisticaLibro, Libro, LibroSimilar
 from pagina.models import Pagina
 from usuario.models import Usuario
-from usuario.auth import token_auth
-from .schemas import LibroIn, LibroOut
+from genero_libro.models import Genero_libro
+from usuario.auth import token_auth, token_auth_opcional
+from biblioteca_original.db_router import lectura_en_replica
+from biblioteca_original.renderizado import salida_confiable
+from biblioteca_original import vuelo_unico
+from .schemas import (
+    LibroIn, LibroListado, LibroLoteResultado, LibroOut, LibroRankingOut, LibroResumen, LibroSimilarOut,
+    LibroSugerenciaOut,
+)
+from .autocompletado import indice
+from .rankings import tendencia_actual
 from acciones_usuario.models import Acciones_usuario
+from acciones_usuario.progreso import progreso_al_dia
+from base.descargas import servir_archivo, servir_generado
+from base.lotes import ids_pedidos, resultados_en_orden
+from base.eliminacion import marcar_libro
+from .epub import generar_epub, huella_epub
+from .pdf import FORMATO as FORMATO_PDF, generar_pdf
+from .paquete import copiar_a_cache, huella, obtener_paquete, ruta_en_cache, ultimo_en_cache
 
 
 router = Router(tags=["libros"])
@@ -35,17 +50,117 @@ def obtener_numero_pagina_por_id(libro_id: int, pagina_id: int) -> Optional[int]
     if not pagina_id:
         return None
     
-    paginas = list(Pagina.objects.filter(libro_id=libro_id).order_by('id').values_list('id', flat=True))
-    
-    try:
-        # El número de página es 1-indexed
-        return paginas.index(pagina_id) + 1
-    except ValueError:
-        return None
+    # El número de página (1-indexed) es cuántas páginas del libro tienen id <= pagina_id;
+    # se cuenta en la base de datos recorriendo solo ese tramo del índice, y la página es
+    # del libro si es la mayor de ese tramo
+    resultado = Pagina.objects.filter(libro_id=libro_id, id__lte=pagina_id).aggregate(
+        posicion=Count('id'), ultima=Max('id'),
+    )
+    return resultado['posicion'] if resultado['ultima'] == pagina_id else None
+
+
+CAMPOS_LIBRO = tuple(LibroOut.model_fields)
+CAMPOS_RESUMEN = tuple(LibroResumen.model_fields)
+# Campos que salen de la acción del usuario sobre el libro
+CAMPOS_PROGRESO = frozenset({
+    "ultima_pagina_leida", "ultima_pagina_leida_id", "esta_terminado",
+    "total_paginas", "es_favorito", "pendiente_leer",
+})
+# Lo que no depende del usuario: es lo que se guarda en vuelo_unico
+CAMPOS_COMPARTIDOS = tuple(campo for campo in CAMPOS_LIBRO if campo not in CAMPOS_PROGRESO)
+# Nombres de vuelo_unico que invalidan las señales: "libros" cambia con cualquier libro
+# o calificación, "libro:{id}" con ese libro y "autores" con usuarios y géneros
+DEPENDENCIAS_LISTADO = ("libros", "autores")
+# Campos que solo dependen de la fila del libro (y de su género y autor ya cargados)
+VALORES_LIBRO = {
+    "id": lambda libro: libro.id,
+    "nombre": lambda libro: libro.nombre,
+    "version": lambda libro: libro.version,
+    "genero_id": lambda libro: libro.genero_id,
+    "genero": lambda libro: libro.genero.genero if libro.genero_id else None,
+    "color_portada": lambda libro: libro.color_portada,
+    "imagen_portada": lambda libro: libro.imagen_portada.url if libro.imagen_portada else None,
+    "es_publico": lambda libro: libro.es_publico,
+    "usuario_id": lambda libro: libro.usuario_id,
+    "autor": lambda libro: libro.usuario.nombre_completo,
+    "created_at": lambda libro: libro.created_at,
+    "updated_at": lambda libro: libro.updated_at,
+}
+
+
+def campos_pedidos(fields: Optional[str], resumen: bool):
+    """
+    Campos a devolver según ?fields= (lista separada por comas) o ?resumen=true, en el
+    orden del esquema y siempre con id. Devuelve (campos, None) o (None, respuesta 400).
+    """
+    if not fields:
+        return (CAMPOS_RESUMEN if resumen else CAMPOS_LIBRO), None
+    pedidos = {campo.strip() for campo in fields.split(",") if campo.strip()}
+    desconocidos = pedidos.difference(CAMPOS_LIBRO)
+    if desconocidos:
+        return None, HttpResponse(f"Campos desconocidos: {', '.join(sorted(desconocidos))}", status=400)
+    pedidos.add("id")
+    return tuple(campo for campo in CAMPOS_LIBRO if campo in pedidos), None
+
+
+def relaciones_para(campos, prefijo=""):
+    """select_related que necesitan los campos pedidos (género y autor)"""
+    return [prefijo + relacion for campo, relacion in (("genero", "genero"), ("autor", "usuario")) if campo in campos]
+
+
+def clave_campos(campos):
+    return "todos" if campos == CAMPOS_LIBRO else hashlib.sha1(",".join(campos).encode()).hexdigest()[:16]
+
+
+def libros_para(campos, queryset=None):
+    """Libros con solo los select_related que necesitan los campos pedidos"""
+    relaciones = relaciones_para(campos)
+    queryset = Libro.objects.all() if queryset is None else queryset
+    return queryset.select_related(*relaciones) if relaciones else queryset
+
+
+def esta_terminado(ultima_pagina_leida, total_paginas) -> bool:
+    return ultima_pagina_leida >= total_paginas if total_paginas > 0 and ultima_pagina_leida else False
+
+
+def libro_dict(libro, campos=CAMPOS_LIBRO, usuario_id=None, accion=None, calculados=None) -> dict:
+    """
+    Respuesta LibroOut (o los campos pedidos de ella) como dict plano, en el orden del
+    esquema. Los endpoints con @salida_confiable lo devuelven sin revalidar, así que toda
+    respuesta de libro sale de aquí. Solo se consulta lo que hace falta para los campos
+    pedidos: la acción del usuario (si no se pasa ya cargada), el número de páginas, la
+    posición de la última leída y la calificación promedio. calculados son campos ya
+    resueltos (por ejemplo, para todo un lote) que no se vuelven a consultar.
+    """
+    datos = dict(calculados or {})
+    pedidos = set(campos).difference(datos)
+    if pedidos & CAMPOS_PROGRESO:
+        if accion is None and usuario_id:
+            accion = Acciones_usuario.objects.filter(usuario_id=usuario_id, libro_id=libro.id).first()
+        progreso = dict.fromkeys(CAMPOS_PROGRESO)
+        if accion:
+            progreso.update(
+                ultima_pagina_leida_id=accion.ultima_pagina_leida_id,
+                es_favorito=accion.es_favorito,
+                pendiente_leer=accion.pendiente_leer,
+            )
+            if pedidos & {"ultima_pagina_leida", "esta_terminado"}:
+                progreso["ultima_pagina_leida"] = obtener_numero_pagina_por_id(libro.id, accion.ultima_pagina_leida_id) if accion.ultima_pagina_leida_id else None
+            if pedidos & {"total_paginas", "esta_terminado"}:
+                progreso["total_paginas"] = Pagina.objects.filter(libro_id=libro.id).count()
+            if "esta_terminado" in pedidos:
+                progreso["esta_terminado"] = esta_terminado(progreso["ultima_pagina_leida"], progreso["total_paginas"])
+        datos.update({campo: progreso[campo] for campo in pedidos & CAMPOS_PROGRESO})
+    if "calificacion_promedio" in pedidos:
+        datos["calificacion_promedio"] = calcular_calificacion_promedio(libro.id)
+    return {campo: datos[campo] if campo in datos else VALORES_LIBRO[campo](libro) for campo in campos}
 
 
 def require_ownership(func):
-    """Decorador para verificar que el usuario es propietario del libro"""
+    """
+    Decorador que carga el libro del usuario (con genero y usuario) en una sola consulta
+    que ya filtra por propietario, y lo deja en request.libro para que la vista no lo vuelva a leer
+    """
     @wraps(func)
     def wrapper(request, libro_id: int, *args, **kwargs):
         # request.auth contiene {'uid': ..., 'email': ...} del token
@@ -53,288 +168,324 @@ def require_ownership(func):
         if not usuario_id:
             return HttpResponse("No autenticado", status=401)
         
-        libro = get_object_or_404(Libro, id=libro_id)
-        if libro.usuario_id != usuario_id:
+        libro = Libro.objects.select_related("genero", "usuario").filter(id=libro_id, usuario_id=usuario_id).first()
+        if libro is None:
+            # Solo en el caso de error se distingue entre libro inexistente y ajeno
+            get_object_or_404(Libro.objects.only("id"), id=libro_id)
             return HttpResponse("No tienes permisos para realizar esta acción", status=403)
         
+        request.libro = libro
         return func(request, libro_id, *args, **kwargs)
     return wrapper
 
 
-@router.get("/", response=List[LibroOut])
-def list_libros(request):
+@router.get("/", response=List[LibroListado])
+@salida_confiable
+@lectura_en_replica
+@progreso_al_dia
+def list_libros(request, fields: Optional[str] = None, resumen: bool = False):
+    """
+    Todos los libros visibles. Con ?fields=id,nombre,... o ?resumen=true solo se
+    calculan y devuelven esos campos (resumen: los de LibroResumen).
+    """
+    campos, error = campos_pedidos(fields, resumen)
+    if error:
+        return error
+    
     # Obtener usuario_id del token si está autenticado
     usuario_id = None
     if hasattr(request, 'auth') and request.auth:
         usuario_id = request.auth.get('uid')
     
-    libros = (
-        Libro.objects.select_related("genero", "usuario")
-        .all()
-        .order_by("id")
+    if usuario_id and CAMPOS_PROGRESO.intersection(campos):
+        # El progreso es de cada usuario y no se guarda
+        return libros_visibles(campos, usuario_id)
+    # Sin progreso el listado solo depende de los campos y, por los libros privados, del usuario.
+    # Tras invalidarse se sigue sirviendo el anterior a los anónimos mientras se recalcula
+    return vuelo_unico.obtener(
+        f"libros:{usuario_id or 0}:{clave_campos(campos)}",
+        lambda: libros_visibles(campos, usuario_id),
+        dependencias=DEPENDENCIAS_LISTADO,
+        obsoleto=not usuario_id,
     )
+
+
+def libros_visibles(campos, usuario_id):
+    libros = libros_para(campos).order_by("id")
     
     # Filtrar libros según privacidad
     result = []
     for libro in libros:
         # Mostrar si es público O si el usuario es el autor
         if libro.es_publico or (usuario_id and libro.usuario_id == usuario_id):
-            # Obtener información de acciones de usuario si está autenticado
-            ultima_pagina_leida = None
-            ultima_pagina_leida_id = None
-            esta_terminado = None
-            total_paginas = None
-            
-            es_favorito = None
-            pendiente_leer = None
-            
-            if usuario_id:
-                accion = Acciones_usuario.objects.filter(usuario_id=usuario_id, libro_id=libro.id).first()
-                if accion:
-                    ultima_pagina_leida_id = accion.ultima_pagina_leida_id
-                    ultima_pagina_leida = obtener_numero_pagina_por_id(libro.id, accion.ultima_pagina_leida_id) if accion.ultima_pagina_leida_id else None
-                    total_paginas = Pagina.objects.filter(libro_id=libro.id).count()
-                    esta_terminado = ultima_pagina_leida >= total_paginas if total_paginas > 0 and ultima_pagina_leida else False
-                    es_favorito = accion.es_favorito
-                    pendiente_leer = accion.pendiente_leer
-            
-            # Calcular calificación promedio
-            calificacion_promedio = calcular_calificacion_promedio(libro.id)
-            
-            result.append(
-                LibroOut(
-                    id=libro.id,
-                    nombre=libro.nombre,
-                    version=libro.version,
-                    genero_id=libro.genero_id,
-                    genero=(libro.genero.genero if libro.genero_id else None),
-                    color_portada=libro.color_portada,
-                    imagen_portada=libro.imagen_portada.url if libro.imagen_portada else None,
-                    es_publico=libro.es_publico,
-                    usuario_id=libro.usuario_id,
-                    autor=libro.usuario.nombre_completo,
-                    created_at=libro.created_at,
-                    updated_at=libro.updated_at,
-                    ultima_pagina_leida=ultima_pagina_leida,
-                    ultima_pagina_leida_id=ultima_pagina_leida_id,
-                    esta_terminado=esta_terminado,
-                    total_paginas=total_paginas,
-                    es_favorito=es_favorito,
-                    pendiente_leer=pendiente_leer,
-                    calificacion_promedio=calificacion_promedio,
-                )
-            )
+            result.append(libro_dict(libro, campos, usuario_id))
     return result
 
 
-@router.get("/todos-autenticado", response=List[LibroOut], auth=token_auth)
-def list_libros_autenticado(request):
-    """Obtiene todos los libros públicos con las acciones del usuario autenticado"""
+@router.get("/todos-autenticado", response=List[LibroListado], auth=token_auth)
+@salida_confiable
+@lectura_en_replica
+@progreso_al_dia
+def list_libros_autenticado(request, fields: Optional[str] = None, resumen: bool = False):
+    """Obtiene todos los libros públicos con las acciones del usuario autenticado (admite ?fields= y ?resumen=)"""
+    campos, error = campos_pedidos(fields, resumen)
+    if error:
+        return error
     usuario_id = request.auth.get('uid')
     if not usuario_id:
         return HttpResponse("No autenticado", status=401)
     
-    libros = (
-        Libro.objects.select_related("genero", "usuario")
-        .filter(es_publico=True)
-        .order_by("id")
-    )
-    
-    result = []
-    for libro in libros:
-        # Obtener información de acciones de usuario
-        accion = Acciones_usuario.objects.filter(usuario_id=usuario_id, libro_id=libro.id).first()
-        ultima_pagina_leida = None
-        ultima_pagina_leida_id = None
-        esta_terminado = None
-        total_paginas = None
-        es_favorito = None
-        pendiente_leer = None
-        
-        if accion:
-            ultima_pagina_leida_id = accion.ultima_pagina_leida_id
-            ultima_pagina_leida = obtener_numero_pagina_por_id(libro.id, accion.ultima_pagina_leida_id) if accion.ultima_pagina_leida_id else None
-            total_paginas = Pagina.objects.filter(libro_id=libro.id).count()
-            esta_terminado = ultima_pagina_leida >= total_paginas if total_paginas > 0 and ultima_pagina_leida else False
-            es_favorito = accion.es_favorito
-            pendiente_leer = accion.pendiente_leer
-        
-        # Calcular calificación promedio
-        calificacion_promedio = calcular_calificacion_promedio(libro.id)
-        
-        result.append(
-            LibroOut(
-                id=libro.id,
-                nombre=libro.nombre,
-                version=libro.version,
-                genero_id=libro.genero_id,
-                genero=(libro.genero.genero if libro.genero_id else None),
-                color_portada=libro.color_portada,
-                imagen_portada=libro.imagen_portada.url if libro.imagen_portada else None,
-                es_publico=libro.es_publico,
-                usuario_id=libro.usuario_id,
-                autor=libro.usuario.nombre_completo,
-                created_at=libro.created_at,
-                updated_at=libro.updated_at,
-                ultima_pagina_leida=ultima_pagina_leida,
-                ultima_pagina_leida_id=ultima_pagina_leida_id,
-                esta_terminado=esta_terminado,
-                total_paginas=total_paginas,
-                es_favorito=es_favorito,
-                pendiente_leer=pendiente_leer,
-                calificacion_promedio=calificacion_promedio,
-            )
-        )
-    return result
+    libros = libros_para(campos, Libro.objects.filter(es_publico=True)).order_by("id")
+    return [libro_dict(libro, campos, usuario_id) for libro in libros]
 
 
-@router.get("/mis-libros", response=List[LibroOut], auth=token_auth)
-def mis_libros(request):
-    """Obtiene todos los libros del usuario autenticado (públicos y privados)"""
+@router.get("/mis-libros", response=List[LibroListado], auth=token_auth)
+@salida_confiable
+@lectura_en_replica
+@progreso_al_dia
+def mis_libros(request, fields: Optional[str] = None, resumen: bool = False):
+    """Obtiene todos los libros del usuario autenticado, públicos y privados (admite ?fields= y ?resumen=)"""
+    campos, error = campos_pedidos(fields, resumen)
+    if error:
+        return error
     usuario_id = request.auth.get('uid')
     if not usuario_id:
         return HttpResponse("No autenticado", status=401)
     
-    libros = (
-        Libro.objects.select_related("genero", "usuario")
-        .filter(usuario_id=usuario_id)
-        .order_by("-created_at")
+    libros = libros_para(campos, Libro.objects.filter(usuario_id=usuario_id)).order_by("-created_at")
+    return [libro_dict(libro, campos, usuario_id) for libro in libros]
+
+
+def ranking(orden: str, genero_id: Optional[int], limit: int, offset: int, **filtros):
+    """Página de un ranking leída directamente del índice (es_publico, [genero], -orden)"""
+    estadisticas = EstadisticaLibro.objects.select_related("libro__genero", "libro__usuario").filter(
+        es_publico=True, **filtros
     )
+    if genero_id is not None:
+        estadisticas = estadisticas.filter(genero_id=genero_id)
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    return estadisticas.order_by(f"-{orden}")[offset:offset + limit]
+
+
+def ranking_out(e, puntuacion: float) -> LibroRankingOut:
+    libro = e.libro
+    return LibroRankingOut(
+        id=libro.id,
+        nombre=libro.nombre,
+        genero_id=libro.genero_id,
+        genero=(libro.genero.genero if libro.genero_id else None),
+        color_portada=libro.color_portada,
+        imagen_portada=libro.imagen_portada.url if libro.imagen_portada else None,
+        autor=libro.usuario.nombre_completo,
+        puntuacion=puntuacion,
+        num_calificaciones=e.num_calificaciones,
+    )
+
+
+@router.get("/autocompletar", response=List[LibroSugerenciaOut])
+@lectura_en_replica
+def autocompletar_libros(request, q: str, limit: int = 10):
+    """
+    Sugerencias de libros públicos cuyo título o autor tenga una palabra que empiece
+    por q (sin distinguir acentos ni mayúsculas), ordenadas por tendencia.
+    Se responden desde el índice en memoria de libro/autocompletado.py; en PostgreSQL,
+    si faltan resultados, se completan con coincidencias en mitad de palabra (índice trigram).
+    """
+    limit = max(1, min(limit, 50))
+    sugerencias = [
+        LibroSugerenciaOut(id=libro_id, nombre=nombre, autor=indice.nombre_autor(usuario_id), coincide=coincide)
+        for libro_id, nombre, usuario_id, coincide in indice.buscar(q, limit)
+    ]
+    if len(sugerencias) < limit and len(q.strip()) >= 3 and connection.vendor == "postgresql":
+        vistos = [s.id for s in sugerencias]
+        extra = (
+            Libro.objects.filter(es_publico=True)
+            .filter(Q(nombre__icontains=q.strip()) | Q(usuario__nombre_completo__icontains=q.strip()))
+            .exclude(id__in=vistos)
+            .order_by(F("estadistica__tendencia").desc(nulls_last=True), "id")
+            .values_list("id", "nombre", "usuario__nombre_completo")[:limit - len(sugerencias)]
+        )
+        sugerencias += [
+            LibroSugerenciaOut(id=libro_id, nombre=nombre, autor=autor, coincide="infijo")
+            for libro_id, nombre, autor in extra
+        ]
+    return sugerencias
+
+
+@router.get("/ranking/tendencias", response=List[LibroRankingOut])
+@lectura_en_replica
+def ranking_tendencias(request, genero_id: Optional[int] = None, limit: int = 20, offset: int = 0):
+    """Libros populares ahora: favoritos y lectura recientes con decaimiento exponencial"""
+    return [
+        ranking_out(e, round(tendencia_actual(e.tendencia), 4))
+        for e in ranking("tendencia", genero_id, limit, offset)
+    ]
+
+
+@router.get("/ranking/mejor-valorados", response=List[LibroRankingOut])
+@lectura_en_replica
+def ranking_mejor_valorados(request, genero_id: Optional[int] = None, limit: int = 20, offset: int = 0):
+    """Libros mejor valorados según el promedio bayesiano de sus calificaciones"""
+    return [
+        ranking_out(e, round(e.bayesiana, 2))
+        for e in ranking("bayesiana", genero_id, limit, offset, num_calificaciones__gt=0)
+    ]
+
+
+@router.get("/batch", response=List[LibroLoteResultado], auth=token_auth_opcional)
+@salida_confiable
+@lectura_en_replica
+@progreso_al_dia
+def get_libros_batch(request, ids: str):
+    """
+    Varios libros en una petición (?ids=3,1,2), en el orden pedido. La privacidad se
+    filtra en SQL y acciones, páginas y calificaciones se leen con una consulta para
+    todo el lote; los no visibles o inexistentes llevan error="no_encontrado".
+    """
+    libro_ids, error = ids_pedidos(ids)
+    if error:
+        return error
+    usuario_id = request.auth.get('uid')
     
-    result = []
-    for libro in libros:
-        # Obtener información de acciones de usuario
-        accion = Acciones_usuario.objects.filter(usuario_id=usuario_id, libro_id=libro.id).first()
-        ultima_pagina_leida = None
-        ultima_pagina_leida_id = None
-        esta_terminado = None
-        total_paginas = None
-        
-        es_favorito = None
-        pendiente_leer = None
-        
-        if accion:
-            ultima_pagina_leida_id = accion.ultima_pagina_leida_id
-            ultima_pagina_leida = obtener_numero_pagina_por_id(libro.id, accion.ultima_pagina_leida_id) if accion.ultima_pagina_leida_id else None
-            total_paginas = Pagina.objects.filter(libro_id=libro.id).count()
-            esta_terminado = ultima_pagina_leida >= total_paginas if total_paginas > 0 and ultima_pagina_leida else False
-            es_favorito = accion.es_favorito
-            pendiente_leer = accion.pendiente_leer
-        
-        # Calcular calificación promedio
-        calificacion_promedio = calcular_calificacion_promedio(libro.id)
-        
-        result.append(
-            LibroOut(
-                id=libro.id,
-                nombre=libro.nombre,
-                version=libro.version,
-                genero_id=libro.genero_id,
-                genero=(libro.genero.genero if libro.genero_id else None),
-                color_portada=libro.color_portada,
-                imagen_portada=libro.imagen_portada.url if libro.imagen_portada else None,
-                es_publico=libro.es_publico,
-                usuario_id=libro.usuario_id,
-                autor=libro.usuario.nombre_completo,
-                created_at=libro.created_at,
-                updated_at=libro.updated_at,
-                ultima_pagina_leida=ultima_pagina_leida,
-                ultima_pagina_leida_id=ultima_pagina_leida_id,
-                esta_terminado=esta_terminado,
-                total_paginas=total_paginas,
-                es_favorito=es_favorito,
-                pendiente_leer=pendiente_leer,
-                calificacion_promedio=calificacion_promedio,
-            )
+    visibles = Q(es_publico=True) | Q(usuario_id=usuario_id) if usuario_id else Q(es_publico=True)
+    libros = libros_para(CAMPOS_LIBRO, Libro.objects.filter(visibles, id__in=set(libro_ids)))
+    calculados = calculados_en_lote([libro.id for libro in libros], usuario_id)
+    encontrados = {libro.id: libro_dict(libro, calculados=calculados[libro.id]) for libro in libros}
+    return resultados_en_orden(libro_ids, encontrados, "libro")
+
+
+def calculados_en_lote(libro_ids, usuario_id):
+    """Progreso del usuario y calificación promedio de varios libros: {libro_id: campos}"""
+    promedios = dict(
+        Acciones_usuario.objects.filter(libro_id__in=libro_ids, calificacion__gt=0)
+        .values("libro_id").annotate(promedio=Avg("calificacion")).values_list("libro_id", "promedio")
+    )
+    calculados = {
+        libro_id: {
+            **dict.fromkeys(CAMPOS_PROGRESO),
+            "calificacion_promedio": round(promedios[libro_id], 2) if libro_id in promedios else None,
+        }
+        for libro_id in libro_ids
+    }
+    if not usuario_id or not libro_ids:
+        return calculados
+    
+    # Posición de la última página leída como en obtener_numero_pagina_por_id, en la misma consulta
+    paginas_hasta = (
+        Pagina.objects.filter(libro_id=OuterRef("libro_id"), id__lte=OuterRef("ultima_pagina_leida_id"))
+        .order_by().values("libro_id").annotate(n=Count("id")).values("n")
+    )
+    acciones = list(
+        Acciones_usuario.objects.filter(usuario_id=usuario_id, libro_id__in=libro_ids)
+        .annotate(
+            posicion=Subquery(paginas_hasta),
+            existe=Exists(Pagina.objects.filter(id=OuterRef("ultima_pagina_leida_id"), libro_id=OuterRef("libro_id"))),
         )
-    return result
+    )
+    totales = dict(
+        Pagina.objects.filter(libro_id__in=[accion.libro_id for accion in acciones])
+        .values("libro_id").annotate(n=Count("id")).values_list("libro_id", "n")
+    ) if acciones else {}
+    for accion in acciones:
+        ultima_pagina_leida = accion.posicion if accion.ultima_pagina_leida_id and accion.existe else None
+        total_paginas = totales.get(accion.libro_id, 0)
+        calculados[accion.libro_id].update(
+            ultima_pagina_leida=ultima_pagina_leida,
+            ultima_pagina_leida_id=accion.ultima_pagina_leida_id,
+            esta_terminado=esta_terminado(ultima_pagina_leida, total_paginas),
+            total_paginas=total_paginas,
+            es_favorito=accion.es_favorito,
+            pendiente_leer=accion.pendiente_leer,
+        )
+    return calculados
 
 
 @router.get("/{libro_id}", response=LibroOut)
+@salida_confiable
+@lectura_en_replica
+@progreso_al_dia
 def get_libro(request, libro_id: int):
-    libro = get_object_or_404(Libro.objects.select_related("genero", "usuario"), id=libro_id)
-    
-    # Verificar privacidad: solo mostrar si es público O si el usuario es el autor
+    # La parte común a todos los usuarios sale de vuelo_unico; quien está autenticado no ve datos obsoletos
     usuario_id = None
     if hasattr(request, 'auth') and request.auth:
         usuario_id = request.auth.get('uid')
     
-    if not libro.es_publico:
-        if not usuario_id or libro.usuario_id != usuario_id:
-            return HttpResponse("Este libro es privado", status=403)
-    
-    # Obtener información de acciones de usuario si está autenticado
-    ultima_pagina_leida = None
-    ultima_pagina_leida_id = None
-    esta_terminado = None
-    total_paginas = None
-    
-    es_favorito = None
-    pendiente_leer = None
-    
-    if usuario_id:
-        accion = Acciones_usuario.objects.filter(usuario_id=usuario_id, libro_id=libro.id).first()
-        if accion:
-            ultima_pagina_leida_id = accion.ultima_pagina_leida_id
-            ultima_pagina_leida = obtener_numero_pagina_por_id(libro.id, accion.ultima_pagina_leida_id) if accion.ultima_pagina_leida_id else None
-            total_paginas = Pagina.objects.filter(libro_id=libro.id).count()
-            esta_terminado = ultima_pagina_leida >= total_paginas if total_paginas > 0 and ultima_pagina_leida else False
-            es_favorito = accion.es_favorito
-            pendiente_leer = accion.pendiente_leer
+    datos = vuelo_unico.obtener(
+        f"libro:{libro_id}", lambda: libro_compartido(libro_id),
+        dependencias=(f"libro:{libro_id}", "autores"), obsoleto=not usuario_id,
+    )
+    if not datos:
+        raise Http404
     
-    # Calcular calificación promedio
-    calificacion_promedio = calcular_calificacion_promedio(libro.id)
+    # Verificar privacidad: solo mostrar si es público O si el usuario es el autor
+    if not datos["es_publico"]:
+        if not usuario_id or datos["usuario_id"] != usuario_id:
+            return HttpResponse("Este libro es privado", status=403)
     
-    return LibroOut(
-        id=libro.id,
-        nombre=libro.nombre,
-        version=libro.version,
-        genero_id=libro.genero_id,
-        genero=(libro.genero.genero if libro.genero_id else None),
-        color_portada=libro.color_portada,
-        imagen_portada=libro.imagen_portada.url if libro.imagen_portada else None,
-        es_publico=libro.es_publico,
-        usuario_id=libro.usuario_id,
-        autor=libro.usuario.nombre_completo,
-        created_at=libro.created_at,
-        updated_at=libro.updated_at,
-        ultima_pagina_leida=ultima_pagina_leida,
-        ultima_pagina_leida_id=ultima_pagina_leida_id,
-        esta_terminado=esta_terminado,
-        total_paginas=total_paginas,
-        es_favorito=es_favorito,
-        pendiente_leer=pendiente_leer,
-        calificacion_promedio=calificacion_promedio,
-    )
+    # Las acciones del usuario solo se consultan si está autenticado
+    progreso = libro_dict(Libro(id=libro_id), tuple(CAMPOS_PROGRESO), usuario_id) if usuario_id else {}
+    return {campo: progreso[campo] if campo in progreso else datos.get(campo) for campo in CAMPOS_LIBRO}
+
+
+def libro_compartido(libro_id):
+    """Campos del libro que no dependen del usuario, o {} si no existe"""
+    libro = libros_para(CAMPOS_COMPARTIDOS).filter(id=libro_id).first()
+    return libro_dict(libro, CAMPOS_COMPARTIDOS) if libro else {}
+
+
 @router.get("/{libro_id}/paginas")
+@salida_confiable
+@lectura_en_replica
 def list_paginas_by_libro(request, libro_id: int):
     get_object_or_404(Libro, id=libro_id)
-    paginas = Pagina.objects.filter(libro_id=libro_id).order_by("id")
+    return list(
+        Pagina.objects.filter(libro_id=libro_id).order_by("id")
+        .values("id", "contenido", "tipo", "titulo", "libro_id", "created_at", "updated_at")
+    )
+
+
+@router.get("/{libro_id}/similares", response=List[LibroSimilarOut])
+@lectura_en_replica
+def list_libros_similares(request, libro_id: int, limit: int = 10):
+    """Libros que también gustaron a quienes marcaron este libro (precalculado con recalcular_similares)"""
+    similares = (
+        LibroSimilar.objects
+        .select_related("similar__genero", "similar__usuario")
+        .filter(libro_id=libro_id, libro__es_publico=True, similar__es_publico=True)
+        .order_by("-puntuacion")[:max(1, min(limit, 50))]
+    )
     return [
-        {
-            "id": p.id,
-            "contenido": p.contenido,
-            "tipo": p.tipo,
-            "titulo": p.titulo,
-            "libro_id": p.libro_id,
-            "created_at": p.created_at,
-            "updated_at": p.updated_at,
-        }
-        for p in paginas
+        LibroSimilarOut(
+            id=s.similar.id,
+            nombre=s.similar.nombre,
+            genero=(s.similar.genero.genero if s.similar.genero_id else None),
+            color_portada=s.similar.color_portada,
+            imagen_portada=s.similar.imagen_portada.url if s.similar.imagen_portada else None,
+            autor=s.similar.usuario.nombre_completo,
+            puntuacion=s.puntuacion,
+        )
+        for s in similares
     ]
 
 
-@router.get("/favoritos/list", response=List[LibroOut], auth=token_auth)
-def list_favoritos(request):
-    """Obtiene todos los libros favoritos del usuario"""
+@router.get("/favoritos/list", response=List[LibroListado], auth=token_auth)
+@salida_confiable
+@lectura_en_replica
+@progreso_al_dia
+def list_favoritos(request, fields: Optional[str] = None, resumen: bool = False):
+    """Obtiene todos los libros favoritos del usuario (admite ?fields= y ?resumen=)"""
+    campos, error = campos_pedidos(fields, resumen)
+    if error:
+        return error
     usuario_id = request.auth.get('uid')
     if not usuario_id:
         return HttpResponse("No autenticado", status=401)
     
     # Obtener acciones de usuario donde es_favorito=True
     acciones = (
-        Acciones_usuario.objects
-        .select_related("libro", "libro__genero", "libro__usuario")
+        Acciones_usuario.objects.de_libros_vigentes()
+        .select_related("libro", *relaciones_para(campos, "libro__"))
         .filter(usuario_id=usuario_id, es_favorito=True)
         .order_by("-updated_at")
     )
@@ -344,42 +495,64 @@ def list_favoritos(request):
         libro = accion.libro
         # Verificar que el libro es público o el usuario es el autor
         if libro.es_publico or libro.usuario_id == usuario_id:
-            total_paginas = Pagina.objects.filter(libro_id=libro.id).count()
-            ultima_pagina_leida_id = accion.ultima_pagina_leida_id
-            ultima_pagina_leida = obtener_numero_pagina_por_id(libro.id, accion.ultima_pagina_leida_id) if accion.ultima_pagina_leida_id else None
-            esta_terminado = ultima_pagina_leida >= total_paginas if total_paginas > 0 and ultima_pagina_leida else False
-            calificacion_promedio = calcular_calificacion_promedio(libro.id)
-            
-            result.append(
-                LibroOut(
-                    id=libro.id,
-                    nombre=libro.nombre,
-                    version=libro.version,
-                    genero_id=libro.genero_id,
-                    genero=(libro.genero.genero if libro.genero_id else None),
-                    color_portada=libro.color_portada,
-                    imagen_portada=libro.imagen_portada.url if libro.imagen_portada else None,
-                    es_publico=libro.es_publico,
-                    usuario_id=libro.usuario_id,
-                    autor=libro.usuario.nombre_completo,
-                    created_at=libro.created_at,
-                    updated_at=libro.updated_at,
-                    ultima_pagina_leida=ultima_pagina_leida,
-                    ultima_pagina_leida_id=ultima_pagina_leida_id,
-                    esta_terminado=esta_terminado,
-                    total_paginas=total_paginas,
-                    es_favorito=accion.es_favorito,
-                    pendiente_leer=accion.pendiente_leer,
-                    calificacion_promedio=calificacion_promedio,
-                )
-            )
+            result.append(libro_dict(libro, campos, usuario_id, accion))
     return result
 
 
+@router.get("/{libro_id}/bundle")
+@lectura_en_replica
+def download_libro_bundle(request, libro_id: int):
+    """
+    Descarga el libro completo para leer sin conexión: un zip con libro.json,
+    paginas.jsonl y la miniatura de la portada. Admite Range e If-None-Match.
+    """
+    libro = get_object_or_404(Libro.objects.select_related("genero", "usuario"), id=libro_id)
+
+    usuario_id = None
+    if hasattr(request, 'auth') and request.auth:
+        usuario_id = request.auth.get('uid')
+
+    if not libro.es_publico and (not usuario_id or libro.usuario_id != usuario_id):
+        return HttpResponse("No tienes permisos para descargar este libro", status=403)
+
+    ruta, huella = obtener_paquete(libro)
+    return servir_archivo(
+        request, ruta, "application/zip", f"{libro.nombre}.zip", huella, privado=not libro.es_publico,
+    )
+
+
+@router.get("/{libro_id}/download_epub")
+@lectura_en_replica
+def download_libro_epub(request, libro_id: int):
+    """
+    Descarga el libro como EPUB 3, con cada página como un documento XHTML.
+    La primera descarga se envía mientras se genera y queda guardada para las siguientes.
+    """
+    libro = get_object_or_404(Libro.objects.select_related("genero", "usuario"), id=libro_id)
+
+    usuario_id = None
+    if hasattr(request, 'auth') and request.auth:
+        usuario_id = request.auth.get('uid')
+
+    if not libro.es_publico and (not usuario_id or libro.usuario_id != usuario_id):
+        return HttpResponse("No tienes permisos para descargar este libro", status=403)
+
+    huella, _ = huella_epub(libro)
+    ruta = ruta_en_cache(libro.id, huella, "epub")
+    nombre = f"{libro.nombre}.epub"
+    if ruta.exists():
+        return servir_archivo(request, ruta, "application/epub+zip", nombre, huella, privado=not libro.es_publico)
+    return servir_generado(
+        request, copiar_a_cache(generar_epub(libro, huella), ruta), "application/epub+zip", nombre, huella,
+        privado=not libro.es_publico,
+    )
+
+
 @router.get("/{libro_id}/download_pdf")
+@lectura_en_replica
 def download_libro_pdf(request, libro_id: int):
     """Descarga el libro como PDF, con cada página del libro como una página separada en el PDF"""
-    libro = get_object_or_404(Libro.objects.select_related("usuario"), id=libro_id)
+    libro = get_object_or_404(Libro.objects.select_related("genero", "usuario"), id=libro_id)
     
     # Verificar permisos: solo mostrar si es público o si el usuario es el autor
     usuario_id = None
@@ -389,51 +562,35 @@ def download_libro_pdf(request, libro_id: int):
     if not libro.es_publico and (not usuario_id or libro.usuario_id != usuario_id):
         return HttpResponse("No tienes permisos para descargar este libro", status=403)
     
-    # Obtener páginas del libro
-    paginas = Pagina.objects.filter(libro_id=libro_id).order_by('id')
-    
-    # Generar PDF
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    y = 750  # Posición inicial en la página
-    
-    # Título del libro en la primera página
-    p.drawString(100, y, f"Libro: {libro.nombre}")
-    y -= 30
-    p.drawString(100, y, f"Autor: {libro.usuario.nombre_completo}")
-    y -= 30
-    
-    for pagina in paginas:
-        # Agregar espacio antes de la nueva página del libro
-        if y < 100:  # Si queda poco espacio, pasar a nueva página del PDF
-            p.showPage()
-            y = 750
-        
-        # Título de la página
-        if pagina.titulo:
-            p.drawString(100, y, f"Página: {pagina.titulo}")
-            y -= 20
-        
-        # Contenido de la página
-        lines = pagina.contenido.split('\n')
-        for line in lines:
-            if y < 50:  # Nueva página del PDF si no hay espacio
-                p.showPage()
-                y = 750
-            p.drawString(100, y, line)
-            y -= 15
-        
-        # Finalizar la página del PDF después de cada página del libro
-        p.showPage()
-        y = 750  # Reiniciar posición para la siguiente página del PDF
-    
-    p.save()
-    buffer.seek(0)
-    
-    # Crear respuesta HTTP con el PDF
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{libro.nombre}.pdf"'
-    return response
+    # Se guarda en disco por huella y se genera una sola vez aunque lo pidan muchos a la vez;
+    # mientras tanto, a los demás se les sirve el PDF anterior si lo hay
+    huella_pdf, total_paginas = huella(libro, formato=("pdf", FORMATO_PDF))
+    ruta = ruta_en_cache(libro.id, huella_pdf, "pdf")
+    servida = ruta
+    if not ruta.exists():
+        servida = vuelo_unico.unico(
+            f"pdf:{libro.id}:{huella_pdf}",
+            lambda: guardar_pdf(libro, total_paginas, ruta),
+            listo=lambda: ruta if ruta.exists() else None,
+            mientras=ultimo_en_cache(libro.id, "pdf"),
+        )
+    try:
+        return servir_archivo(
+            request, servida, "application/pdf", f"{libro.nombre}.pdf", servida.stem.split("-", 1)[1],
+            privado=not libro.es_publico,
+        )
+    except FileNotFoundError:
+        # El anterior se borra en cuanto el nuevo está completo
+        return servir_archivo(
+            request, ruta, "application/pdf", f"{libro.nombre}.pdf", huella_pdf, privado=not libro.es_publico,
+        )
+
+
+def guardar_pdf(libro, total_paginas, ruta):
+    # Los libros grandes se dibujan por tramos en paralelo (ver libro/pdf.py)
+    for _ in copiar_a_cache([generar_pdf(libro, total_paginas)], ruta):
+        pass
+    return ruta
 
 
 @router.post("/", response=LibroOut, auth=token_auth)
@@ -451,6 +608,18 @@ def create_libro(
     if not usuario_id:
         return HttpResponse("No autenticado", status=401)
     
+    # Autor y nombre del género en una sola lectura, antes del INSERT
+    autor, genero = (
+        Usuario.objects.filter(id=usuario_id)
+        .annotate(genero_nombre=Subquery(Genero_libro.objects.filter(id=genero_id).values("genero")[:1]))
+        .values_list("nombre_completo", "genero_nombre")
+        .first()
+    ) or (None, None)
+    if autor is None:
+        return HttpResponse("No autenticado", status=401)
+    if genero_id is not None and genero is None:
+        return HttpResponse("El género no existe", status=400)
+    
     libro = Libro.objects.create(
         nombre=nombre,
         version=version,
@@ -460,49 +629,22 @@ def create_libro(
         es_publico=es_publico,
         usuario_id=usuario_id,
     )
-    libro.refresh_from_db()
-    libro = Libro.objects.select_related("genero", "usuario").get(id=libro.id)
-    
-    # Obtener información de acciones de usuario
-    accion = Acciones_usuario.objects.filter(usuario_id=usuario_id, libro_id=libro.id).first()
-    ultima_pagina_leida = None
-    ultima_pagina_leida_id = None
-    esta_terminado = None
-    total_paginas = None
-    es_favorito = None
-    pendiente_leer = None
-    
-    if accion:
-        ultima_pagina_leida = accion.ultima_pagina_leida
-        ultima_pagina_leida_id = obtener_pagina_id_por_numero(libro.id, accion.ultima_pagina_leida)
-        total_paginas = Pagina.objects.filter(libro_id=libro.id).count()
-        esta_terminado = ultima_pagina_leida >= total_paginas if total_paginas > 0 else False
-        es_favorito = accion.es_favorito
-        pendiente_leer = accion.pendiente_leer
-    
-    # Calcular calificación promedio
-    calificacion_promedio = calcular_calificacion_promedio(libro.id)
     
+    # Un libro recién creado no tiene acciones, páginas ni calificaciones: la respuesta
+    # sale de los valores ya en memoria (el id llega con el propio INSERT)
     return LibroOut(
         id=libro.id,
         nombre=libro.nombre,
         version=libro.version,
         genero_id=libro.genero_id,
-        genero=(libro.genero.genero if libro.genero_id else None),
+        genero=genero,
         color_portada=libro.color_portada,
         imagen_portada=libro.imagen_portada.url if libro.imagen_portada else None,
         es_publico=libro.es_publico,
         usuario_id=libro.usuario_id,
-        autor=libro.usuario.nombre_completo,
+        autor=autor,
         created_at=libro.created_at,
         updated_at=libro.updated_at,
-        ultima_pagina_leida=ultima_pagina_leida,
-        ultima_pagina_leida_id=ultima_pagina_leida_id,
-        esta_terminado=esta_terminado,
-        total_paginas=total_paginas,
-        es_favorito=es_favorito,
-        pendiente_leer=pendiente_leer,
-        calificacion_promedio=calificacion_promedio,
     )
 
 
@@ -518,25 +660,37 @@ def update_libro(
     es_publico: Optional[bool] = Form(None),
     imagen_portada: Optional[UploadedFile] = File(None)
 ):
-    libro = get_object_or_404(Libro, id=libro_id)
-    if nombre is not None:
-        libro.nombre = nombre
-    if version is not None:
-        libro.version = version
-    if color_portada is not None:
-        libro.color_portada = color_portada
-    if genero_id is not None:
-        libro.genero_id = genero_id
-    if es_publico is not None:
-        libro.es_publico = es_publico
-    if imagen_portada:
-        libro.imagen_portada = imagen_portada
-    libro.save()
-    libro = Libro.objects.select_related("genero", "usuario").get(id=libro.id)
-    
-    # Obtener información de acciones de usuario
+    libro = request.libro
+    cambios = {
+        "nombre": nombre,
+        "version": version,
+        "color_portada": color_portada,
+        "genero_id": genero_id,
+        "es_publico": es_publico,
+        "imagen_portada": imagen_portada or None,
+    }
+    cambios = {campo: valor for campo, valor in cambios.items() if valor is not None}
+    for campo, valor in cambios.items():
+        setattr(libro, campo, valor)
+    # Solo se escriben las columnas que cambian (genero_id se guarda por su campo, genero)
+    libro.save(update_fields=[campo.removesuffix("_id") for campo in cambios] + ["updated_at"])
+    
+    # Acción del usuario, posición de su página y total de páginas en una sola consulta
     usuario_id = request.auth.get('uid')
-    accion = Acciones_usuario.objects.filter(usuario_id=usuario_id, libro_id=libro.id).first()
+    accion = (
+        Acciones_usuario.objects.filter(usuario_id=usuario_id, libro_id=libro.id)
+        .annotate(
+            total_paginas=Subquery(
+                Pagina.objects.filter(libro_id=OuterRef("libro_id")).values("libro_id").annotate(n=Count("id")).values("n")
+            ),
+            posicion=Subquery(
+                Pagina.objects.filter(libro_id=OuterRef("libro_id"), id__lte=OuterRef("ultima_pagina_leida_id"))
+                .values("libro_id").annotate(n=Count("id")).values("n")
+            ),
+            libro_de_pagina=F("ultima_pagina_leida__libro_id"),
+        )
+        .first()
+    )
     ultima_pagina_leida = None
     ultima_pagina_leida_id = None
     esta_terminado = None
@@ -545,10 +699,10 @@ def update_libro(
     pendiente_leer = None
     
     if accion:
-        ultima_pagina_leida = accion.ultima_pagina_leida
-        ultima_pagina_leida_id = obtener_pagina_id_por_numero(libro.id, accion.ultima_pagina_leida)
-        total_paginas = Pagina.objects.filter(libro_id=libro.id).count()
-        esta_terminado = ultima_pagina_leida >= total_paginas if total_paginas > 0 else False
+        ultima_pagina_leida_id = accion.ultima_pagina_leida_id
+        ultima_pagina_leida = accion.posicion if accion.libro_de_pagina == libro.id else None
+        total_paginas = accion.total_paginas or 0
+        esta_terminado = ultima_pagina_leida >= total_paginas if total_paginas > 0 and ultima_pagina_leida else False
         es_favorito = accion.es_favorito
         pendiente_leer = accion.pendiente_leer
     
@@ -581,8 +735,8 @@ def update_libro(
 @router.delete("/{libro_id}", auth=token_auth)
 @require_ownership
 def delete_libro(request, libro_id: int):
-    libro = get_object_or_404(Libro, id=libro_id)
-    libro.delete()
-    return {"success": True}
+    # El libro desaparece al instante; páginas y acciones se purgan en segundo plano
+    tarea = marcar_libro(request.libro, solicitada_por=request.auth.get('uid'))
+    return {"success": True, "tarea_id": tarea.id}
 
 
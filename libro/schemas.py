@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional, Union
 from ninja import Schema, File
 from ninja.files import UploadedFile
 
@@ -32,5 +32,53 @@ class LibroOut(Schema):
     es_favorito: Optional[bool] = None
     pendiente_leer: Optional[bool] = None
     calificacion_promedio: Optional[float] = None
-    
 
+
+class LibroLoteResultado(Schema):
+    id: int
+    ok: bool
+    error: Optional[str] = None
+    libro: Optional[LibroOut] = None
+
+
+class LibroResumen(Schema):
+    """Campos de LibroOut que devuelven los listados con ?resumen=true (vistas de cuadrícula)"""
+    id: int
+    nombre: str
+    autor: str
+    color_portada: str
+    imagen_portada: Optional[str]
+
+
+# Elemento de los listados de libros: LibroOut completo, LibroResumen con ?resumen=true o,
+# con ?fields=, un objeto con solo los campos de LibroOut pedidos
+LibroListado = Union[LibroOut, LibroResumen, Dict[str, Any]]
+
+
+class LibroSimilarOut(Schema):
+    id: int
+    nombre: str
+    genero: Optional[str]
+    color_portada: str
+    imagen_portada: Optional[str]
+    autor: str
+    puntuacion: float
+
+
+class LibroRankingOut(Schema):
+    id: int
+    nombre: str
+    genero_id: Optional[int]
+    genero: Optional[str]
+    color_portada: str
+    imagen_portada: Optional[str]
+    autor: str
+    puntuacion: float
+    num_calificaciones: int
+
+
+class LibroSugerenciaOut(Schema):
+    id: int
+    nombre: str
+    autor: Optional[str]
+    coincide: str
@@ -0,0 +1,48 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from biblioteca_original.vuelo_unico import invalidar
+from genero_libro.models import Genero_libro
+from usuario.models import Usuario
+from .autocompletado import indice
+from .models import Libro
+from .rankings import sincronizar_libro
+
+
+@receiver(post_save, sender=Libro)
+def sincronizar_estadisticas(sender, instance, update_fields=None, **kwargs):
+    # Las estadísticas solo copian genero y es_publico: otros cambios no las tocan
+    if update_fields is None or {"genero", "es_publico"} & set(update_fields):
+        sincronizar_libro(instance)
+
+
+@receiver(post_save, sender=Libro)
+def actualizar_autocompletado_libro(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {"nombre", "es_publico", "usuario"} & set(update_fields):
+        indice.actualizar_libro(instance)
+
+
+@receiver(post_delete, sender=Libro)
+def quitar_libro_de_autocompletado(sender, instance, **kwargs):
+    indice.quitar_libros([instance.id])
+
+
+@receiver(post_save, sender=Usuario)
+def actualizar_autocompletado_autor(sender, instance, **kwargs):
+    indice.actualizar_autor(instance)
+
+
+@receiver(post_save, sender=Libro)
+@receiver(post_delete, sender=Libro)
+def invalidar_libro_en_vuelo_unico(sender, instance, signal, **kwargs):
+    # Un libro que se oculta o se borra no puede seguir sirviéndose obsoleto
+    oculto = getattr(instance, "_es_publico_original", None) and not instance.es_publico
+    invalidar("libros", f"libro:{instance.id}", estricto=signal is post_delete or bool(oculto))
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_save, sender=Genero_libro)
+@receiver(post_delete, sender=Genero_libro)
+def invalidar_autores_en_vuelo_unico(sender, instance, **kwargs):
+    # El nombre del autor y el del género van en cada libro
+    invalidar("autores")
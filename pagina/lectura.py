@@ -0,0 +1,118 @@
+"""
+Caché de lectura de páginas (GET /pagina/{id}).
+
+Es la llamada más frecuente al leer. Cada página se guarda en la caché con los ids
+de su anterior y su siguiente en el libro, y cuando una página se lee de la base de
+datos la misma consulta trae las VECINAS que le siguen, que se guardan a la vez: el
+lector encuentra en caché la página a la que pasa.
+
+Cada entrada lleva la generación de su libro en el momento de leerla. Cualquier
+cambio en una página o en el libro (nombre, visibilidad, borrado) cambia la
+generación con invalidar_libro y deja obsoletas todas las entradas del libro, lo que
+cubre también los vecinos de una página nueva, movida o borrada.
+
+Las páginas que se guardan se leen siempre de la primaria, aunque la vista lea de la
+réplica: una réplica retrasada dejaría contenido viejo bajo la generación nueva. La
+generación lleva además el momento del cambio, y si cambió después de empezar la
+lectura el resultado se devuelve pero no se guarda.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from biblioteca_original.db_router import PRIMARIA
+from .models import Pagina
+
+
+VECINAS = 2
+
+
+def clave(pagina_id):
+    return f"pagina:{pagina_id}"
+
+
+def _clave_generacion(libro_id):
+    return f"pagina:generacion:{libro_id}"
+
+
+def _nueva_generacion():
+    return (uuid.uuid4().hex, time.time())
+
+
+def generacion(libro_id):
+    """Generación actual (token, momento) de las páginas del libro; si la caché la perdió se crea una nueva"""
+    actual = cache.get(_clave_generacion(libro_id))
+    if actual is None:
+        # Momento 0: recrearla no es un cambio; si a la vez hay uno real, su set() la sustituye
+        cache.add(_clave_generacion(libro_id), (uuid.uuid4().hex, 0), None)
+        actual = cache.get(_clave_generacion(libro_id))
+    return actual
+
+
+def invalidar_libro(*libro_ids):
+    """Deja obsoletas las páginas en caché de los libros, al confirmarse la transacción"""
+    def invalidar():
+        cache.set_many({_clave_generacion(libro_id): _nueva_generacion() for libro_id in libro_ids if libro_id}, None)
+    transaction.on_commit(invalidar)
+
+
+def pagina_dict(p, anterior_id=None, siguiente_id=None) -> dict:
+    """Respuesta PaginaOut como dict plano para @salida_confiable; p debe venir con select_related("libro")"""
+    return {
+        "id": p.id,
+        "contenido": p.contenido,
+        "tipo": p.tipo,
+        "titulo": p.titulo,
+        "libro_id": p.libro_id,
+        "libro_nombre": p.libro.nombre if p.libro_id else None,
+        "created_at": p.created_at,
+        "updated_at": p.updated_at,
+        "anterior_id": anterior_id,
+        "siguiente_id": siguiente_id,
+    }
+
+
+def vecinas():
+    """Subconsultas para annotate() con los ids de la página anterior y la siguiente del mismo libro"""
+    mismo_libro = Pagina.todos.filter(libro_id=OuterRef("libro_id"))
+    return {
+        "anterior_id": Subquery(mismo_libro.filter(id__lt=OuterRef("id")).order_by("-id").values("id")[:1]),
+        "siguiente_id": Subquery(mismo_libro.filter(id__gt=OuterRef("id")).order_by("id").values("id")[:1]),
+    }
+
+
+def obtener_pagina(pagina_id):
+    """PaginaOut como dict desde la caché o, si no está o es obsoleta, de la base de datos; None si no existe"""
+    entrada = cache.get(clave(pagina_id))
+    if entrada and entrada["generacion"] == cache.get(_clave_generacion(entrada["libro_id"])):
+        return entrada["datos"]
+
+    inicio = time.time()
+    # La página, las VECINAS siguientes y una más (solo para saber la siguiente de la última) en una consulta
+    filas = list(
+        Pagina.objects.using(PRIMARIA).de_libros_vigentes().select_related("libro")
+        .filter(libro_id=Subquery(Pagina.todos.filter(id=pagina_id).values("libro_id")[:1]), id__gte=pagina_id)
+        .annotate(anterior_id=vecinas()["anterior_id"])
+        .order_by("id")[:VECINAS + 2]
+    )
+    if not filas:
+        return None
+
+    actual = generacion(filas[0].libro_id)
+    guardar = actual[1] < inicio
+    entradas = {}
+    for i, p in enumerate(filas[:VECINAS + 1]):
+        siguiente_id = filas[i + 1].id if i + 1 < len(filas) else None
+        entradas[clave(p.id)] = {
+            "libro_id": p.libro_id,
+            "generacion": actual,
+            "datos": pagina_dict(p, p.anterior_id, siguiente_id),
+        }
+    if guardar:
+        cache.set_many(entradas, settings.PAGINA_CACHE_S)
+    # Si no, el libro cambió durante la lectura: la siguiente petición la vuelve a leer
+    return entradas[clave(pagina_id)]["datos"]
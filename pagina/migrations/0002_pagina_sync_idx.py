@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libro', '0009_libro_sync_idx'),
+        ('pagina', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pagina',
+            index=models.Index(fields=['updated_at', 'id'], name='pagina_sync_idx'),
+        ),
+    ]
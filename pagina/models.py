@@ -1,10 +1,26 @@
 from django.db import models
 from base.models import Base
 from libro.models import Libro
+
+
+class PaginaQuerySet(models.QuerySet):
+    def de_libros_vigentes(self):
+        """
+        Sin las páginas de libros eliminados que aún no se han purgado. Hace join con
+        libro, así que solo se usa donde se llega a la página sin pasar por su libro.
+        """
+        return self.filter(libro__eliminado_en__isnull=True)
+
+
 # Create your models here.
 class Pagina(Base):
     contenido=models.TextField()
     tipo=models.CharField(max_length=100)
     titulo=models.CharField(max_length=200, null=True)
     libro=models.ForeignKey(Libro, on_delete=models.CASCADE)
-    
\ No newline at end of file
+
+    objects = PaginaQuerySet.as_manager()
+    todos = models.Manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at', 'id'], name='pagina_sync_idx')]
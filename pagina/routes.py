@@ -1,20 +1,30 @@
 from typing import List
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.db.models import Q
+from django.http import Http404, HttpResponse
 from ninja import Router
 from functools import wraps
 
 from .models import Pagina
 from libro.models import Libro
-from usuario.auth import token_auth
-from .schemas import PaginaIn, PaginaOut
+from usuario.auth import token_auth, token_auth_opcional
+from biblioteca_original.db_router import lectura_en_replica
+from biblioteca_original.renderizado import salida_confiable
+from base.lotes import ids_pedidos, resultados_en_orden
+from sincronizacion.eventos import publicar, tema_libro
+from .lectura import invalidar_libro, obtener_pagina, pagina_dict, vecinas
+from .schemas import PaginaIn, PaginaLoteResultado, PaginaOut
 
 
 router = Router(tags=["paginas"])
 
 
 def require_book_ownership(func):
-    """Decorador para verificar que el usuario es propietario del libro de la página"""
+    """
+    Decorador para verificar que el usuario es propietario del libro de la página.
+    La comprobación va en la misma consulta que carga el objeto, que queda en
+    request.pagina (con su libro) o request.libro para que la vista lo reutilice
+    """
     @wraps(func)
     def wrapper(request, *args, **kwargs):
         # request.auth contiene {'uid': ..., 'email': ...} del token
@@ -28,51 +38,64 @@ def require_book_ownership(func):
         
         # Si tenemos pagina_id, verificar a través de la página
         if pagina_id:
-            pagina = get_object_or_404(Pagina.objects.select_related("libro"), id=pagina_id)
-            if pagina.libro.usuario_id != usuario_id:
+            pagina = (
+                Pagina.objects.de_libros_vigentes().select_related("libro")
+                .filter(id=pagina_id, libro__usuario_id=usuario_id).first()
+            )
+            if pagina is None:
+                # Solo en el caso de error se distingue entre página inexistente y ajena
+                get_object_or_404(Pagina.objects.de_libros_vigentes().only("id"), id=pagina_id)
                 return HttpResponse("No tienes permisos para gestionar páginas de este libro", status=403)
+            request.pagina = pagina
         
         # Si tenemos libro_id, verificar directamente el libro
         elif libro_id:
-            libro = get_object_or_404(Libro, id=libro_id)
-            if libro.usuario_id != usuario_id:
+            libro = Libro.objects.filter(id=libro_id, usuario_id=usuario_id).first()
+            if libro is None:
+                get_object_or_404(Libro.objects.only("id"), id=libro_id)
                 return HttpResponse("No tienes permisos para gestionar páginas de este libro", status=403)
+            request.libro = libro
         
         return func(request, *args, **kwargs)
     return wrapper
 
 
 @router.get("/", response=List[PaginaOut])
+@salida_confiable
+@lectura_en_replica
 def list_paginas(request):
-    paginas = Pagina.objects.select_related("libro").all().order_by("id")
-    return [
-        PaginaOut(
-            id=p.id,
-            contenido=p.contenido,
-            tipo=p.tipo,
-            titulo=p.titulo,
-            libro_id=p.libro_id,
-            libro_nombre=(p.libro.nombre if p.libro_id else None),
-            created_at=p.created_at,
-            updated_at=p.updated_at,
-        )
-        for p in paginas
-    ]
+    paginas = Pagina.objects.de_libros_vigentes().select_related("libro").order_by("id")
+    return [pagina_dict(p) for p in paginas]
+
+
+@router.get("/batch", response=List[PaginaLoteResultado], auth=token_auth_opcional)
+@salida_confiable
+@lectura_en_replica
+def get_paginas_batch(request, ids: str):
+    """
+    Varias páginas en una consulta (?ids=3,1,2), en el orden pedido y con sus vecinas.
+    Solo las de libros públicos o del usuario; las demás llevan error="no_encontrado".
+    """
+    pagina_ids, error = ids_pedidos(ids)
+    if error:
+        return error
+    usuario_id = request.auth.get('uid')
+    
+    visibles = Q(libro__es_publico=True) | Q(libro__usuario_id=usuario_id) if usuario_id else Q(libro__es_publico=True)
+    paginas = Pagina.objects.de_libros_vigentes().select_related("libro").filter(visibles, id__in=set(pagina_ids)).annotate(**vecinas())
+    encontradas = {p.id: pagina_dict(p, p.anterior_id, p.siguiente_id) for p in paginas}
+    return resultados_en_orden(pagina_ids, encontradas, "pagina")
 
 
 @router.get("/{pagina_id}", response=PaginaOut)
+@salida_confiable
+@lectura_en_replica
 def get_pagina(request, pagina_id: int):
-    p = get_object_or_404(Pagina.objects.select_related("libro"), id=pagina_id)
-    return PaginaOut(
-        id=p.id,
-        contenido=p.contenido,
-        tipo=p.tipo,
-        titulo=p.titulo,
-        libro_id=p.libro_id,
-        libro_nombre=(p.libro.nombre if p.libro_id else None),
-        created_at=p.created_at,
-        updated_at=p.updated_at,
-    )
+    """Página con los ids de su anterior y su siguiente en el libro; se sirve desde la caché de lectura"""
+    datos = obtener_pagina(pagina_id)
+    if datos is None:
+        raise Http404
+    return datos
 
 
 @router.post("/", response=PaginaOut, auth=token_auth)
@@ -82,9 +105,10 @@ def create_pagina(request, payload: PaginaIn):
     if not usuario_id:
         return HttpResponse("No autenticado", status=401)
     
-    # Verificar que el usuario es propietario del libro
-    libro = get_object_or_404(Libro, id=payload.libro_id)
-    if libro.usuario_id != usuario_id:
+    # Verificar que el usuario es propietario del libro (y leer su nombre) en la misma consulta
+    libro_nombre = Libro.objects.filter(id=payload.libro_id, usuario_id=usuario_id).values_list("nombre", flat=True).first()
+    if libro_nombre is None:
+        get_object_or_404(Libro.objects.only("id"), id=payload.libro_id)
         return HttpResponse("No tienes permisos para agregar páginas a este libro", status=403)
     
     p = Pagina.objects.create(
@@ -93,14 +117,13 @@ def create_pagina(request, payload: PaginaIn):
         titulo=payload.titulo,
         libro_id=payload.libro_id,
     )
-    p = Pagina.objects.select_related("libro").get(id=p.id)
     return PaginaOut(
         id=p.id,
         contenido=p.contenido,
         tipo=p.tipo,
         titulo=p.titulo,
         libro_id=p.libro_id,
-        libro_nombre=(p.libro.nombre if p.libro_id else None),
+        libro_nombre=libro_nombre,
         created_at=p.created_at,
         updated_at=p.updated_at,
     )
@@ -109,13 +132,24 @@ def create_pagina(request, payload: PaginaIn):
 @router.put("/{pagina_id}", response=PaginaOut, auth=token_auth)
 @require_book_ownership
 def update_pagina(request, pagina_id: int, payload: PaginaIn):
-    p = get_object_or_404(Pagina, id=pagina_id)
+    p = request.pagina
+    origen_id = p.libro_id
+    if payload.libro_id != p.libro_id:
+        # Mover la página a otro libro exige ser también propietario del destino
+        destino = Libro.objects.filter(id=payload.libro_id, usuario_id=request.auth.get('uid')).first()
+        if destino is None:
+            get_object_or_404(Libro.objects.only("id"), id=payload.libro_id)
+            return HttpResponse("No tienes permisos para gestionar páginas de este libro", status=403)
+        # Las señales invalidan el libro destino; el de origen pierde una página
+        invalidar_libro(p.libro_id)
+        p.libro = destino
     p.contenido = payload.contenido
     p.tipo = payload.tipo
     p.titulo = payload.titulo
-    p.libro_id = payload.libro_id
-    p.save()
-    p = Pagina.objects.select_related("libro").get(id=p.id)
+    p.save(update_fields=["contenido", "tipo", "titulo", "libro", "updated_at"])
+    if p.libro_id != origen_id:
+        # La señal solo avisa al libro destino; quien sigue el de origen la ve salir
+        publicar(tema_libro(origen_id), "pagina_eliminada", {"id": p.id, "libro_id": origen_id})
     return PaginaOut(
         id=p.id,
         contenido=p.contenido,
@@ -131,7 +165,6 @@ def update_pagina(request, pagina_id: int, payload: PaginaIn):
 @router.delete("/{pagina_id}", auth=token_auth)
 @require_book_ownership
 def delete_pagina(request, pagina_id: int):
-    p = get_object_or_404(Pagina, id=pagina_id)
-    p.delete()
+    request.pagina.delete()
     return {"success": True}
 
@@ -19,4 +19,13 @@ class PaginaOut(Schema):
     libro_nombre: Optional[str]
     created_at: datetime
     updated_at: datetime
+    # Solo en GET /pagina/{id}: vecinas en el libro para pasar de página
+    anterior_id: Optional[int] = None
+    siguiente_id: Optional[int] = None
 
+
+class PaginaLoteResultado(Schema):
+    id: int
+    ok: bool
+    error: Optional[str] = None
+    pagina: Optional[PaginaOut] = None
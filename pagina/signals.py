@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from libro.models import Libro
+from .lectura import invalidar_libro
+from .models import Pagina
+
+
+@receiver(post_save, sender=Pagina)
+@receiver(post_delete, sender=Pagina)
+def invalidar_paginas_del_libro(sender, instance, **kwargs):
+    # También cambian la anterior y la siguiente de sus vecinas
+    invalidar_libro(instance.libro_id)
+
+
+@receiver(post_save, sender=Libro)
+@receiver(post_delete, sender=Libro)
+def invalidar_paginas_por_libro(sender, instance, **kwargs):
+    # libro_nombre va en cada página y un libro oculto o borrado deja de servirlas
+    invalidar_libro(instance.id)
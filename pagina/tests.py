@@ -1,3 +1,29 @@
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
 
-# Create your tests here.
+from .models import Pagina
+from genero_libro.models import Genero_libro
+from libro.models import Libro
+from usuario.models import Usuario
+
+
+class PaginasDeLibroEliminadoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        autor = Usuario.objects.create(nombre_completo="Autor", email="autor@example.com", contraseña="clave")
+        genero = Genero_libro.objects.create(genero="Novela")
+        self.libro = Libro.objects.create(
+            nombre="Libro", version=1, genero=genero, color_portada="azul", usuario=autor, es_publico=True,
+        )
+        self.pagina = Pagina.objects.create(libro=self.libro, tipo="texto", titulo="1", contenido="a")
+
+    def test_desaparecen_al_marcar_el_libro(self):
+        self.assertEqual(self.client.get(f"/pagina/{self.pagina.id}").status_code, 200)
+        Libro.todos.filter(id=self.libro.id).update(eliminado_en=timezone.now())
+        cache.clear()
+
+        self.assertEqual(self.client.get(f"/pagina/{self.pagina.id}").status_code, 404)
+        lote = self.client.get("/pagina/batch", {"ids": str(self.pagina.id)}).json()
+        self.assertEqual(lote[0]["error"], "no_encontrado")
+        self.assertFalse(Pagina.objects.de_libros_vigentes().filter(id=self.pagina.id).exists())
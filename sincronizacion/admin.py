@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import Eliminacion
+
+
+@admin.register(Eliminacion)
+class EliminacionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'modelo', 'objeto_id', 'usuario_id', 'es_publico', 'created_at')
+    list_filter = ('modelo', 'created_at')
+    ordering = ('-id',)
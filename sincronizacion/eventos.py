@@ -0,0 +1,207 @@
+"""
+Central de eventos para GET /sync/eventos (Server-Sent Events).
+
+Los cambios de Acciones_usuario se publican en el tema del usuario ("usuario:{id}")
+y los de las páginas en el del libro ("libro:{id}"), al confirmarse la transacción.
+Los publican las señales de los modelos y upsert_acciones, que no dispara señales.
+
+Cada conexión es una Suscripcion con su cola asyncio en el bucle del servidor ASGI:
+mientras no hay eventos solo espera en la cola, sin hilos ni sondeos, así que miles
+de conexiones inactivas por worker no gastan CPU. El evento se serializa una vez al
+publicarlo, no una por suscriptor.
+
+EVENTOS_BACKEND elige cómo llegan los eventos a las suscripciones: "memoria" solo a
+las del mismo proceso; "redis" los publica en Redis y un hilo por proceso los
+reparte a las suyas, para despliegues con varios workers; o la ruta de una clase
+con la interfaz de Central. redis se importa solo si se usa; si no está instalado se
+usa "memoria" (con un aviso) en vez de fallar en cada publicación.
+"""
+import asyncio
+import importlib.util
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import orjson
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from biblioteca_original.renderizado import renderizar_json
+
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_ACCION = (
+    "id", "usuario_id", "libro_id", "es_favorito", "ultima_pagina_leida_id",
+    "pendiente_leer", "calificacion", "updated_at",
+)
+CAMPOS_PAGINA = ("id", "libro_id", "tipo", "titulo", "updated_at")
+_central = None
+_lock_central = threading.Lock()
+
+
+def tema_usuario(usuario_id):
+    return f"usuario:{usuario_id}"
+
+
+def tema_libro(libro_id):
+    return f"libro:{libro_id}"
+
+
+class Suscripcion:
+    """Cola de eventos de una conexión; se crea dentro del bucle asyncio que la lee"""
+
+    def __init__(self, temas):
+        self.temas = frozenset(temas)
+        self.bucle = asyncio.get_running_loop()
+        self.cola = asyncio.Queue(maxsize=settings.EVENTOS_COLA_MAX)
+
+    def _poner(self, evento):
+        if self.cola.full():
+            # Cliente que no lee: se descartan sus pendientes y se le pide resincronizar con /sync
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            evento = {"tema": None, "tipo": "desbordado", "datos": "{}"}
+        self.cola.put_nowait(evento)
+
+    def entregar(self, evento):
+        """Encola el evento desde cualquier hilo"""
+        try:
+            self.bucle.call_soon_threadsafe(self._poner, evento)
+        except RuntimeError:
+            pass  # El bucle ya se cerró: la conexión terminó
+
+    async def siguiente(self, espera):
+        """Siguiente evento; asyncio.TimeoutError si no llega ninguno en espera segundos"""
+        return await asyncio.wait_for(self.cola.get(), espera)
+
+
+class Central:
+    """Reparte los eventos entre las suscripciones de este proceso"""
+
+    def __init__(self):
+        self._temas = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def suscribir(self, temas):
+        suscripcion = Suscripcion(temas)
+        with self._lock:
+            for tema in suscripcion.temas:
+                self._temas[tema].add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion, temas=None):
+        """Quita la suscripción de esos temas, o de todos los suyos"""
+        temas = suscripcion.temas if temas is None else suscripcion.temas & frozenset(temas)
+        with self._lock:
+            suscripcion.temas -= temas
+            for tema in temas:
+                suscritas = self._temas.get(tema)
+                if suscritas is not None:
+                    suscritas.discard(suscripcion)
+                    if not suscritas:
+                        del self._temas[tema]
+
+    def repartir(self, tema, evento):
+        with self._lock:
+            suscritas = list(self._temas.get(tema, ()))
+        for suscripcion in suscritas:
+            suscripcion.entregar(evento)
+
+    def publicar(self, tema, evento):
+        self.repartir(tema, evento)
+
+
+class CentralRedis(Central):
+    """Publica en un canal de Redis; un hilo por proceso reparte lo recibido a las suscripciones locales"""
+    CANAL = "biblioteca:eventos"
+
+    def __init__(self, url=None):
+        super().__init__()
+        self._url = url or settings.EVENTOS_REDIS_URL
+        self._cliente = None
+        self._hilo = None
+
+    def _redis(self):
+        if self._cliente is None:
+            import redis
+
+            self._cliente = redis.Redis.from_url(self._url)
+        return self._cliente
+
+    def publicar(self, tema, evento):
+        self._redis().publish(self.CANAL, orjson.dumps(evento))
+
+    def suscribir(self, temas):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._escuchar, name="eventos-redis", daemon=True)
+                self._hilo.start()
+        return super().suscribir(temas)
+
+    def _escuchar(self):
+        while True:
+            try:
+                pubsub = self._redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CANAL)
+                for mensaje in pubsub.listen():
+                    evento = orjson.loads(mensaje["data"])
+                    self.repartir(evento["tema"], evento)
+            except Exception:
+                # Los eventos perdidos mientras tanto los recupera el cliente con /sync al reconectar
+                logger.exception("Conexión con Redis de eventos perdida; reintentando")
+                time.sleep(1)
+
+
+def central():
+    global _central
+    if _central is None:
+        with _lock_central:
+            if _central is None:
+                backend = settings.EVENTOS_BACKEND
+                if backend == "memoria":
+                    _central = Central()
+                elif backend == "redis" and importlib.util.find_spec("redis") is None:
+                    logger.warning("EVENTOS_BACKEND=redis pero redis no está instalado: eventos solo en este proceso")
+                    _central = Central()
+                elif backend == "redis":
+                    _central = CentralRedis()
+                else:
+                    _central = import_string(backend)()
+    return _central
+
+
+def publicar(tema, tipo, datos):
+    """Publica el evento al confirmarse la transacción en curso; un fallo no afecta a la escritura"""
+    evento = {"tema": tema, "tipo": tipo, "datos": renderizar_json(datos).decode()}
+
+    def enviar():
+        try:
+            central().publicar(tema, evento)
+        except Exception:
+            logger.exception("No se pudo publicar el evento %s en %s", tipo, tema)
+    transaction.on_commit(enviar)
+
+
+def publicar_accion(datos):
+    """datos: instancia o dict de Acciones_usuario con al menos CAMPOS_ACCION"""
+    if not isinstance(datos, dict):
+        datos = {campo: getattr(datos, campo) for campo in CAMPOS_ACCION}
+    publicar(tema_usuario(datos["usuario_id"]), "accion", {campo: datos[campo] for campo in CAMPOS_ACCION})
+
+
+def publicar_pagina(pagina):
+    # Sin contenido: el cliente la pide con GET /pagina/{id} (o /pagina/batch) si la necesita
+    publicar(tema_libro(pagina.libro_id), "pagina", {campo: getattr(pagina, campo) for campo in CAMPOS_PAGINA})
+
+
+def publicar_libros_eliminados(*libro_ids):
+    for libro_id in libro_ids:
+        publicar(tema_libro(libro_id), "libro_eliminado", {"id": libro_id})
+
+
+def formatear(evento) -> bytes:
+    """Evento en el formato de text/event-stream"""
+    return f"event: {evento['tipo']}\ndata: {evento['datos']}\n\n".encode()
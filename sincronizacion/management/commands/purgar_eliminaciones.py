@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from sincronizacion.models import Eliminacion
+
+
+class Command(BaseCommand):
+    help = "Borra las lápidas de /sync más antiguas que SYNC_RETENCION_DIAS"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=settings.SYNC_RETENCION_DIAS)
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=options["dias"])
+        borradas, _ = Eliminacion.objects.filter(updated_at__lt=limite).delete()
+        self.stdout.write(self.style.SUCCESS(f"✅ {borradas} lápidas purgadas"))
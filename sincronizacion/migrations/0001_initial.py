@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Eliminacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('modelo', models.CharField(choices=[('libro', 'Libro'), ('pagina', 'Página'), ('accion', 'Acción de usuario')], max_length=10)),
+                ('objeto_id', models.BigIntegerField()),
+                ('usuario_id', models.BigIntegerField(null=True)),
+                ('es_publico', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['updated_at', 'id'], name='eliminacion_cursor_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sincronizacion', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eliminacion',
+            name='modelo',
+            field=models.CharField(choices=[('libro', 'Libro'), ('pagina', 'Página'), ('accion', 'Acción de usuario'), ('oculto', 'Libro ocultado')], max_length=10),
+        ),
+    ]
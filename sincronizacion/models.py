@@ -0,0 +1,25 @@
+from django.db import models
+from base.models import Base
+
+
+class Eliminacion(Base):
+    """
+    Lápida de un Libro, Pagina o Acciones_usuario borrado, para que /sync pueda
+    informar de los borrados. usuario_id y es_publico guardan la visibilidad que
+    tenía el objeto, porque después del borrado ya no se puede consultar.
+    OCULTO es un libro público que su dueño hizo privado: deja de existir para los
+    demás usuarios, no para él.
+    """
+    LIBRO = 'libro'
+    PAGINA = 'pagina'
+    ACCION = 'accion'
+    OCULTO = 'oculto'
+    MODELOS = [(LIBRO, 'Libro'), (PAGINA, 'Página'), (ACCION, 'Acción de usuario'), (OCULTO, 'Libro ocultado')]
+
+    modelo=models.CharField(max_length=10, choices=MODELOS)
+    objeto_id=models.BigIntegerField()
+    usuario_id=models.BigIntegerField(null=True)
+    es_publico=models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at', 'id'], name='eliminacion_cursor_idx')]
@@ -0,0 +1,237 @@
+"""
+Sincronización incremental: GET /sync?since=<cursor> devuelve solo lo que cambió.
+
+Cada flujo (libros, páginas, acciones y lápidas) se recorre por (updated_at, id)
+con su propio índice, así que una sincronización sin cambios son cuatro lecturas
+de índice vacías. El cursor va firmado y ligado al usuario; para no saltarse filas
+de transacciones que aún no han confirmado solo se devuelve lo anterior a
+ahora - SYNC_MARGEN_SEGUNDOS.
+
+GET /sync/eventos avisa de los cambios al momento (Server-Sent Events) para no tener
+que sondear; los eventos que se pierdan mientras el cliente está desconectado los
+recupera con /sync al reconectar.
+"""
+import asyncio
+from datetime import timedelta
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from ninja import Router
+
+from acciones_usuario.models import Acciones_usuario
+from acciones_usuario.progreso import progreso_al_dia
+from libro.models import Libro
+from pagina.models import Pagina
+from base.lotes import ids_pedidos
+from usuario.auth import token_auth
+from .eventos import central, formatear, tema_libro, tema_usuario
+from .models import Eliminacion
+from .schemas import SyncOut
+
+
+router = Router(tags=["sincronizacion"])
+
+SAL_CURSOR = 'sincronizacion.cursor'
+FLUJOS = ('libros', 'paginas', 'acciones', 'eliminados')
+# Milisegundos que espera EventSource antes de reconectar
+RECONEXION_MS = 3000
+
+
+def leer_cursor(since, usuario_id):
+    """Devuelve {flujo: (updated_at, id)} o None si el cursor no es válido para este usuario"""
+    if not since:
+        return {}
+    try:
+        datos = signing.loads(since, salt=SAL_CURSOR)
+    except signing.BadSignature:
+        return None
+    if datos.get('u') != usuario_id:
+        return None
+    return {flujo: (parse_datetime(ts), pk) for flujo, (ts, pk) in datos['p'].items()}
+
+
+def crear_cursor(posiciones, usuario_id):
+    return signing.dumps(
+        {'u': usuario_id, 'p': {flujo: [ts.isoformat(), pk] for flujo, (ts, pk) in posiciones.items()}},
+        salt=SAL_CURSOR,
+        compress=True,
+    )
+
+
+def pagina_de_cambios(queryset, posicion, hasta, limit, campos):
+    """Siguiente bloque de filas por (updated_at, id) posteriores a posicion y no más nuevas que hasta"""
+    queryset = queryset.filter(updated_at__lte=hasta)
+    if posicion:
+        ts, pk = posicion
+        queryset = queryset.filter(Q(updated_at__gt=ts) | Q(updated_at=ts, id__gt=pk))
+    filas = list(queryset.order_by('updated_at', 'id').values(*campos)[:limit + 1])
+    return filas[:limit], len(filas) > limit
+
+
+# Sin lectura_en_replica: el retraso de la réplica puede superar SYNC_MARGEN_SEGUNDOS
+# y el cursor dejaría atrás filas que aún no habían llegado a ella
+@router.get("/", response=SyncOut, auth=token_auth)
+@progreso_al_dia
+def sync(request, since: str = None, limit: int = None):
+    """
+    Cambios visibles para el usuario desde el cursor since (sin since: todo, paginado).
+    Se repite con el cursor devuelto mientras hay_mas sea true.
+    Un libro que deja de ser visible aparece en eliminados.libros; sus páginas y
+    acciones se dan por eliminadas con él.
+    """
+    usuario_id = request.auth.get('uid')
+    if not usuario_id:
+        return HttpResponse("No autenticado", status=401)
+
+    posiciones = leer_cursor(since, usuario_id)
+    if posiciones is None:
+        return HttpResponse("Cursor inválido", status=400)
+    limite_retencion = timezone.now() - timedelta(days=settings.SYNC_RETENCION_DIAS)
+    if posiciones and posiciones['eliminados'][0] < limite_retencion:
+        # Las lápidas anteriores ya se purgaron: hay que volver a sincronizar desde cero
+        return HttpResponse("Cursor caducado, sincroniza sin since", status=410)
+
+    limit = max(1, min(limit or settings.SYNC_LIMITE, settings.SYNC_LIMITE_MAX))
+    hasta = timezone.now() - timedelta(seconds=settings.SYNC_MARGEN_SEGUNDOS)
+    visibles = Q(es_publico=True) | Q(usuario_id=usuario_id)
+
+    libros, mas_libros = pagina_de_cambios(
+        Libro.objects.filter(visibles), posiciones.get('libros'), hasta, limit,
+        ('id', 'nombre', 'version', 'genero_id', 'color_portada', 'imagen_portada',
+         'es_publico', 'usuario_id', 'created_at', 'updated_at'),
+    )
+    paginas, mas_paginas = pagina_de_cambios(
+        Pagina.objects.de_libros_vigentes()
+        .filter(Q(libro__es_publico=True) | Q(libro__usuario_id=usuario_id)),
+        posiciones.get('paginas'), hasta, limit,
+        ('id', 'contenido', 'tipo', 'titulo', 'libro_id', 'created_at', 'updated_at'),
+    )
+    acciones, mas_acciones = pagina_de_cambios(
+        Acciones_usuario.objects.de_libros_vigentes().filter(usuario_id=usuario_id),
+        posiciones.get('acciones'), hasta, limit,
+        ('id', 'libro_id', 'es_favorito', 'ultima_pagina_leida_id', 'pendiente_leer',
+         'calificacion', 'created_at', 'updated_at'),
+    )
+    lapidas, mas_lapidas = pagina_de_cambios(
+        Eliminacion.objects.filter(
+            Q(modelo=Eliminacion.ACCION, usuario_id=usuario_id)
+            | (Q(modelo=Eliminacion.OCULTO) & ~Q(usuario_id=usuario_id))
+            | (Q(modelo__in=(Eliminacion.LIBRO, Eliminacion.PAGINA)) & visibles)
+        ),
+        posiciones.get('eliminados'), hasta, limit,
+        ('id', 'modelo', 'objeto_id', 'updated_at'),
+    )
+
+    nuevas = dict(posiciones)
+    for flujo, filas in zip(FLUJOS, (libros, paginas, acciones, lapidas)):
+        if filas:
+            nuevas[flujo] = (filas[-1]['updated_at'], filas[-1]['id'])
+        elif flujo not in nuevas:
+            # Flujo vacío en la primera sincronización: se empieza a contar desde aquí
+            nuevas[flujo] = (hasta, 0)
+
+    eliminados = {'libros': [], 'paginas': [], 'acciones': []}
+    por_modelo = {
+        Eliminacion.LIBRO: 'libros', Eliminacion.OCULTO: 'libros',
+        Eliminacion.PAGINA: 'paginas', Eliminacion.ACCION: 'acciones',
+    }
+    for lapida in lapidas:
+        eliminados[por_modelo[lapida['modelo']]].append(lapida['objeto_id'])
+
+    for libro in libros:
+        if libro['imagen_portada']:
+            libro['imagen_portada'] = settings.MEDIA_URL + libro['imagen_portada']
+
+    return {
+        'cursor': crear_cursor(nuevas, usuario_id),
+        'hay_mas': mas_libros or mas_paginas or mas_acciones or mas_lapidas,
+        'libros': libros,
+        'paginas': paginas,
+        'acciones': acciones,
+        'eliminados': eliminados,
+    }
+
+
+def usuario_del_evento(request, token):
+    """uid del token de Authorization o de ?token= (EventSource no puede enviar cabeceras)"""
+    payload = token_auth.authenticate(request, token) if token else token_auth(request)
+    return payload.get('uid') if payload else None
+
+
+def temas_del_usuario(usuario_id, libro_ids):
+    """
+    Temas del usuario y de los libros que puede ver: los pedidos o, si no pide
+    ninguno, los suyos y aquellos en que tiene acciones. También devuelve los ids de
+    los libros de otros usuarios, que dejan de ser visibles si se ocultan.
+    """
+    libros = Libro.objects.filter(Q(es_publico=True) | Q(usuario_id=usuario_id))
+    if libro_ids is None:
+        libros = libros.filter(
+            Q(usuario_id=usuario_id)
+            | Q(id__in=Acciones_usuario.objects.filter(usuario_id=usuario_id).values('libro_id'))
+        )
+    else:
+        libros = libros.filter(id__in=libro_ids)
+    filas = list(libros.order_by('-updated_at').values_list('id', 'usuario_id')[:settings.EVENTOS_MAX_LIBROS])
+    temas = [tema_usuario(usuario_id)] + [tema_libro(libro_id) for libro_id, _ in filas]
+    return temas, {libro_id for libro_id, dueno_id in filas if dueno_id != usuario_id}
+
+
+async def flujo_de_eventos(temas, ajenos):
+    """Cuerpo text/event-stream: los eventos de los temas y un latido cuando no hay ninguno"""
+    hub = central()
+    suscripcion = hub.suscribir(temas)
+    try:
+        yield f"retry: {RECONEXION_MS}\n\n".encode()
+        while True:
+            try:
+                evento = await suscripcion.siguiente(settings.EVENTOS_LATIDO_S)
+            except asyncio.TimeoutError:
+                yield b": latido\n\n"
+                continue
+            if evento['tema'] is not None and evento['tema'] not in suscripcion.temas:
+                continue  # Encolado antes de dejar de seguir su libro
+            if evento['tipo'] in ('libro_eliminado', 'libro_oculto'):
+                libro_id = orjson.loads(evento['datos'])['id']
+                if evento['tipo'] == 'libro_oculto' and libro_id not in ajenos:
+                    continue  # Su dueño lo sigue viendo
+                hub.cancelar(suscripcion, [tema_libro(libro_id)])
+            yield formatear(evento)
+    finally:
+        # También al desconectarse el cliente: el servidor cancela el generador
+        hub.cancelar(suscripcion)
+
+
+@router.get("/eventos", auth=None)
+async def eventos(request, token: str = None, libros: str = None):
+    """
+    Flujo Server-Sent Events con los cambios del usuario al momento: eventos accion y
+    accion_eliminada de sus Acciones_usuario, y pagina, pagina_eliminada,
+    libro_oculto y libro_eliminado de los libros seguidos (?libros=1,2 o, por
+    defecto, los suyos y aquellos en que tiene acciones). desbordado indica que se
+    perdieron eventos: sincronizar con /sync. Requiere un servidor ASGI.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Con WSGI el flujo ocuparía un hilo por conexión y Django lo acumularía sin enviarlo
+        return HttpResponse("Requiere un servidor ASGI", status=501)
+    usuario_id = usuario_del_evento(request, token)
+    if not usuario_id:
+        return HttpResponse("No autenticado", status=401)
+    libro_ids = None
+    if libros is not None:
+        libro_ids, error = ids_pedidos(libros)
+        if error:
+            return error
+
+    temas, ajenos = await sync_to_async(temas_del_usuario)(usuario_id, libro_ids)
+    respuesta = StreamingHttpResponse(flujo_de_eventos(temas, ajenos), content_type="text/event-stream")
+    respuesta["Cache-Control"] = "no-cache"
+    respuesta["X-Accel-Buffering"] = "no"  # Que nginx no acumule el flujo
+    return respuesta
@@ -0,0 +1,52 @@
+from datetime import datetime
+from typing import List, Optional
+from ninja import Schema
+
+
+class LibroSyncOut(Schema):
+    id: int
+    nombre: str
+    version: int
+    genero_id: Optional[int]
+    color_portada: str
+    imagen_portada: Optional[str]
+    es_publico: bool
+    usuario_id: int
+    created_at: datetime
+    updated_at: datetime
+
+
+class PaginaSyncOut(Schema):
+    id: int
+    contenido: str
+    tipo: str
+    titulo: Optional[str]
+    libro_id: int
+    created_at: datetime
+    updated_at: datetime
+
+
+class AccionSyncOut(Schema):
+    id: int
+    libro_id: int
+    es_favorito: bool
+    ultima_pagina_leida_id: Optional[int]
+    pendiente_leer: bool
+    calificacion: int
+    created_at: datetime
+    updated_at: datetime
+
+
+class EliminadosOut(Schema):
+    libros: List[int] = []
+    paginas: List[int] = []
+    acciones: List[int] = []
+
+
+class SyncOut(Schema):
+    cursor: str
+    hay_mas: bool
+    libros: List[LibroSyncOut]
+    paginas: List[PaginaSyncOut]
+    acciones: List[AccionSyncOut]
+    eliminados: EliminadosOut
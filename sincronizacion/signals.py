@@ -0,0 +1,101 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from acciones_usuario.models import Acciones_usuario
+from libro.models import Libro
+from pagina.models import Pagina
+from usuario.models import Usuario
+from .eventos import publicar, publicar_accion, publicar_pagina, tema_libro, tema_usuario
+from .models import Eliminacion
+
+
+def _borrado_en_cascada(origin, modelos):
+    """True si el borrado viene de un libro o usuario: su lápida ya implica la de sus dependientes"""
+    modelo = getattr(origin, 'model', type(origin))
+    return modelo in modelos
+
+
+@receiver(post_delete, sender=Libro)
+def registrar_libro_eliminado(sender, instance, **kwargs):
+    Eliminacion.objects.create(
+        modelo=Eliminacion.LIBRO, objeto_id=instance.id,
+        usuario_id=instance.usuario_id, es_publico=instance.es_publico,
+    )
+
+
+@receiver(post_delete, sender=Pagina)
+def registrar_pagina_eliminada(sender, instance, origin=None, **kwargs):
+    if _borrado_en_cascada(origin, (Libro, Usuario)):
+        return
+    if Pagina.libro.is_cached(instance):
+        libro = {'usuario_id': instance.libro.usuario_id, 'es_publico': instance.libro.es_publico}
+    else:
+        libro = Libro.objects.filter(id=instance.libro_id).values('usuario_id', 'es_publico').first()
+    Eliminacion.objects.create(
+        modelo=Eliminacion.PAGINA, objeto_id=instance.id,
+        usuario_id=libro['usuario_id'] if libro else None,
+        es_publico=libro['es_publico'] if libro else False,
+    )
+
+
+@receiver(post_delete, sender=Acciones_usuario)
+def registrar_accion_eliminada(sender, instance, origin=None, **kwargs):
+    if _borrado_en_cascada(origin, (Libro, Usuario)):
+        return
+    Eliminacion.objects.create(modelo=Eliminacion.ACCION, objeto_id=instance.id, usuario_id=instance.usuario_id)
+
+
+@receiver(post_save, sender=Acciones_usuario)
+def publicar_accion_guardada(sender, instance, **kwargs):
+    publicar_accion(instance)
+
+
+@receiver(post_delete, sender=Acciones_usuario)
+def publicar_accion_eliminada(sender, instance, origin=None, **kwargs):
+    if _borrado_en_cascada(origin, (Libro, Usuario)):
+        return
+    publicar(tema_usuario(instance.usuario_id), "accion_eliminada", {"id": instance.id, "libro_id": instance.libro_id})
+
+
+@receiver(post_save, sender=Pagina)
+def publicar_pagina_guardada(sender, instance, **kwargs):
+    publicar_pagina(instance)
+
+
+@receiver(post_delete, sender=Pagina)
+def publicar_pagina_eliminada(sender, instance, origin=None, **kwargs):
+    if _borrado_en_cascada(origin, (Libro, Usuario)):
+        return
+    publicar(tema_libro(instance.libro_id), "pagina_eliminada", {"id": instance.id, "libro_id": instance.libro_id})
+
+
+@receiver(post_save, sender=Libro)
+def publicar_libro_oculto(sender, instance, created, **kwargs):
+    # Va antes de tocar_paginas_si_cambia_visibilidad, que actualiza _es_publico_original
+    if not created and getattr(instance, '_es_publico_original', None) and not instance.es_publico:
+        publicar(tema_libro(instance.id), "libro_oculto", {"id": instance.id})
+
+
+@receiver(post_save, sender=Libro)
+def registrar_cambio_de_visibilidad(sender, instance, created, **kwargs):
+    # Lápida para quienes dejan de verlo; si vuelve a ser público se quita y /sync lo devuelve entre los libros
+    anterior = getattr(instance, '_es_publico_original', None)
+    if created or anterior is None or anterior == instance.es_publico:
+        return
+    if instance.es_publico:
+        Eliminacion.objects.filter(modelo=Eliminacion.OCULTO, objeto_id=instance.id).delete()
+    else:
+        Eliminacion.objects.create(
+            modelo=Eliminacion.OCULTO, objeto_id=instance.id,
+            usuario_id=instance.usuario_id, es_publico=True,
+        )
+
+
+@receiver(post_save, sender=Libro)
+def tocar_paginas_si_cambia_visibilidad(sender, instance, created, **kwargs):
+    # Al hacerse visible (u oculto) un libro sus páginas vuelven a entrar en /sync para quien ahora puede verlas
+    anterior = getattr(instance, '_es_publico_original', None)
+    if not created and anterior is not None and anterior != instance.es_publico:
+        Pagina.objects.filter(libro_id=instance.id).update(updated_at=timezone.now())
+    instance._es_publico_original = instance.es_publico
@@ -0,0 +1,86 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import signing
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import Eliminacion
+from .routes import FLUJOS, crear_cursor, leer_cursor
+from genero_libro.models import Genero_libro
+from libro.models import Libro
+from usuario.models import Usuario
+
+
+class SyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lector = Usuario.objects.create(nombre_completo="Lector", email="lector@example.com", contraseña="clave")
+        cls.autor = Usuario.objects.create(nombre_completo="Autor", email="autor@example.com", contraseña="clave")
+        genero = Genero_libro.objects.create(genero="Novela")
+        datos = {"version": 1, "genero": genero, "color_portada": "azul", "usuario": cls.autor}
+        cls.publicos = [Libro.objects.create(nombre=f"Público {i}", es_publico=True, **datos) for i in range(3)]
+        cls.privado = Libro.objects.create(nombre="Privado", es_publico=False, **datos)
+
+    def sync(self, usuario=None, **parametros):
+        usuario = usuario or self.lector
+        token = signing.dumps({"uid": usuario.id, "email": usuario.email}, salt="usuario.auth")
+        # Sin margen: las filas recién creadas ya entran en la respuesta
+        with self.settings(SYNC_MARGEN_SEGUNDOS=0):
+            return self.client.get("/sync/", parametros, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_cursor_firmado_y_ligado_al_usuario(self):
+        ahora = timezone.now()
+        cursor = crear_cursor({flujo: (ahora, 7) for flujo in FLUJOS}, self.lector.id)
+        self.assertEqual(leer_cursor(cursor, self.lector.id), {flujo: (ahora, 7) for flujo in FLUJOS})
+        self.assertIsNone(leer_cursor(cursor, self.autor.id))
+        self.assertIsNone(leer_cursor(cursor[:-2] + "xx", self.lector.id))
+
+        self.assertEqual(self.sync(since=cursor[:-2] + "xx").status_code, 400)
+        self.assertEqual(self.sync(usuario=self.autor, since=cursor).status_code, 400)
+
+    def test_cursor_anterior_a_la_retencion_caduca(self):
+        antiguo = timezone.now() - timedelta(days=31)
+        cursor = crear_cursor({flujo: (antiguo, 0) for flujo in FLUJOS}, self.lector.id)
+        with self.settings(SYNC_RETENCION_DIAS=30):
+            self.assertEqual(self.sync(since=cursor).status_code, 410)
+
+    def test_paginado_con_limite_no_positivo(self):
+        respuesta = self.sync(limit=-5)
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(len(datos["libros"]), 1)
+        self.assertTrue(datos["hay_mas"])
+
+        vistos = [libro["id"] for libro in datos["libros"]]
+        while datos["hay_mas"]:
+            datos = self.sync(since=datos["cursor"], limit=1).json()
+            vistos += [libro["id"] for libro in datos["libros"]]
+        self.assertEqual(vistos, [libro.id for libro in self.publicos])
+
+    def test_libro_ocultado_solo_es_lapida_para_los_demas(self):
+        cursor_lector = self.sync().json()["cursor"]
+        cursor_autor = self.sync(usuario=self.autor).json()["cursor"]
+        oculto = self.publicos[0]
+        oculto.es_publico = False
+        # Un instante después del cursor, que ya no tiene margen
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(seconds=1)):
+            oculto.save()
+
+            datos = self.sync(since=cursor_lector).json()
+            self.assertEqual(datos["libros"], [])
+            self.assertEqual(datos["eliminados"]["libros"], [oculto.id])
+
+            datos = self.sync(usuario=self.autor, since=cursor_autor).json()
+            self.assertEqual([libro["id"] for libro in datos["libros"]], [oculto.id])
+            self.assertEqual(datos["eliminados"]["libros"], [])
+
+        oculto.es_publico = True
+        oculto.save()
+        self.assertFalse(Eliminacion.objects.filter(modelo=Eliminacion.OCULTO).exists())
+
+    def test_libro_privado_ajeno_no_aparece(self):
+        self.privado.save()
+        datos = self.sync().json()
+        self.assertNotIn(self.privado.id, [libro["id"] for libro in datos["libros"]])
+        self.assertNotIn(self.privado.id, datos["eliminados"]["libros"])
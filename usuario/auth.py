@@ -25,3 +25,12 @@ class TokenAuth(HttpBearer):
 
 # Instancia global para usar en las rutas
 token_auth = TokenAuth()
+
+
+def sin_token(request: HttpRequest):
+    """Sin token, o con uno inválido, la petición sigue como anónima"""
+    return {"uid": None}
+
+
+# Para endpoints públicos que muestran más datos al usuario autenticado
+token_auth_opcional = [token_auth, sin_token]
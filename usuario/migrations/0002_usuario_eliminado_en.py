@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuario', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='eliminado_en',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
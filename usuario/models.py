@@ -1,10 +1,18 @@
 from django.db import models
 from base.models import Base
 
+
+class UsuarioManager(models.Manager):
+    """Oculta los usuarios marcados como eliminados mientras se purgan en segundo plano"""
+    def get_queryset(self):
+        return super().get_queryset().filter(eliminado_en__isnull=True)
+
+
 class Usuario(Base):
     nombre_completo=models.CharField(max_length=300)
     email=models.EmailField(unique=True)
     contraseña=models.CharField(max_length=100)
-   
-
+    eliminado_en=models.DateTimeField(null=True, blank=True, editable=False)
 
+    objects = UsuarioManager()
+    todos = models.Manager()
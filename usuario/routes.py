@@ -1,10 +1,14 @@
 from typing import List
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse
 from django.contrib.auth.models import User
 from django.core import signing
 from ninja import Router
 
+from base.eliminacion import marcar_usuario
+from base.escritura import actualizar_devolviendo
+from biblioteca_original.vuelo_unico import invalidar
+from libro.autocompletado import indice
 from .models import Usuario
 from .schemas import UsuarioIn, UsuarioOut, UsuarioUpdate, LoginIn, LoginOut, SuperUsuarioIn, SuperUsuarioResponse
 from .auth import token_auth
@@ -32,7 +36,7 @@ def create_usuario(request, payload: UsuarioIn):
         email=payload.email,
         contraseña=payload.contraseña,
     )
-    usuario.refresh_from_db()
+    # create() ya trae el id (RETURNING) y las fechas se fijaron al guardar: no hace falta releer
     return UsuarioOut(
         id=usuario.id,
         nombre_completo=usuario.nombre_completo,
@@ -128,30 +132,28 @@ def crear_superusuario(request, payload: SuperUsuarioIn):
 
 @router.put("/{usuario_id}", response=UsuarioOut, auth=token_auth)
 def update_usuario(request, usuario_id: int, payload: UsuarioUpdate):
-    usuario = get_object_or_404(Usuario, id=usuario_id)
-    
-    # Solo actualizar los campos que se proporcionan
+    # Solo actualizar los campos que se proporcionan, en un UPDATE ... RETURNING
     update_data = payload.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(usuario, field, value)
+    campos = ("id", "nombre_completo", "email", "created_at", "updated_at")
+    # Como Usuario.objects, sin tocar a los usuarios marcados como eliminados
+    usuario = actualizar_devolviendo(Usuario, usuario_id, update_data, campos, eliminado_en=None)
+    if usuario is None:
+        raise Http404("No Usuario matches the given query.")
     
-    usuario.save()
-    usuario.refresh_from_db()
+    if "nombre_completo" in update_data:
+        # El UPDATE no dispara post_save: se avisa a mano a quienes muestran el nombre del autor
+        indice.actualizar_autor(Usuario(id=usuario["id"], nombre_completo=usuario["nombre_completo"]))
+        invalidar("autores")
     
-    return UsuarioOut(
-        id=usuario.id,
-        nombre_completo=usuario.nombre_completo,
-        email=usuario.email,
-        created_at=usuario.created_at,
-        updated_at=usuario.updated_at,
-    )
+    return UsuarioOut(**usuario)
 
 
 @router.delete("/{usuario_id}", auth=token_auth)
 def delete_usuario(request, usuario_id: int):
-    usuario = get_object_or_404(Usuario, id=usuario_id)
-    usuario.delete()
-    return {"success": True}
+    usuario = get_object_or_404(Usuario.objects.only("id"), id=usuario_id)
+    # El usuario y sus libros desaparecen al instante; el resto se purga en segundo plano
+    tarea = marcar_usuario(usuario.id, solicitada_por=request.auth.get('uid'))
+    return {"success": True, "tarea_id": tarea.id}
 
 
 
@@ -1,3 +1,29 @@
+from django.core import signing
 from django.test import TestCase
+from django.utils import timezone
 
-# Create your tests here.
+from .models import Usuario
+
+
+class ActualizarUsuarioTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create(nombre_completo="Ana", email="ana@example.com", contraseña="clave")
+        token = signing.dumps({"uid": self.usuario.id, "email": self.usuario.email}, salt="usuario.auth")
+        self.cabeceras = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+
+    def actualizar(self, datos):
+        return self.client.put(
+            f"/usuario/{self.usuario.id}", datos, content_type="application/json", **self.cabeceras,
+        )
+
+    def test_actualiza_y_devuelve_la_fila(self):
+        respuesta = self.actualizar({"nombre_completo": "Ana María"})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()["nombre_completo"], "Ana María")
+        self.assertEqual(Usuario.objects.get(id=self.usuario.id).nombre_completo, "Ana María")
+
+    def test_usuario_marcado_como_eliminado_responde_404(self):
+        Usuario.todos.filter(id=self.usuario.id).update(eliminado_en=timezone.now())
+        respuesta = self.actualizar({"nombre_completo": "Otra"})
+        self.assertEqual(respuesta.status_code, 404)
+        self.assertEqual(Usuario.todos.get(id=self.usuario.id).nombre_completo, "Ana")